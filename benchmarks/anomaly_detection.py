@@ -0,0 +1,75 @@
+"""
+Throughput and accuracy of digital_twin.anomaly on scaled-up coating telemetry from digital_twin.generation.
+
+    python -m benchmarks.anomaly_detection --stations 100 1000 --periods 200
+
+Each run generates `--periods` one-second periods (1,000 samples) of the three coating signals for
+every station, with `--faulty-fraction` of the stations developing the square-wave dryer fault
+halfway through. Timing covers scoring only (window metrics per generated chunk, fleet scores,
+ranking); generation is reported separately. A station counts as detected when its dryerFanSpeed
+has any anomalous window, and precision/recall compare the flagged stations with the faulty ones.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import print_table
+from digital_twin.anomaly import FleetAnomalyDetector
+from digital_twin.generation import COATING_SIGNALS, TelemetryGenerator
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--stations", type=int, nargs="+", default=[100, 1000])
+  parser.add_argument("--periods", type=int, default=200)
+  parser.add_argument("--faulty-fraction", type=float, default=0.01)
+  parser.add_argument("--threshold", type=float, default=FleetAnomalyDetector.threshold)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  detector = FleetAnomalyDetector(threshold=args.threshold)
+  results = []
+  for n_stations in args.stations:
+    stations = [f"CoatingStep-Line{i % 10 + 1}-Site{i // 10:05d}" for i in range(n_stations)]
+    rng = np.random.default_rng(args.seed)
+    faulty = set(rng.choice(stations, max(1, int(n_stations * args.faulty_fraction)), replace=False).tolist())
+    generator = TelemetryGenerator(
+      stations, faulty, n_periods=args.periods, signals=COATING_SIGNALS, fault_start_period=args.periods // 2, seed=args.seed,
+    )
+
+    generate_seconds = score_seconds = 0.0
+    metrics = []
+    for chunk in range(generator.n_chunks):
+      started = time.perf_counter()
+      first_sample, arrays = generator.chunk_arrays(chunk)
+      generate_seconds += time.perf_counter() - started
+      started = time.perf_counter()
+      metrics.append(detector.metrics(stations, arrays, first_sample))
+      score_seconds += time.perf_counter() - started
+    started = time.perf_counter()
+    scores = detector.scores(pd.concat(metrics, ignore_index=True))
+    suspects = detector.suspects(scores)
+    score_seconds += time.perf_counter() - started
+
+    fan = suspects[(suspects["signal"] == "dryerFanSpeed") & (suspects["anomalous_windows"] > 0)]
+    flagged = set(fan["station_id"])
+    top = set(suspects["station_id"].head(2 * len(faulty)))
+    samples = generator.n_rows * len(COATING_SIGNALS)
+    results.append({
+      "stations": n_stations, "faulty": len(faulty), "samples": samples, "windows": len(scores),
+      "generate s": generate_seconds, "detect s": score_seconds, "samples/s": samples / score_seconds,
+      "precision": len(flagged & faulty) / len(flagged) if flagged else float("nan"),
+      "recall": len(flagged & faulty) / len(faulty),
+      "faulty in top": len(top & faulty) / len(faulty),
+    })
+  print(f"{args.periods} periods per station, fault from period {args.periods // 2}, threshold {args.threshold:g}")
+  print_table(results, [
+    "stations", "faulty", "samples", "windows", "generate s", "detect s", "samples/s", "precision", "recall", "faulty in top",
+  ])
+
+
+if __name__ == "__main__":
+  main()
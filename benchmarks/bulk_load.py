@@ -0,0 +1,65 @@
+"""
+Bulk graph loading throughput: TwinGraph.json -> import NDJSON conversion, and the parallel upsert
+fallback against the local ADT emulator.
+
+    python -m benchmarks.bulk_load --sites 10 100 --latency-ms 2 --workers 1 16 64
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import print_table
+from digital_twin.bulk import RELATIONSHIPS, TWINS, bulk_upsert, read_import_file, twin_graph_sections, write_import_file
+from digital_twin.emulator import DigitalTwinsEmulator, FakeDigitalTwinsClient
+from digital_twin.resources import load_models
+from digital_twin.topology import PlantTopology, write_twin_graph
+from digital_twin.writer import ADT_API_REQUESTS_PER_SECOND
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--sites", type=int, nargs="+", default=[10, 100])
+  parser.add_argument("--lines-per-site", type=int, default=10)
+  parser.add_argument("--stations-per-step", type=int, default=1)
+  parser.add_argument("--latency-ms", type=float, default=2.0, help="simulated ADT latency per request")
+  parser.add_argument("--workers", type=int, nargs="+", default=[1, 16, 64])
+  parser.add_argument("--rate", type=float, default=ADT_API_REQUESTS_PER_SECOND, help="client-side request rate limit")
+  args = parser.parse_args()
+
+  models = load_models()
+  conversions, loads = [], []
+  with tempfile.TemporaryDirectory() as directory:
+    for sites in args.sites:
+      source = os.path.join(directory, f"graph-{sites}.json")
+      with open(source, "w") as f:
+        documents = sum(write_twin_graph(f, PlantTopology(sites, args.lines_per_site, args.stations_per_step), models))
+
+      started = time.perf_counter()
+      target = os.path.join(directory, f"graph-{sites}.ndjson")
+      with open(target, "w") as f:
+        write_import_file(f, twin_graph_sections(source, models))
+      elapsed = time.perf_counter() - started
+      conversions.append({
+        "twins+relationships": documents, "seconds": elapsed, "documents/s": documents / elapsed,
+        "json MB": os.path.getsize(source) / 1e6, "ndjson MB": os.path.getsize(target) / 1e6,
+      })
+
+      for workers in args.workers:
+        client = FakeDigitalTwinsClient(DigitalTwinsEmulator(latency=args.latency_ms / 1000))
+        with open(target) as f:
+          stats = bulk_upsert(client, read_import_file(f), max_workers=workers, rate_per_second=args.rate)
+        loads.append({
+          "twins+relationships": documents, "workers": workers, "twins/s": stats.per_second(TWINS),
+          "relationships/s": stats.per_second(RELATIONSHIPS), "failed": stats.failed,
+        })
+
+  print("NDJSON conversion (streamed)")
+  print_table(conversions, ["twins+relationships", "seconds", "documents/s", "json MB", "ndjson MB"])
+  print(f"\nParallel upsert fallback ({args.latency_ms} ms per request, at most {args.rate:,.0f} requests/s)")
+  print_table(loads, ["twins+relationships", "workers", "twins/s", "relationships/s", "failed"])
+
+
+if __name__ == "__main__":
+  main()
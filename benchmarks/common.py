@@ -0,0 +1,30 @@
+"""Small helpers shared by the benchmark scripts. Run benchmarks from the repo root, e.g. `python -m benchmarks.publish_throughput`."""
+
+import math
+
+
+def percentile(values, q):
+  """Nearest-rank percentile (`q` in 0-100) of a non-empty sequence."""
+  ordered = sorted(values)
+  if not ordered:
+    return float("nan")
+  rank = max(1, math.ceil(q / 100 * len(ordered)))
+  return ordered[rank - 1]
+
+
+def print_table(rows, columns):
+  """Print a list of dicts as an aligned plain-text table."""
+  cells = [[_format(row.get(column)) for column in columns] for row in rows]
+  widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+  numeric = [all(isinstance(row.get(column), (int, float)) for row in rows) for column in columns]
+  print("  ".join(column.rjust(w) if num else column.ljust(w) for column, w, num in zip(columns, widths, numeric)))
+  for line in cells:
+    print("  ".join(cell.rjust(w) if num else cell.ljust(w) for cell, w, num in zip(line, widths, numeric)))
+
+
+def _format(value):
+  if isinstance(value, float):
+    return f"{value:,.3f}" if abs(value) < 100 else f"{value:,.0f}"
+  if isinstance(value, int):
+    return f"{value:,}"
+  return "" if value is None else str(value)
@@ -0,0 +1,65 @@
+"""
+How many twin writes per-station debouncing (digital_twin.debounce) saves on a noisy prediction stream.
+
+    python -m benchmarks.debounce_reduction --stations 100 --readings 10000 --noise 0.05
+
+Each station reports once a second; a fraction of stations develops a real fault halfway through,
+and every reading is mislabelled with probability `--noise`. Without debouncing every reading is a write.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import print_table
+from digital_twin.debounce import Debouncer
+
+NORMAL, FAULT = "NORMAL", "BALL_FAULT_PREDICTED"
+
+
+def synthetic_predictions(stations, readings, noise, faulty_fraction, seed):
+  rng = np.random.default_rng(seed)
+  truth = np.zeros((stations, readings), dtype=bool)
+  truth[rng.random(stations) < faulty_fraction, readings // 2:] = True
+  observed = truth ^ (rng.random((stations, readings)) < noise)
+  return pd.DataFrame({
+    "station_id": np.repeat([f"Station{i}" for i in range(stations)], readings),
+    "prediction": np.where(observed.ravel(), FAULT, NORMAL),
+    "event_time": pd.Timestamp("2024-01-01") + pd.to_timedelta(np.tile(np.arange(readings), stations), unit="s"),
+  }), int(truth.any(axis=1).sum())
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--stations", type=int, default=100)
+  parser.add_argument("--readings", type=int, default=10_000, help="readings per station")
+  parser.add_argument("--noise", type=float, default=0.05)
+  parser.add_argument("--faulty-fraction", type=float, default=0.1)
+  parser.add_argument("--heartbeat-seconds", type=float, default=900)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  predictions, real_faults = synthetic_predictions(args.stations, args.readings, args.noise, args.faulty_fraction, args.seed)
+  print(f"{len(predictions):,} readings, {real_faults} stations with a real fault")
+  changes = (predictions["prediction"] != predictions.groupby("station_id")["prediction"].shift()).sum()
+  results = [
+    {"strategy": "every reading", "writes": len(predictions), "reduction": 1.0},
+    {"strategy": "label changes only", "writes": int(changes), "reduction": len(predictions) / changes},
+  ]
+  for n, m in ((3, 5), (4, 5), (5, 5), (7, 10)):
+    debouncer = Debouncer(n, m, heartbeat_seconds=args.heartbeat_seconds)
+    started = time.perf_counter()
+    emitted = debouncer.run(predictions)
+    elapsed = time.perf_counter() - started
+    transitions = int((emitted["reason"] == "transition").sum())
+    results.append({
+      "strategy": f"{n} of {m} + heartbeat", "writes": len(emitted), "transitions": transitions,
+      "reduction": len(predictions) / len(emitted), "readings/s": len(predictions) / elapsed,
+    })
+  print_table(results, ["strategy", "writes", "transitions", "reduction", "readings/s"])
+
+
+if __name__ == "__main__":
+  main()
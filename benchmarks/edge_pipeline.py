@@ -0,0 +1,137 @@
+"""
+Single-node `digital_twin.edge.EdgePipeline` versus the Spark path on the same landing files.
+
+    python -m benchmarks.edge_pipeline --rows 100000 --formats csv parquet --workers 0 2 4 [--spark]
+
+Landing files are written by the upload simulator (one CSV per reading for `csv`, batched files of
+`--flush-rows` readings otherwise) and scored with an `IncrementalFaultClassifier` trained on
+data/vibration_reports.csv; twins are patched on the local ADT emulator. Startup is the time from a
+fresh interpreter to a started pipeline: imports, then the process pool with the model loaded in
+every worker (for Spark, the session). Throughput is the records/sec of parsing, scoring and
+publishing every file. `--spark` (needs pyspark and mlflow) runs the files through a local Spark
+session with `inference.with_fault_predictions` for comparison.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import print_table
+from benchmarks.publish_throughput import synthetic_emulator
+from digital_twin.emulator import FakeDigitalTwinsClient
+from digital_twin.simulator import LANDING_ZONE_PREFIX, LocalDirectorySink, UploadSimulator, device_fleet
+
+IMPORTS = "import digital_twin.edge, digital_twin.publisher, pandas, pyarrow.csv, pyarrow.json, pyarrow.parquet"
+
+
+def import_seconds(statement):
+  """Seconds a fresh interpreter takes to run `statement`, as the cold start of a job would."""
+  code = f"import time; started = time.perf_counter(); {statement}; print(time.perf_counter() - started)"
+  output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=os.getcwd())
+  return float(output.stdout.split()[-1])
+
+
+def train_model(path):
+  import pandas as pd
+
+  from digital_twin.resources import VIBRATION_REPORTS_PATH
+  from digital_twin.schema import FEATURE_COLUMNS, LABEL_COLUMN
+  from digital_twin.training import IncrementalFaultClassifier
+
+  reports = pd.read_csv(VIBRATION_REPORTS_PATH)
+  model = IncrementalFaultClassifier()
+  model.fit(reports[FEATURE_COLUMNS].to_numpy(), reports[LABEL_COLUMN].to_numpy(), epochs=5)
+  model.save(path)
+  return model
+
+
+def write_landing_zone(root, landing_format, rows, stations, flush_rows):
+  fleet = device_fleet([f"MixingStep-{i:06d}" for i in range(stations)], fault_fraction=0.2, onset_range=(0, 0))
+  options = dict(files_per_second=1e9) if landing_format == "csv" else dict(rows_per_second=1e9, flush_rows=flush_rows)
+  UploadSimulator(fleet, LocalDirectorySink(root), max_workers=8, landing_format=landing_format, **options).run(max_rows=rows)
+  return os.path.join(root, LANDING_ZONE_PREFIX)
+
+
+def run_edge(directory, landing_format, workers, model_path, imports, args):
+  from digital_twin.edge import EdgePipeline
+  from digital_twin.publisher import TwinPatchPublisher, component_health_states
+
+  publisher = TwinPatchPublisher(FakeDigitalTwinsClient(synthetic_emulator(args.stations, 0.0)), states_fn=component_health_states)
+  pipeline = EdgePipeline(directory, publisher, model_path, landing_format=landing_format, workers=workers,
+                          files_per_task=args.files_per_task)
+  with pipeline:
+    stats = pipeline.run(idle_batches=1, trigger_seconds=0.0)
+  return {
+    "engine": f"edge, {workers} workers" if workers else "edge, in-process",
+    "format": landing_format, "records": stats.records, "files": stats.files,
+    "startup s": imports + stats.startup_seconds, "records/s": stats.records_per_second,
+  }
+
+
+def run_spark(directory, landing_format, model, args):
+  from digital_twin.inference import with_fault_predictions
+  from digital_twin.schema import LANDING_SCHEMA_DDL
+
+  imports = import_seconds("import pyspark.sql")
+  started = time.perf_counter()
+  import mlflow.sklearn
+  from pyspark.sql import SparkSession
+
+  spark = SparkSession.builder.master(f"local[{args.spark_cores}]").getOrCreate()
+  startup = imports + time.perf_counter() - started
+  model_path = tempfile.mkdtemp()
+  shutil.rmtree(model_path)
+  mlflow.sklearn.save_model(model, model_path)
+  try:
+    started = time.perf_counter()
+    reader = spark.read.schema(LANDING_SCHEMA_DDL)
+    if landing_format == "csv":
+      df = reader.option("header", "true").csv(directory)
+    else:
+      df = reader.format("json" if landing_format == "ndjson" else "parquet").load(directory)
+    scored = with_fault_predictions(df, model_path)
+    records = scored.count()
+    seconds = time.perf_counter() - started
+  finally:
+    shutil.rmtree(model_path, ignore_errors=True)
+  return {
+    "engine": f"spark local[{args.spark_cores}]", "format": landing_format, "records": records, "files": None,
+    "startup s": startup, "records/s": records / seconds,
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--rows", type=int, default=20000)
+  parser.add_argument("--formats", nargs="+", choices=["csv", "ndjson", "parquet"], default=["csv", "parquet"])
+  parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4], help="process pool sizes (0 runs in-process)")
+  parser.add_argument("--stations", type=int, default=100)
+  parser.add_argument("--flush-rows", type=int, default=1000, help="readings per batched NDJSON / Parquet file")
+  parser.add_argument("--files-per-task", type=int, default=256)
+  parser.add_argument("--spark", action="store_true", help="also run the Spark path (needs pyspark and mlflow)")
+  parser.add_argument("--spark-cores", type=int, default=4)
+  args = parser.parse_args()
+
+  root = tempfile.mkdtemp()
+  try:
+    model_path = os.path.join(root, "fault_model.npz")
+    model = train_model(model_path)
+    imports = import_seconds(IMPORTS)
+    results = []
+    for landing_format in args.formats:
+      directory = write_landing_zone(os.path.join(root, landing_format), landing_format, args.rows, args.stations, args.flush_rows)
+      for workers in args.workers:
+        results.append(run_edge(directory, landing_format, workers, model_path, imports, args))
+      if args.spark:
+        results.append(run_spark(directory, landing_format, model, args))
+  finally:
+    shutil.rmtree(root)
+  print_table(results, ["engine", "format", "records", "files", "startup s", "records/s"])
+
+
+if __name__ == "__main__":
+  main()
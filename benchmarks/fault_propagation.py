@@ -0,0 +1,73 @@
+"""
+Incremental fault roll-up (digital_twin.propagation) versus recomputing the whole graph on every change.
+
+    python -m benchmarks.fault_propagation --sites 10 100 1000 --lines-per-site 25 --stations-per-step 1
+
+Generates a plant topology (digital_twin.topology: sites -> lines -> mixing/coating/calendering stations), then
+replays random prediction flips in micro-batches and reports station updates/sec.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table
+from digital_twin.graph import TwinGraphStore
+from digital_twin.propagation import FaultPropagator
+from digital_twin.topology import PlantTopology
+
+
+def replay(propagator, batches, full_recompute):
+  emitted = 0
+  started = time.perf_counter()
+  for batch in batches:
+    if full_recompute:
+      for twin_id, faulty in batch.items():
+        propagator.faulty[propagator.store.index[twin_id]] = faulty
+      propagator.recompute()
+      emitted += len(propagator.states())  # nothing is known to be unchanged: every twin is re-sent
+    else:
+      emitted += len(propagator.update(batch))
+  return time.perf_counter() - started, emitted
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--sites", type=int, nargs="+", default=[10, 100, 1000])
+  parser.add_argument("--lines-per-site", type=int, default=25)
+  parser.add_argument("--stations-per-step", type=int, default=1)
+  parser.add_argument("--batches", type=int, default=200)
+  parser.add_argument("--batch-size", type=int, default=100, help="stations per micro-batch")
+  parser.add_argument("--flip-probability", type=float, default=0.1, help="chance a station's prediction changes")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  results = []
+  for sites in args.sites:
+    topology = PlantTopology(sites, args.lines_per_site, args.stations_per_step)
+    store = TwinGraphStore.from_iterables(topology.twins(), topology.relationships(), keep_documents=False)
+    steps = list(topology.stations())
+    rng = np.random.default_rng(args.seed)
+    faulty = dict.fromkeys(steps, False)
+    batches = []
+    for _ in range(args.batches):
+      batch = {}
+      for twin_id in rng.choice(steps, args.batch_size):
+        if rng.random() < args.flip_probability:
+          faulty[twin_id] = not faulty[twin_id]
+        batch[twin_id] = faulty[twin_id]
+      batches.append(batch)
+
+    for mode, full in (("incremental", False), ("full recompute", True)):
+      elapsed, emitted = replay(FaultPropagator(store), batches, full)
+      updates = args.batches * args.batch_size
+      results.append({
+        "twins": len(store), "mode": mode, "updates": updates, "seconds": elapsed,
+        "updates/s": updates / elapsed, "states emitted": emitted,
+      })
+  print_table(results, ["twins", "mode", "updates", "seconds", "updates/s", "states emitted"])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,57 @@
+"""
+Throughput of digital_twin.features on synthetic accelerometer signals.
+
+    python -m benchmarks.feature_extraction --stations 64 --samples 1000000
+
+NumPy runs these kernels on a single thread, so samples/s is a per-core figure.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table
+from digital_twin.features import DEFAULT_WINDOW, StreamingFeatureExtractor, window_features
+
+
+def timed(fn):
+  started = time.perf_counter()
+  fn()
+  return time.perf_counter() - started
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--stations", type=int, default=64)
+  parser.add_argument("--samples", type=int, default=1_000_000, help="samples per station")
+  parser.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+  parser.add_argument("--block", type=int, default=10_000, help="samples per incremental update")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  rng = np.random.default_rng(args.seed)
+  signals = rng.normal(0.02, 0.12, size=(args.stations, args.samples))
+  total = signals.size
+  cases = {
+    "tumbling": lambda: window_features(signals, args.window),
+    "sliding (50% overlap)": lambda: window_features(signals, args.window, args.window // 2),
+  }
+
+  def incremental():
+    extractor = StreamingFeatureExtractor(args.window)
+    for start in range(0, args.samples, args.block):
+      for station in range(args.stations):
+        extractor.update(station, signals[station, start:start + args.block])
+
+  cases[f"incremental ({args.block:,}-sample blocks)"] = incremental
+
+  results = []
+  for name, fn in cases.items():
+    elapsed = timed(fn)
+    results.append({"mode": name, "samples": total, "seconds": elapsed, "samples/s/core": total / elapsed})
+  print_table(results, ["mode", "samples", "seconds", "samples/s/core"])
+
+
+if __name__ == "__main__":
+  main()
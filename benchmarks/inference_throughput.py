@@ -0,0 +1,92 @@
+"""
+Compare the notebook's `mlflow.pyfunc.spark_udf` scoring path with `digital_twin.inference` on a
+scaled-up copy of data/vibration_reports.csv, using a local Spark session.
+
+    python -m benchmarks.inference_throughput --scale 100 --batch-sizes 1000 10000 50000
+
+Without `--model-uri`, a LightGBM-like stand-in (sklearn HistGradientBoostingClassifier) is trained on
+the CSV and logged to a temporary local MLflow store.
+"""
+
+import argparse
+import tempfile
+import time
+
+from benchmarks.common import print_table
+from digital_twin.inference import ARROW_BATCH_CONF, with_fault_predictions
+from digital_twin.resources import VIBRATION_REPORTS_PATH
+from digital_twin.schema import FEATURE_COLUMNS, LABEL_COLUMN, NORMAL_CLASS
+
+
+def train_reference_model(tracking_dir):
+  import mlflow
+  import mlflow.sklearn
+  import pandas as pd
+  from sklearn.ensemble import HistGradientBoostingClassifier
+
+  mlflow.set_tracking_uri(f"file://{tracking_dir}")
+  reports = pd.read_csv(VIBRATION_REPORTS_PATH)
+  model = HistGradientBoostingClassifier(max_iter=100).fit(reports[FEATURE_COLUMNS], reports[LABEL_COLUMN])
+  with mlflow.start_run() as run:
+    mlflow.sklearn.log_model(model, "model")
+  return f"runs:/{run.info.run_id}/model"
+
+
+def scaled_reports(spark, scale, partitions):
+  import pyspark.sql.functions as F
+
+  reports = spark.read.csv(VIBRATION_REPORTS_PATH, header=True, inferSchema=True).select(
+    *[F.col(column).cast("float") for column in FEATURE_COLUMNS]
+  )
+  return reports.crossJoin(spark.range(scale).withColumnRenamed("id", "replica")).repartition(partitions).cache()
+
+
+def timed_noop_write(df):
+  started = time.perf_counter()
+  df.write.format("noop").mode("overwrite").save()
+  return time.perf_counter() - started
+
+
+def spark_udf_path(spark, df, model_uri):
+  import mlflow.pyfunc
+  import pyspark.sql.functions as F
+
+  loaded_model = mlflow.pyfunc.spark_udf(spark, model_uri=model_uri, result_type="string")
+  scored = df.withColumn("prediction", loaded_model(*FEATURE_COLUMNS))
+  return scored.withColumn("prediction", F.when(F.col("prediction").startswith("Normal"), "NORMAL").otherwise("BALL_FAULT_PREDICTED"))
+
+
+def map_in_pandas_path(spark, df, model_uri, batch_size):
+  import pyspark.sql.functions as F
+
+  spark.conf.set(ARROW_BATCH_CONF, str(batch_size))
+  scored = with_fault_predictions(df, model_uri)
+  return scored.withColumn("prediction", F.when(F.col("fault_class") == NORMAL_CLASS, "NORMAL").otherwise("BALL_FAULT_PREDICTED"))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--scale", type=int, default=100, help="copies of the 2,300-row CSV")
+  parser.add_argument("--partitions", type=int, default=8)
+  parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+  parser.add_argument("--model-uri")
+  args = parser.parse_args()
+
+  from pyspark.sql import SparkSession
+
+  spark = SparkSession.builder.master("local[*]").appName("inference-benchmark").getOrCreate()
+  model_uri = args.model_uri or train_reference_model(tempfile.mkdtemp())
+  df = scaled_reports(spark, args.scale, args.partitions)
+  rows = df.count()
+
+  results = []
+  elapsed = timed_noop_write(spark_udf_path(spark, df, model_uri))
+  results.append({"path": "spark_udf (string)", "batch size": None, "rows": rows, "seconds": elapsed, "rows/s": rows / elapsed})
+  for batch_size in args.batch_sizes:
+    elapsed = timed_noop_write(map_in_pandas_path(spark, df, model_uri, batch_size))
+    results.append({"path": "mapInPandas (float32)", "batch size": batch_size, "rows": rows, "seconds": elapsed, "rows/s": rows / elapsed})
+  print_table(results, ["path", "batch size", "rows", "seconds", "rows/s"])
+
+
+if __name__ == "__main__":
+  main()
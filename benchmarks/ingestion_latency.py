@@ -0,0 +1,129 @@
+"""
+End-to-end ingestion latency of landing files versus binary messages (digital_twin.messages).
+
+    python -m benchmarks.ingestion_latency --rows-per-second 2000 --duration 10 --trigger 0.5
+
+The upload simulator produces readings at `--rows-per-second` on a background thread while a
+consumer runs a micro-batch every `--trigger` seconds, the way a Structured Streaming query would:
+file layouts are listed and parsed (new files only), messages are fetched from an in-process
+`LocalBroker` stand-in for Kafka / Event Hubs and decoded. Latency is measured per reading from its
+event time to the end of the micro-batch that made it available as a DataFrame. `--broker-latency`
+adds a per-message produce delay to approximate a network round trip.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.common import percentile, print_table
+from digital_twin.messages import BrokerSink, LocalBroker, LocalConsumer, messages_frame
+from digital_twin.simulator import LANDING_ZONE_PREFIX, LocalDirectorySink, UploadSimulator, device_fleet
+
+
+class FileConsumer:
+  """Micro-batches over a local landing zone: list, then parse files not seen before."""
+
+  def __init__(self, root, landing_format):
+    self.root = os.path.join(root, LANDING_ZONE_PREFIX)
+    self.landing_format = landing_format
+    self.seen = set()
+
+  def poll(self):
+    import pandas as pd
+
+    files = [
+      os.path.join(directory, name)
+      for directory, _, names in os.walk(self.root) for name in names if not name.startswith(".")
+    ]
+    new = [f for f in files if f not in self.seen]
+    self.seen.update(new)
+    if not new:
+      return None
+    if self.landing_format == "ndjson":
+      frames = [pd.read_json(f, lines=True, convert_dates=["event_time"]) for f in new]
+    else:
+      frames = [pd.read_csv(f, parse_dates=["event_time"]) for f in new]
+    return pd.concat(frames, ignore_index=True)
+
+
+class MessageConsumer:
+  def __init__(self, broker, topic, encoding):
+    self.consumer = LocalConsumer(broker, topic)
+    self.encoding = encoding
+
+  def poll(self):
+    messages = self.consumer.poll()
+    return messages_frame(messages, self.encoding) if messages else None
+
+
+def measure(simulator, consumer, duration, trigger):
+  producer = threading.Thread(target=simulator.run, kwargs=dict(duration=duration))
+  latencies, batches = [], 0
+  started = time.perf_counter()
+  producer.start()
+  while True:
+    producing = producer.is_alive()
+    frame = consumer.poll()
+    if frame is not None and len(frame):
+      now = time.time()
+      event_times = frame["event_time"].to_numpy(dtype="datetime64[ns]").astype(np.int64) / 1e9
+      latencies.extend((now - event_times).tolist())
+      batches += 1
+    if not producing and len(latencies) >= simulator.stats.rows:
+      break
+    time.sleep(trigger)
+  return latencies, batches, time.perf_counter() - started
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--rows-per-second", type=float, default=2000)
+  parser.add_argument("--duration", type=float, default=10.0)
+  parser.add_argument("--trigger", type=float, default=0.5, help="seconds between consumer micro-batches")
+  parser.add_argument("--devices", type=int, default=20)
+  parser.add_argument("--flush-rows", type=int, default=1000, help="readings per batched NDJSON file")
+  parser.add_argument("--flush-interval", type=float, default=1.0, help="seconds before a partial NDJSON batch is written")
+  parser.add_argument("--broker-latency", type=float, default=0.0)
+  args = parser.parse_args()
+
+  fleet = device_fleet([f"MixingStep-{i:04d}" for i in range(args.devices)])
+  paths = [
+    ("csv per reading", "csv", dict(flush_rows=1)),
+    ("batched ndjson", "ndjson", dict(flush_rows=args.flush_rows, flush_interval=args.flush_interval)),
+    ("struct messages", "struct", {}),
+    ("avro messages", "avro", {}),
+  ]
+
+  results = []
+  for name, landing_format, options in paths:
+    root = None
+    if landing_format in ("struct", "avro"):
+      broker = LocalBroker(latency=args.broker_latency)
+      sink, consumer = BrokerSink(broker, "vibration"), MessageConsumer(broker, "vibration", landing_format)
+    else:
+      root = tempfile.mkdtemp()
+      sink, consumer = LocalDirectorySink(root), FileConsumer(root, landing_format)
+    try:
+      simulator = UploadSimulator(
+        fleet, sink, rows_per_second=args.rows_per_second, max_workers=8, landing_format=landing_format, **options
+      )
+      latencies, batches, seconds = measure(simulator, consumer, args.duration, args.trigger)
+      results.append({
+        "path": name, "rows": len(latencies), "batches": batches, "rows/s": len(latencies) / seconds,
+        "p50 ms": percentile(latencies, 50) * 1000, "p99 ms": percentile(latencies, 99) * 1000,
+        "max ms": max(latencies) * 1000,
+      })
+    finally:
+      if root is not None:
+        shutil.rmtree(root)
+  print(f"{args.rows_per_second:,.0f} readings/s for {args.duration:g} s, micro-batch trigger every {args.trigger:g} s")
+  print_table(results, ["path", "rows", "batches", "rows/s", "p50 ms", "p99 ms", "max ms"])
+
+
+if __name__ == "__main__":
+  main()
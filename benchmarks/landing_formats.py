@@ -0,0 +1,88 @@
+"""
+Listing and ingestion cost of one-CSV-per-reading landing files versus batched NDJSON/Parquet files.
+
+    python -m benchmarks.landing_formats --rows 20000 --flush-rows 1000
+
+Files are written locally by the upload simulator, then listed and parsed the way a file-based
+stream would (`--spark` uses Spark's batch readers instead of pandas/pyarrow).
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import print_table
+from digital_twin.ingestion import LANDING_ZONE_FORMATS
+from digital_twin.simulator import LANDING_ZONE_PREFIX, LocalDirectorySink, UploadSimulator, device_fleet
+
+
+def list_files(root):
+  return [os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names if not name.startswith(".")]
+
+
+def read_local(files, landing_format):
+  import pandas as pd
+  import pyarrow.parquet as pq
+
+  if landing_format == "parquet":
+    return sum(pq.read_table(f).num_rows for f in files)
+  if landing_format == "ndjson":
+    return sum(len(pd.read_json(f, lines=True)) for f in files)
+  return sum(len(pd.read_csv(f)) for f in files)
+
+
+def read_spark(spark, root, landing_format):
+  cloud_files_format, extension = LANDING_ZONE_FORMATS[landing_format]
+  reader = spark.read.format(cloud_files_format).option("recursiveFileLookup", "true").option("pathGlobFilter", f"*.{extension}")
+  if landing_format == "csv":
+    reader = reader.option("header", "true")
+  return reader.load(root).count()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--rows", type=int, default=20000)
+  parser.add_argument("--devices", type=int, default=20)
+  parser.add_argument("--flush-rows", type=int, default=1000)
+  parser.add_argument("--spark", action="store_true")
+  args = parser.parse_args()
+
+  spark = None
+  if args.spark:
+    from pyspark.sql import SparkSession
+    spark = SparkSession.builder.master("local[*]").appName("landing-format-benchmark").getOrCreate()
+
+  fleet = device_fleet([f"MixingStep-{i:04d}" for i in range(args.devices)])
+  layouts = [
+    ("csv per reading", dict(landing_format="csv", files_per_second=1e9)),
+    ("batched ndjson", dict(landing_format="ndjson", rows_per_second=1e9, flush_rows=args.flush_rows)),
+    ("batched parquet", dict(landing_format="parquet", rows_per_second=1e9, flush_rows=args.flush_rows)),
+  ]
+
+  results = []
+  for name, options in layouts:
+    root = tempfile.mkdtemp()
+    try:
+      stats = UploadSimulator(fleet, LocalDirectorySink(root), max_workers=8, **options).run(max_rows=args.rows)
+
+      started = time.perf_counter()
+      files = list_files(os.path.join(root, LANDING_ZONE_PREFIX))
+      listing = time.perf_counter() - started
+
+      started = time.perf_counter()
+      rows = read_spark(spark, root, options["landing_format"]) if spark else read_local(files, options["landing_format"])
+      reading = time.perf_counter() - started
+
+      results.append({
+        "layout": name, "files": len(files), "rows": rows, "write rows/s": stats.rows_per_second,
+        "list ms": listing * 1000, "ingest s": reading, "ingest rows/s": rows / reading,
+      })
+    finally:
+      shutil.rmtree(root)
+  print_table(results, ["layout", "files", "rows", "write rows/s", "list ms", "ingest s", "ingest rows/s"])
+
+
+if __name__ == "__main__":
+  main()
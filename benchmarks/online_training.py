@@ -0,0 +1,87 @@
+"""
+Training cost of incremental updates (digital_twin.training) versus full retraining as the labelled
+vibration dataset grows.
+
+    python -m benchmarks.online_training --rows 10000 100000 1000000 --batch-rows 10000
+
+Rows are bootstrapped from a training split of data/vibration_reports.csv with 1% multiplicative
+jitter and arrive in batches of `--batch-rows`. At each size the incremental model has folded in
+every batch so far; full retraining fits the same model from scratch on all rows (and, when sklearn
+is installed, a HistGradientBoostingClassifier as a stand-in for an AutoML run). Accuracy is measured
+on the held-out reports.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table
+from digital_twin.resources import VIBRATION_REPORTS_PATH
+from digital_twin.schema import FEATURE_COLUMNS, LABEL_COLUMN
+from digital_twin.training import IncrementalFaultClassifier
+
+
+def bootstrap(features, labels, n, rng, jitter=0.01):
+  rows = rng.integers(0, len(features), size=n)
+  return features[rows] * rng.normal(1.0, jitter, size=(n, features.shape[1])), labels[rows]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+  parser.add_argument("--batch-rows", type=int, default=10000, help="newly labelled rows per incremental update")
+  parser.add_argument("--full-epochs", type=int, default=5)
+  parser.add_argument("--holdout", type=float, default=0.2)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  import pandas as pd
+
+  rng = np.random.default_rng(args.seed)
+  reports = pd.read_csv(VIBRATION_REPORTS_PATH).sample(frac=1.0, random_state=args.seed, ignore_index=True)
+  n_test = int(len(reports) * args.holdout)
+  test_x, test_y = reports[FEATURE_COLUMNS][:n_test].to_numpy(dtype=np.float64), reports[LABEL_COLUMN][:n_test].to_numpy()
+  train_x, train_y = reports[FEATURE_COLUMNS][n_test:].to_numpy(dtype=np.float64), reports[LABEL_COLUMN][n_test:].to_numpy()
+
+  try:
+    from sklearn.ensemble import HistGradientBoostingClassifier
+  except ImportError:
+    HistGradientBoostingClassifier = None
+
+  incremental = IncrementalFaultClassifier(seed=args.seed)
+  seen_x, seen_y, update_seconds, results = [], [], [], []
+  for target in sorted(args.rows):
+    while sum(len(x) for x in seen_x) < target:
+      x, y = bootstrap(train_x, train_y, args.batch_rows, rng)
+      seen_x.append(x)
+      seen_y.append(y)
+      started = time.perf_counter()
+      incremental.partial_fit(x, y)
+      update_seconds.append(time.perf_counter() - started)
+    all_x, all_y = np.vstack(seen_x), np.concatenate(seen_y)
+    results.append({
+      "rows": len(all_x), "method": "incremental (last batch)", "seconds": update_seconds[-1],
+      "accuracy": incremental.score(test_x, test_y),
+    })
+
+    started = time.perf_counter()
+    full = IncrementalFaultClassifier(seed=args.seed).fit(all_x, all_y, epochs=args.full_epochs)
+    results.append({
+      "rows": len(all_x), "method": f"full retrain ({args.full_epochs} epochs)", "seconds": time.perf_counter() - started,
+      "accuracy": full.score(test_x, test_y),
+    })
+    if HistGradientBoostingClassifier is not None:
+      started = time.perf_counter()
+      boosted = HistGradientBoostingClassifier(max_iter=100).fit(all_x, all_y)
+      results.append({
+        "rows": len(all_x), "method": "full retrain (gradient boosting)", "seconds": time.perf_counter() - started,
+        "accuracy": float((boosted.predict(test_x) == test_y).mean()),
+      })
+
+  print(f"Incremental updates of {args.batch_rows:,} rows; seconds are per training run")
+  print_table(results, ["rows", "method", "seconds", "accuracy"])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,141 @@
+"""
+Replay synthetic prediction streams against the local ADT emulator and compare publishing strategies.
+
+    python -m benchmarks.publish_throughput --twins 1000 10000 100000 --latency-ms 0.5
+
+Reports ADT requests/sec and p50/p99 end-to-end latency (batch arrival -> twin update acknowledged).
+"""
+
+import argparse
+import copy
+import random
+import threading
+import time
+
+from benchmarks.common import percentile, print_table
+from digital_twin.emulator import DigitalTwinsEmulator, FakeDigitalTwinsClient
+from digital_twin.publisher import TwinPatchPublisher, mixer_health_state
+from digital_twin.writer import ConcurrentTwinWriter
+
+TEMPLATE_TWIN_ID = "MixingStep-Line1-Munich"
+
+
+class RecordingClient:
+  """Wraps a client and records when each write to a twin was acknowledged."""
+
+  def __init__(self, client):
+    self.client = client
+    self.acknowledged = []
+    self._lock = threading.Lock()
+
+  def _record(self, twin_id):
+    with self._lock:
+      self.acknowledged.append((twin_id, time.perf_counter()))
+
+  def upsert_digital_twin(self, twin_id, twin):
+    result = self.client.upsert_digital_twin(twin_id, twin)
+    self._record(twin_id)
+    return result
+
+  def update_digital_twin(self, twin_id, patch):
+    result = self.client.update_digital_twin(twin_id, patch)
+    self._record(twin_id)
+    return result
+
+
+def synthetic_emulator(n_twins, latency):
+  emulator = DigitalTwinsEmulator.from_repo(latency=latency)
+  template = emulator.twins[TEMPLATE_TWIN_ID]
+  for i in range(n_twins):
+    twin = copy.deepcopy(template)
+    twin["$dtId"] = f"MixingStep-{i:06d}"
+    emulator.twins[twin["$dtId"]] = twin
+  return emulator
+
+
+def synthetic_stream(twin_ids, batches, rows_per_twin, change_rate, seed):
+  """Micro-batches of prediction rows; each batch a `change_rate` fraction of stations flips state."""
+  rng = random.Random(seed)
+  faulty = set()
+  for _ in range(batches):
+    for twin_id in rng.sample(twin_ids, int(len(twin_ids) * change_rate)):
+      faulty ^= {twin_id}
+    yield [
+      {"station_id": twin_id, "prediction": "Ball_007_1" if twin_id in faulty else "NORMAL"}
+      for _ in range(rows_per_twin) for twin_id in twin_ids
+    ]
+
+
+def row_upsert(client, baseline):
+  """The original notebook behaviour: one full-twin upsert per row."""
+  def publish(rows):
+    for row in rows:
+      twin = copy.deepcopy(baseline[row["station_id"]])
+      twin["HealthPrediction"] = mixer_health_state(row)["/HealthPrediction"]
+      twin["BallBearings"] = {"faultPredicted": row["prediction"] != "NORMAL", "$metadata": {}}
+      client.upsert_digital_twin(row["station_id"], twin)
+  return publish
+
+
+def diff_patch(client, baseline):
+  return TwinPatchPublisher(client, baseline=baseline).publish
+
+
+def concurrent_diff_patch(client, baseline, max_workers=16):
+  writer = ConcurrentTwinWriter(client, max_workers=max_workers, rate_per_second=1e9)
+  return TwinPatchPublisher(writer, baseline=baseline).publish
+
+
+STRATEGIES = {
+  "row_upsert": row_upsert,
+  "diff_patch": diff_patch,
+  "concurrent_diff_patch": concurrent_diff_patch,
+}
+
+
+def run(strategy, n_twins, args):
+  emulator = synthetic_emulator(n_twins, args.latency_ms / 1000)
+  twin_ids = sorted(twin_id for twin_id in emulator.twins if twin_id.startswith("MixingStep-0"))
+  baseline = copy.deepcopy(emulator.twins)
+  client = RecordingClient(FakeDigitalTwinsClient(emulator))
+  publish = STRATEGIES[strategy](client, baseline)
+
+  latencies, rows, elapsed = [], 0, 0.0
+  for batch in synthetic_stream(twin_ids, args.batches, args.rows_per_twin, args.change_rate, args.seed):
+    client.acknowledged.clear()
+    started = time.perf_counter()
+    publish(batch)
+    elapsed += time.perf_counter() - started
+    rows += len(batch)
+    latencies.extend(acknowledged - started for _, acknowledged in client.acknowledged)
+
+  requests = emulator.request_count
+  return {
+    "strategy": strategy,
+    "twins": n_twins,
+    "rows": rows,
+    "requests": requests,
+    "requests/s": requests / elapsed if elapsed else 0.0,
+    "rows/s": rows / elapsed if elapsed else 0.0,
+    "p50 ms": percentile(latencies, 50) * 1000 if latencies else None,
+    "p99 ms": percentile(latencies, 99) * 1000 if latencies else None,
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--twins", type=int, nargs="+", default=[1000, 10000, 100000])
+  parser.add_argument("--strategies", nargs="+", choices=sorted(STRATEGIES), default=list(STRATEGIES))
+  parser.add_argument("--batches", type=int, default=3)
+  parser.add_argument("--rows-per-twin", type=int, default=1)
+  parser.add_argument("--change-rate", type=float, default=0.05)
+  parser.add_argument("--latency-ms", type=float, default=0.5, help="simulated ADT round-trip per request")
+  parser.add_argument("--seed", type=int, default=42)
+  args = parser.parse_args()
+
+  results = [run(strategy, n_twins, args) for n_twins in args.twins for strategy in args.strategies]
+  print_table(results, ["strategy", "twins", "rows", "requests", "requests/s", "rows/s", "p50 ms", "p99 ms"])
+
+
+if __name__ == "__main__":
+  main()
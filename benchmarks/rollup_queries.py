@@ -0,0 +1,120 @@
+"""
+Dashboard query latency over raw telemetry samples versus digital_twin.rollups.
+
+    python -m benchmarks.rollup_queries --stations 6 --periods 1800 --batch-periods 60 [--samples-per-period 10]
+
+Coating telemetry from digital_twin.generation (`--samples-per-period` samples per second, 1 kHz by
+default; small values mimic one feature row per upload) is written as raw Parquet and folded into
+`ParquetRollups` one batch of `--batch-periods` seconds at a time, as a stream would. Each query asks
+for per-bucket mean/min/max/p95 of dryerFanSpeed for all stations over a time range with at most
+`--max-points` buckets: over raw samples (pyarrow filter, pandas group by), and from the resolution
+`choose_resolution` picks. The rank error of the rollups' p50/p95/p99 against the raw samples of each
+bucket is checked against `rollups.rank_error_bound`.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table
+from digital_twin.generation import COATING_SIGNALS, TelemetryGenerator
+from digital_twin.rollups import RESOLUTIONS, ParquetRollups, choose_resolution, long_samples, rank_error_bound
+
+START = 1_699_999_200  # on an hour boundary, so every resolution's buckets line up with the ranges
+
+
+def raw_query(path, start, end, max_points):
+  import pyarrow.parquet as pq
+
+  table = pq.read_table(path, columns=["station_id", "time", "dryerFanSpeed"], filters=[("time", ">=", start), ("time", "<", end)])
+  frame = table.to_pandas()
+  seconds = RESOLUTIONS[choose_resolution(start, end, max_points)]
+  frame["bucket_start"] = (frame["time"] // seconds * seconds).astype(np.int64)
+  grouped = frame.groupby(["station_id", "bucket_start"])["dryerFanSpeed"]
+  return grouped.agg(["mean", "min", "max"]).join(grouped.quantile(0.95).rename("p95")).reset_index(), frame
+
+
+def rank_errors(frame, rolled, q):
+  """Per bucket, `|F(estimate) - q|` of the rollups' `q` quantile over the bucket's raw samples."""
+  column = f"p{round(q * 100)}"
+  estimates = rolled.set_index(["station_id", "bucket_start"])[column]
+  errors = []
+  for key, values in frame.groupby(["station_id", "bucket_start"])["dryerFanSpeed"]:
+    values = np.sort(values.to_numpy())
+    errors.append(abs(np.searchsorted(values, estimates[key], side="right") / len(values) - q))
+  return np.asarray(errors)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--stations", type=int, default=6)
+  parser.add_argument("--periods", type=int, default=1800, help="seconds of 1 kHz telemetry per station")
+  parser.add_argument("--batch-periods", type=int, default=60, help="seconds of telemetry per rollup update")
+  parser.add_argument("--samples-per-period", type=int, default=1000, help="samples per second and signal")
+  parser.add_argument("--max-points", type=int, default=500)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+
+  stations = [f"CoatingStep-Line{i + 1}-Site" for i in range(args.stations)]
+  generator = TelemetryGenerator(
+    stations, stations[-1:], n_periods=args.periods, signals=COATING_SIGNALS, samples_per_period=args.samples_per_period,
+    fault_start_period=args.periods // 2, chunk_periods=args.batch_periods, seed=args.seed,
+  )
+  signals = [signal.name for signal in COATING_SIGNALS]
+  directory = tempfile.mkdtemp()
+  try:
+    raw_path = os.path.join(directory, "raw.parquet")
+    rollups = ParquetRollups(os.path.join(directory, "rollups"))
+    writer, update_seconds = None, []
+    for batch_id, frame in enumerate(generator.frames()):
+      frame["station_id"] = frame["station_id"].astype(str)
+      frame["time"] = START + frame["_index"] / generator.samples_per_period
+      table = pa.Table.from_pandas(frame, preserve_index=False)
+      writer = writer or pq.ParquetWriter(raw_path, table.schema)
+      writer.write_table(table)
+      started = time.perf_counter()
+      rollups.update(long_samples(frame, signals), batch_id=batch_id)
+      update_seconds.append(time.perf_counter() - started)
+    writer.close()
+
+    results = []
+    for span in (60, 600, args.periods):
+      start, end = START + args.periods - span, START + args.periods
+      started = time.perf_counter()
+      raw, frame = raw_query(raw_path, start, end, args.max_points)
+      raw_seconds = time.perf_counter() - started
+      started = time.perf_counter()
+      rolled = rollups.query(start, end, signals=["dryerFanSpeed"], max_points=args.max_points)
+      rollup_seconds = time.perf_counter() - started
+      counts = frame.groupby(["station_id", "bucket_start"]).size().to_numpy()
+      errors = {q: rank_errors(frame, rolled, q) for q in (0.5, 0.95, 0.99)}
+      for q, error in errors.items():
+        bound = rank_error_bound(q, counts)
+        assert (error <= bound).all(), f"p{round(q * 100)} rank error {error.max():.4f} exceeds its bound over {span} s"
+      results.append({
+        "range s": span, "resolution": rolled["resolution"].iloc[0], "buckets": len(rolled), "raw rows": len(frame),
+        "raw ms": raw_seconds * 1000, "rollup ms": rollup_seconds * 1000, "speedup": raw_seconds / rollup_seconds,
+        "max |mean diff|": float(np.abs(raw["mean"].to_numpy() - rolled["mean"].to_numpy()).max()),
+        "max |p95 diff|": float(np.abs(raw["p95"].to_numpy() - rolled["p95"].to_numpy()).max()),
+        **{f"p{round(q * 100)} rank err": float(error.max()) for q, error in errors.items()},
+      })
+    samples = generator.n_rows * len(signals)
+    print(f"{samples:,} samples; rollup updates of {args.batch_periods} s took {np.mean(update_seconds) * 1000:,.0f} ms on average "
+          f"({samples / sum(update_seconds):,.0f} samples/s)")
+    print_table(results, [
+      "range s", "resolution", "buckets", "raw rows", "raw ms", "rollup ms", "speedup", "max |mean diff|", "max |p95 diff|",
+      "p50 rank err", "p95 rank err", "p99 rank err",
+    ])
+  finally:
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,128 @@
+"""
+Twin reads through the per-executor `TwinCache` versus fetching every twin from ADT.
+
+    python -m benchmarks.twin_cache --twins 10000 100000 --cache-fraction 0.1 0.5 1.0 --ttl 5
+
+A synthetic fleet of mixing stations is loaded into the local emulator. Each round reads
+`--reads-per-round` twins with a skewed (Zipf-like) access pattern, as a publisher touching its
+busiest stations would, then updates a `--change-rate` fraction of the fleet behind the cache's back.
+Rounds are `--round-seconds` apart on a simulated clock, so entries expire after `--ttl`. Reports
+ADT requests, twin bodies transferred, hit rate and the twins held in memory.
+"""
+
+import argparse
+import copy
+import json
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table
+from digital_twin.emulator import DigitalTwinsEmulator, FakeDigitalTwinsClient, _new_etag
+from digital_twin.twin_cache import TwinCache
+
+TEMPLATE_TWIN_ID = "MixingStep-Line1-Munich"
+
+
+class TransferClient:
+  """Wraps a client and counts the twin bodies (and their JSON bytes) it returns."""
+
+  def __init__(self, client):
+    self.client = client
+    self.bodies = 0
+    self.bytes = 0
+
+  def _count(self, twins):
+    self.bodies += len(twins)
+    self.bytes += sum(len(json.dumps(twin)) for twin in twins)
+
+  def get_digital_twin(self, twin_id, **kwargs):
+    twin = self.client.get_digital_twin(twin_id, **kwargs)
+    self._count([twin])
+    return twin
+
+  def query_twins(self, query, **kwargs):
+    twins = self.client.query_twins(query, **kwargs)
+    self._count(twins)
+    return twins
+
+
+def synthetic_emulator(n_twins):
+  emulator = DigitalTwinsEmulator.from_repo()
+  template = emulator.twins[TEMPLATE_TWIN_ID]
+  for i in range(n_twins):
+    twin = copy.deepcopy(template)
+    twin["$dtId"] = f"MixingStep-{i:06d}"
+    twin["$etag"] = _new_etag()
+    emulator.twins[twin["$dtId"]] = twin
+  return emulator
+
+
+def access_pattern(n_twins, reads, rounds, skew, seed):
+  rng = np.random.default_rng(seed)
+  weights = 1.0 / np.arange(1, n_twins + 1) ** skew
+  ranks = rng.permutation(n_twins)  # which twin is the k-th busiest
+  for _ in range(rounds):
+    yield ranks[rng.choice(n_twins, size=reads, p=weights / weights.sum())]
+
+
+def run(n_twins, cache_fraction, args):
+  emulator = synthetic_emulator(n_twins)
+  twin_ids = [f"MixingStep-{i:06d}" for i in range(n_twins)]
+  client = TransferClient(FakeDigitalTwinsClient(emulator))
+  now = [0.0]
+  cache = None
+  if cache_fraction:
+    cache = TwinCache(client, max_twins=max(1, int(n_twins * cache_fraction)), ttl_seconds=args.ttl, clock=lambda: now[0])
+    if args.warm:
+      cache.warm()
+  read = cache.get if cache is not None else client.get_digital_twin
+
+  rng = np.random.default_rng(args.seed + 1)
+  reads, started = 0, time.perf_counter()
+  for indices in access_pattern(n_twins, args.reads_per_round, args.rounds, args.skew, args.seed):
+    for i in indices.tolist():
+      read(twin_ids[i])
+    reads += len(indices)
+    for i in rng.choice(n_twins, size=int(n_twins * args.change_rate), replace=False).tolist():
+      emulator.twins[twin_ids[i]]["$etag"] = _new_etag()  # updated by someone else
+    now[0] += args.round_seconds
+  seconds = time.perf_counter() - started
+
+  stats = cache.stats if cache is not None else None
+  return {
+    "twins": n_twins,
+    "cache": f"{cache_fraction:.0%}" if cache_fraction else "none",
+    "reads": reads,
+    "requests": emulator.request_count,
+    "bodies": client.bodies,
+    "MB": client.bytes / 1e6,
+    "hit rate": stats.hit_rate if stats else 0.0,
+    "304s": stats.not_modified if stats else 0,
+    "evictions": stats.evictions if stats else 0,
+    "resident": len(cache) if cache is not None else 0,
+    "reads/s": reads / seconds,
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--twins", type=int, nargs="+", default=[10000, 100000])
+  parser.add_argument("--cache-fraction", type=float, nargs="+", default=[0.1, 0.5, 1.0],
+                      help="cache capacity as a fraction of the fleet (0 reads every twin from ADT)")
+  parser.add_argument("--rounds", type=int, default=10)
+  parser.add_argument("--reads-per-round", type=int, default=20000)
+  parser.add_argument("--round-seconds", type=float, default=1.0)
+  parser.add_argument("--ttl", type=float, default=5.0)
+  parser.add_argument("--change-rate", type=float, default=0.01, help="fraction of twins updated elsewhere per round")
+  parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of the access pattern")
+  parser.add_argument("--warm", action="store_true", help="bulk-load the cache with one query first")
+  parser.add_argument("--seed", type=int, default=42)
+  args = parser.parse_args()
+
+  results = [run(n_twins, fraction, args) for n_twins in args.twins for fraction in [0.0] + args.cache_fraction]
+  print_table(results, ["twins", "cache", "reads", "requests", "bodies", "MB", "hit rate", "304s", "evictions", "resident", "reads/s"])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,79 @@
+"""
+How the twin graph code paths scale with plant size, on topologies from digital_twin.topology.
+
+    python -m benchmarks.twin_graph_scaling --sites 10 100 1000 5000 --lines-per-site 10
+
+For each size: stream the generated graph to a TwinGraph.json style file, load it into a
+`TwinGraphStore` (streamed), validate every twin against `models/`, serialize the store for
+broadcast, and time per-station lookups (site, ancestors, downstream steps).
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table
+from digital_twin.bulk import iter_json_array
+from digital_twin.dtdl import ModelRegistry
+from digital_twin.graph import TwinGraphStore
+from digital_twin.topology import PlantTopology, write_twin_graph
+
+
+def timed(fn):
+  started = time.perf_counter()
+  result = fn()
+  return result, time.perf_counter() - started
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--sites", type=int, nargs="+", default=[10, 100, 1000])
+  parser.add_argument("--lines-per-site", type=int, default=10)
+  parser.add_argument("--stations-per-step", type=int, default=1)
+  parser.add_argument("--lookups", type=int, default=10000, help="random stations per lookup timing")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  registry = ModelRegistry.from_repo()
+  results = []
+  with tempfile.TemporaryDirectory() as directory:
+    for sites in args.sites:
+      topology = PlantTopology(sites, args.lines_per_site, args.stations_per_step)
+      path = os.path.join(directory, f"graph-{sites}.json")
+      with open(path, "w") as f:
+        (twins, relationships), write_seconds = timed(lambda: write_twin_graph(f, topology, models=[]))
+
+      invalid, validate_seconds = timed(lambda: sum(
+        bool(registry.validate_twin(twin)) for twin in iter_json_array(path, "digitalTwins")
+      ))
+      store, load_seconds = timed(lambda: TwinGraphStore.from_iterables(
+        iter_json_array(path, "digitalTwins"), iter_json_array(path, "relationships"), keep_documents=False
+      ))
+      blob, serialize_seconds = timed(store.to_bytes)
+      _, deserialize_seconds = timed(lambda: TwinGraphStore.from_bytes(blob))
+
+      stations = np.random.default_rng(args.seed).choice(list(topology.stations()), args.lookups).tolist()
+      _, site_seconds = timed(lambda: [store.site_of(station) for station in stations])
+      _, ancestor_seconds = timed(lambda: [store.ancestors(station) for station in stations])
+      _, downstream_seconds = timed(lambda: [store.downstream(station) for station in stations])
+
+      results.append({
+        "twins": twins, "relationships": relationships, "invalid": invalid,
+        "json MB": os.path.getsize(path) / 1e6, "write s": write_seconds, "validate s": validate_seconds,
+        "load s": load_seconds, "blob MB": len(blob) / 1e6, "to_bytes s": serialize_seconds,
+        "from_bytes s": deserialize_seconds,
+        "site_of us": site_seconds / args.lookups * 1e6,
+        "ancestors us": ancestor_seconds / args.lookups * 1e6,
+        "downstream us": downstream_seconds / args.lookups * 1e6,
+      })
+  print_table(results, [
+    "twins", "relationships", "invalid", "json MB", "write s", "validate s", "load s", "blob MB",
+    "to_bytes s", "from_bytes s", "site_of us", "ancestors us", "downstream us",
+  ])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,63 @@
+"""
+Reusable building blocks for the Databricks + Azure Digital Twins demo notebooks.
+
+The main entry points can be imported from the package itself (`from digital_twin import
+TwinPatchPublisher`); their modules are only imported on first access, and heavy dependencies
+(pyspark, mlflow, azure, pandas, pyarrow) only when a function that needs them runs, so importing
+the package stays cheap for a cold-starting job.
+"""
+
+import importlib
+
+_EXPORTS = {
+  # ingestion
+  "read_landing_zone": "ingestion",
+  "read_message_stream": "ingestion",
+  "stamp_ingestion": "latency",
+  # scoring
+  "FaultClassifier": "inference",
+  "load_model": "inference",
+  "stage_model": "inference",
+  "with_fault_predictions": "inference",
+  "Debouncer": "debounce",
+  "debounce_predictions": "debounce",
+  # publishing
+  "TwinPatchPublisher": "publisher",
+  "component_health_states": "publisher",
+  "ConcurrentTwinWriter": "writer",
+  "pooled_client": "writer",
+  "publish_from_executors": "writer",
+  "TwinCache": "twin_cache",
+  "DeltaTwinMirror": "mirror",
+  "FaultPropagator": "propagation",
+  # data generation and analysis
+  "TelemetryGenerator": "generation",
+  "UploadSimulator": "simulator",
+  "FleetAnomalyDetector": "anomaly",
+  "DeltaRollups": "rollups",
+  # graph, models and reference artifacts
+  "TwinGraphStore": "graph",
+  "ModelRegistry": "dtdl",
+  "load_models": "resources",
+  "load_twin_graph": "resources",
+  "cached_artifact": "resources",
+  # operations
+  "EdgePipeline": "edge",
+  "PipelineLatency": "latency",
+  "StartupTimer": "startup",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+  module = _EXPORTS.get(name)
+  if module is None:
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+  value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+  globals()[name] = value  # later lookups skip __getattr__
+  return value
+
+
+def __dir__():
+  return sorted(set(globals()) | set(_EXPORTS))
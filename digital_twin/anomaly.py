@@ -0,0 +1,219 @@
+"""
+Fleet-wide anomaly detection for station telemetry (root cause analysis).
+
+Every station's signals are cut into tumbling windows (one generator period by default) and each
+window is summarised at once for the whole fleet with array arithmetic:
+
+- `cv`: standard deviation relative to the signal's mean, so stations with different set points compare
+- `peak_ratio`: the strongest Welch spectral peak (Hann segments, 50% overlap) over the median power
+- `harmonic_ratio`: power at the third harmonic of that peak relative to the peak, about 1/9 for a
+  square wave and noise level for a sine
+
+Windows are then compared across the fleet: per signal and window, each metric's robust z-score
+(median / MAD over all stations) and the variance ratio against the fleet median. A window's `score`
+is its largest positive z-score; stations and signals are ranked by how many of their windows are
+anomalous. `spark_anomaly_scores` runs the same pandas functions as grouped `applyInPandas` stages.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from digital_twin.generation import SAMPLES_PER_PERIOD
+
+METRIC_COLUMNS = ["cv", "peak_ratio", "harmonic_ratio", "peak_frequency"]
+SCORE_COLUMNS = ["variance_ratio", "z_cv", "z_peak", "z_harmonic", "score"]
+SUSPECT_COLUMNS = [
+  "rank", "station_id", "signal", "windows", "anomalous_windows", "anomalous_fraction",
+  "max_score", "mean_score", "median_variance_ratio", "first_anomalous_window",
+]
+_MAD_SCALE = 1.4826  # MAD of a normal distribution -> standard deviation
+_EPSILON = 1e-12
+
+
+def window_metrics(samples, window=SAMPLES_PER_PERIOD, segment=None):
+  """
+  Metrics of every complete tumbling window of a `(stations, samples)` array. Returns
+  `{metric: float32[stations, windows]}`; `peak_frequency` is in cycles per window.
+  """
+  x = np.atleast_2d(np.asarray(samples, dtype=np.float64))
+  n_windows = x.shape[1] // window
+  segment = segment or window // 4
+  blocks = x[:, :n_windows * window].reshape(x.shape[0], n_windows, window)
+
+  mean = blocks.mean(axis=-1)
+  sd = blocks.std(axis=-1, ddof=1)
+
+  # Welch: Hann-windowed, mean-removed segments with 50% overlap, averaged periodograms
+  segments = np.lib.stride_tricks.sliding_window_view(blocks, segment, axis=-1)[..., ::segment // 2, :]
+  segments = (segments - segments.mean(axis=-1, keepdims=True)) * np.hanning(segment)
+  power = np.abs(np.fft.rfft(segments, axis=-1)) ** 2
+  psd = power.mean(axis=-2)[..., 1:]  # drop the DC bin
+
+  peak = psd.argmax(axis=-1)
+  peak_power = np.take_along_axis(psd, peak[..., None], axis=-1)[..., 0]
+  third = np.minimum(3 * (peak + 1) - 1, psd.shape[-1] - 1)  # bin index of the third harmonic
+  around = np.stack([np.take_along_axis(psd, np.clip(third + d, 0, psd.shape[-1] - 1)[..., None], axis=-1)[..., 0] for d in (-1, 0, 1)])
+  with np.errstate(divide="ignore", invalid="ignore"):
+    metrics = {
+      "cv": sd / np.abs(mean),
+      "peak_ratio": peak_power / np.maximum(np.median(psd, axis=-1), _EPSILON),
+      "harmonic_ratio": np.where(3 * (peak + 1) <= psd.shape[-1], around.max(axis=0) / np.maximum(peak_power, _EPSILON), np.nan),
+      "peak_frequency": (peak + 1) * window / segment,
+    }
+  return {name: values.astype(np.float32) for name, values in metrics.items()}
+
+
+def metrics_frame(station_ids, arrays, first_sample=0, window=SAMPLES_PER_PERIOD, segment=None):
+  """
+  Long pandas DataFrame (`station_id`, `signal`, `window_start`, `METRIC_COLUMNS`) of `window_metrics`
+  for `{signal: array[stations, samples]}`, e.g. `TelemetryGenerator.chunk_arrays`.
+  """
+  import pandas as pd
+
+  frames = []
+  for signal, samples in arrays.items():
+    metrics = window_metrics(samples, window, segment)
+    n_stations, n_windows = metrics["cv"].shape
+    frame = pd.DataFrame({name: values.ravel() for name, values in metrics.items()})
+    frame.insert(0, "window_start", np.tile(first_sample + np.arange(n_windows, dtype=np.int64) * window, n_stations))
+    frame.insert(0, "signal", signal)
+    frame.insert(0, "station_id", np.repeat(np.asarray(station_ids, dtype=object), n_windows))
+    frames.append(frame)
+  if not frames:
+    return pd.DataFrame(columns=["station_id", "signal", "window_start"] + METRIC_COLUMNS)
+  return pd.concat(frames, ignore_index=True)
+
+
+def _robust_z(values, groups):
+  median = values.groupby(groups).transform("median")
+  mad = (values - median).abs().groupby(groups).transform("median")
+  return (values - median) / np.maximum(_MAD_SCALE * mad, _EPSILON)
+
+
+def fleet_scores(metrics, min_stations=3):
+  """
+  Cross-station scores for a `metrics_frame`: within each `(signal, window_start)`, the variance ratio
+  against the fleet median and robust z-scores of log `cv`, `peak_ratio` and `harmonic_ratio`.
+  Windows seen by fewer than `min_stations` stations get a NaN score.
+  """
+  scores = metrics.copy()
+  groups = [scores["signal"], scores["window_start"]]
+  log_cv = np.log(scores["cv"].astype(np.float64).clip(lower=_EPSILON))
+  scores["variance_ratio"] = np.exp(2 * (log_cv - log_cv.groupby(groups).transform("median")))
+  scores["z_cv"] = _robust_z(log_cv, groups)
+  scores["z_peak"] = _robust_z(np.log(scores["peak_ratio"].astype(np.float64).clip(lower=_EPSILON)), groups)
+  scores["z_harmonic"] = _robust_z(np.log(scores["harmonic_ratio"].astype(np.float64).clip(lower=_EPSILON)), groups)
+  scores["score"] = scores[["z_cv", "z_peak", "z_harmonic"]].max(axis=1).clip(lower=0.0)
+  stations = scores["station_id"].groupby(groups).transform("size")
+  scores.loc[stations < min_stations, "score"] = np.nan
+  return scores
+
+
+def rank_suspects(scores, threshold=6.0, top=None):
+  """Stations and signals ordered by their share of anomalous windows (score above `threshold`), then by peak score."""
+  scores = scores.assign(_anomalous=scores["score"] > threshold)
+  scores["_first"] = scores["window_start"].where(scores["_anomalous"])
+  suspects = scores.groupby(["station_id", "signal"], sort=False, observed=True).agg(
+    windows=("score", "size"),
+    anomalous_windows=("_anomalous", "sum"),
+    max_score=("score", "max"),
+    mean_score=("score", "mean"),
+    median_variance_ratio=("variance_ratio", "median"),
+    first_anomalous_window=("_first", "min"),
+  ).reset_index()
+  suspects["anomalous_fraction"] = suspects["anomalous_windows"] / suspects["windows"]
+  suspects["first_anomalous_window"] = suspects["first_anomalous_window"].astype("Int64")
+  suspects = suspects.sort_values(["anomalous_fraction", "max_score"], ascending=False, ignore_index=True)
+  suspects.insert(0, "rank", np.arange(1, len(suspects) + 1))
+  suspects = suspects[SUSPECT_COLUMNS]
+  return suspects if top is None else suspects.head(top)
+
+
+@dataclass(frozen=True)
+class FleetAnomalyDetector:
+  """
+  `window` samples per scored window (one `TelemetryGenerator` period by default), Welch `segment`
+  length (a quarter window by default) and the `threshold` above which a window counts as anomalous.
+  """
+  window: int = SAMPLES_PER_PERIOD
+  segment: int = None
+  threshold: float = 6.0
+  min_stations: int = 3
+
+  def metrics(self, station_ids, arrays, first_sample=0):
+    return metrics_frame(station_ids, arrays, first_sample, self.window, self.segment)
+
+  def scores(self, metrics):
+    return fleet_scores(metrics, self.min_stations)
+
+  def suspects(self, scores, top=None):
+    return rank_suspects(scores, self.threshold, top)
+
+  def detect_generator(self, generator, top=None):
+    """`(scores, suspects)` for all data of a `TelemetryGenerator`, computed chunk by chunk."""
+    import pandas as pd
+
+    metrics = pd.concat(
+      [self.metrics(generator.stations, arrays, first_sample) for first_sample, arrays in
+       (generator.chunk_arrays(chunk) for chunk in range(generator.n_chunks))],
+      ignore_index=True,
+    )
+    scores = self.scores(metrics)
+    return scores, self.suspects(scores, top)
+
+
+# --- Spark ------------------------------------------------------------------------------------
+
+
+def spark_anomaly_scores(df, signals, detector=FleetAnomalyDetector(), windows_per_group=100):
+  """
+  Window scores for a long telemetry DataFrame (`station_id`, `_index`, one column per signal), e.g. a
+  `battery_coating_analysis` table or `generation.spark_telemetry` output, in two grouped stages:
+  per station and block of `windows_per_group` windows, the spectral metrics; per window, the fleet
+  comparison. Returns `station_id, signal, window_start` plus `METRIC_COLUMNS` and `SCORE_COLUMNS`.
+  """
+  import pyspark.sql.functions as F
+
+  signals = list(signals)
+  window = detector.window
+  block_size = window * windows_per_group
+  metrics_schema = "station_id string, signal string, window_start long, " + ", ".join(f"{c} float" for c in METRIC_COLUMNS)
+  scores_schema = metrics_schema + ", " + ", ".join(f"{c} double" for c in SCORE_COLUMNS)
+
+  def block_metrics(block):
+    block = block.sort_values("_index")
+    first_sample = int(block["_index"].iloc[0])
+    first_window = -(-first_sample // window) * window  # skip a partial leading window
+    block = block[block["_index"] >= first_window]
+    arrays = {signal: block[signal].to_numpy(dtype=np.float64)[None, :] for signal in signals}
+    return detector.metrics([block["station_id"].iloc[0]], arrays, first_window)
+
+  def window_scores(metrics):
+    return detector.scores(metrics)[["station_id", "signal", "window_start"] + METRIC_COLUMNS + SCORE_COLUMNS]
+
+  metrics = (
+    df
+      .select("station_id", "_index", *signals)
+      .groupBy("station_id", F.floor(F.col("_index") / block_size).alias("_block"))
+      .applyInPandas(block_metrics, metrics_schema)
+  )
+  return metrics.groupBy("window_start").applyInPandas(window_scores, scores_schema)
+
+
+def spark_suspects(scores, threshold=FleetAnomalyDetector.threshold):
+  """`rank_suspects` of `spark_anomaly_scores`, aggregated in Spark (one row per station and signal)."""
+  import pyspark.sql.functions as F
+  from pyspark.sql.window import Window
+
+  anomalous = F.col("score") > threshold
+  suspects = scores.groupBy("station_id", "signal").agg(
+    F.count(F.lit(1)).alias("windows"),
+    F.sum(anomalous.cast("long")).alias("anomalous_windows"),
+    F.max("score").alias("max_score"),
+    F.avg("score").alias("mean_score"),
+    F.percentile_approx("variance_ratio", 0.5).alias("median_variance_ratio"),
+    F.min(F.when(anomalous, F.col("window_start"))).alias("first_anomalous_window"),
+  ).withColumn("anomalous_fraction", F.col("anomalous_windows") / F.col("windows"))
+  order = Window.orderBy(F.desc("anomalous_fraction"), F.desc("max_score"))
+  return suspects.withColumn("rank", F.row_number().over(order)).select(*SUSPECT_COLUMNS).orderBy("rank")
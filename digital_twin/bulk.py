@@ -0,0 +1,341 @@
+"""
+Bulk loading and export of twin graphs.
+
+`write_import_file` converts models plus an ADT Explorer export (`twins/TwinGraph.json`) into the
+NDJSON layout of the ADT Import Jobs API (`Header`, `Models`, `Twins` and `Relationships` sections,
+one JSON document per line). The twins and relationships are streamed from the source JSON, so the
+graph is never held in memory. The file can be uploaded to blob storage and imported with
+`submit_import_job`, or loaded through the regular API by `bulk_upsert`: models in dependency order,
+then twins, then relationships, each on a bounded thread pool with rate limiting and retries.
+
+ADT models are immutable, so an instance loaded from an earlier version of `models/` keeps its twins
+on the old model ids: `migrate_twin_models` uploads the current models and moves those twins onto them.
+"""
+
+import itertools
+import json
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from digital_twin.dtdl import dependency_order
+from digital_twin.resources import TWIN_GRAPH_PATH, load_models
+from digital_twin.writer import ADT_API_REQUESTS_PER_SECOND, ConcurrentTwinWriter
+
+HEADER, MODELS, TWINS, RELATIONSHIPS = "Header", "Models", "Twins", "Relationships"
+FILE_VERSION = "1.0.0"
+IMPORT_JOBS_API_VERSION = "2023-10-31"
+MAX_MODELS_PER_CALL = 250  # ADT limit for one create_models call
+CHUNK_SIZE = 1 << 16
+_ELEMENT_END = re.compile(r"\s*[,\]]")
+
+
+def iter_json_array(path, key, chunk_size=CHUNK_SIZE):
+  """
+  Stream the elements of the first array stored under `"key"` in a JSON file, one decoded element
+  at a time, reading `chunk_size` characters at a time.
+  """
+  decoder = json.JSONDecoder()
+  start = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+  with open(path, encoding="utf-8") as f:
+    buffer, position, eof = "", 0, False
+
+    def fill():  # the consumed part of the buffer is dropped here, once per chunk, not per element
+      nonlocal buffer, position, eof
+      chunk = f.read(chunk_size)
+      eof = not chunk
+      if chunk:
+        buffer, position = buffer[position:] + chunk, 0
+      return not eof
+
+    while True:  # find the array
+      match = start.search(buffer)
+      if match:
+        position = match.end()
+        break
+      position = max(len(buffer) - (len(key) + 64), 0)  # keep enough to match a key split across chunks
+      if not fill():
+        return
+
+    while True:
+      while True:  # skip separators, refilling as needed
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+          position += 1
+        if position < len(buffer) or not fill():
+          break
+      if position >= len(buffer) or buffer[position] == "]":
+        return
+      try:
+        element, end = decoder.raw_decode(buffer, position)
+      except json.JSONDecodeError:
+        if not fill():
+          raise
+        continue  # element was cut off by the end of the buffer: retry with more data
+      if not _ELEMENT_END.match(buffer, end):
+        if fill():
+          continue  # only a delimiter ends an element: a number may go on in the next chunk
+        raise json.JSONDecodeError("Expecting ',' delimiter", buffer, end)
+      yield element
+      position = end
+
+
+def import_twin(twin):
+  """An exported twin in import form: no etags, and no property metadata besides the model."""
+  def clean(value):
+    if isinstance(value, dict):
+      return {
+        key: ({} if key == "$metadata" else clean(item))
+        for key, item in value.items() if key != "$etag"
+      }
+    return value
+
+  document = clean(twin)
+  document["$metadata"] = {"$model": twin["$metadata"]["$model"]}
+  return document
+
+
+def import_relationship(relationship):
+  """An exported relationship in import form: keyed by its source's `$dtId`, without etag."""
+  document = {key: value for key, value in relationship.items() if key not in ("$etag", "$sourceId")}
+  return {"$dtId": relationship["$sourceId"], **document}
+
+
+def twin_graph_sections(twin_graph_path=TWIN_GRAPH_PATH, models=None):
+  """`(section, document)` pairs for `models` (default: `models/*.json`) and a streamed TwinGraph.json export."""
+  for model in (load_models() if models is None else models):
+    yield MODELS, model
+  for twin in iter_json_array(twin_graph_path, "digitalTwins"):
+    yield TWINS, import_twin(twin)
+  for relationship in iter_json_array(twin_graph_path, "relationships"):
+    yield RELATIONSHIPS, import_relationship(relationship)
+
+
+def write_import_file(out, sections, author=None, organization=None):
+  """
+  Write `(section, document)` pairs (sections in Models, Twins, Relationships order) as an import
+  NDJSON file to the text stream `out`. Returns the number of documents per section.
+  """
+  header = {"fileVersion": FILE_VERSION}
+  header.update({key: value for key, value in (("author", author), ("organization", organization)) if value})
+  out.write(json.dumps({"Section": HEADER}) + "\n" + json.dumps(header) + "\n")
+  counts, current = {}, None
+  for section, document in sections:
+    if section != current:
+      out.write(json.dumps({"Section": section}) + "\n")
+      current = section
+    out.write(json.dumps(document, separators=(",", ":")) + "\n")
+    counts[section] = counts.get(section, 0) + 1
+  return counts
+
+
+def read_import_file(lines):
+  """Stream `(section, document)` pairs back from the lines of an import NDJSON file."""
+  section = None
+  for line in lines:
+    line = line.strip()
+    if not line:
+      continue
+    document = json.loads(line)
+    if set(document) == {"Section"}:
+      section = document["Section"]
+    elif section != HEADER:
+      yield section, document
+
+
+def export_sections(client, max_workers=16):
+  """`(section, document)` pairs of everything in an ADT instance (or the emulator), in import form."""
+  for model in client.list_models(include_model_definition=True):
+    yield MODELS, model["model"] if isinstance(model, dict) else model.model
+  twin_ids = []
+  for twin in client.query_twins("SELECT * FROM digitaltwins"):
+    twin_ids.append(twin["$dtId"])
+    yield TWINS, import_twin(twin)
+  with ThreadPoolExecutor(max_workers=max_workers) as pool:
+    for relationships in pool.map(lambda twin_id: list(client.list_relationships(twin_id)), twin_ids):
+      for relationship in relationships:
+        yield RELATIONSHIPS, import_relationship(relationship)
+
+
+@dataclass
+class BulkLoadStats:
+  models: int = 0
+  twins: int = 0
+  relationships: int = 0
+  seconds: dict = field(default_factory=dict)  # phase -> seconds
+  failures: list = field(default_factory=list)  # (section, id, error), first `max_failures` only
+  failed: int = 0
+
+  def per_second(self, section):
+    count = {MODELS: self.models, TWINS: self.twins, RELATIONSHIPS: self.relationships}[section]
+    seconds = self.seconds.get(section)
+    return count / seconds if seconds else float("nan")
+
+
+def _bounded_map(pool, fn, items, limit):
+  """Like `pool.map`, but keeps at most `limit` calls in flight so `items` can be an unbounded stream."""
+  in_flight = {}
+  for item in items:
+    if len(in_flight) >= limit:
+      done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+      for future in done:
+        yield in_flight.pop(future), future.exception()
+    in_flight[pool.submit(fn, item)] = item
+  for future in list(in_flight):
+    yield in_flight.pop(future), future.exception()
+
+
+def bulk_upsert(client, sections, max_workers=16, rate_per_second=ADT_API_REQUESTS_PER_SECOND,
+                skip_existing_models=True, max_failures=100):
+  """
+  Parallel fallback for environments without Import Jobs. `sections` is a `(section, document)`
+  stream as produced by `twin_graph_sections` or `read_import_file`: models are created level by
+  level in dependency order, then twins and relationships are upserted concurrently as they stream
+  in (relationships only once every twin exists). Models already in the instance are skipped by id:
+  ADT models are immutable, so a changed definition must be published under a new version. Returns
+  BulkLoadStats.
+  """
+  writer = ConcurrentTwinWriter(client, max_workers=max_workers, rate_per_second=rate_per_second)
+  stats = BulkLoadStats()
+
+  def fail(section, document_id, error):
+    stats.failed += 1
+    if len(stats.failures) < max_failures:
+      stats.failures.append((section, document_id, error))
+
+  def upsert_twin(twin):
+    writer.call(client.upsert_digital_twin, twin["$dtId"], {k: v for k, v in twin.items() if k != "$dtId"})
+
+  def upsert_relationship(relationship):
+    body = {k: v for k, v in relationship.items() if k != "$dtId"}
+    writer.call(client.upsert_relationship, relationship["$dtId"], relationship["$relationshipId"], body)
+
+  sections = iter(sections)
+  models, first_streamed = [], None
+  for section, document in sections:
+    if section != MODELS:
+      first_streamed = (section, document)
+      break
+    models.append(document)
+
+  started = time.perf_counter()
+  if skip_existing_models and models:
+    listed = writer.call(lambda: list(client.list_models()))  # pages are fetched while iterating: retry all of it
+    existing = {model["id"] if isinstance(model, dict) else model.id for model in listed}
+    models = [model for model in models if model["@id"] not in existing]
+  for level in dependency_order(models):
+    for i in range(0, len(level), MAX_MODELS_PER_CALL):
+      batch = level[i:i + MAX_MODELS_PER_CALL]
+      try:
+        writer.call(client.create_models, batch)
+        stats.models += len(batch)
+      except Exception as error:
+        fail(MODELS, batch[0]["@id"], error)
+        raise RuntimeError(f"Creating models failed, first was {batch[0]['@id']}") from error
+  stats.seconds[MODELS] = time.perf_counter() - started
+
+  limit = max_workers * 4
+  relationships = []
+
+  # a plain iterator (not a generator) so stopping at the first relationship doesn't close `sections`
+  streamed = itertools.chain([first_streamed] if first_streamed else [], sections)
+
+  def twins():
+    for section, document in streamed:
+      if section == RELATIONSHIPS:
+        relationships.append(document)  # relationships start: every twin has been submitted
+        return
+      if section == TWINS:
+        yield document
+
+  def remaining_relationships():
+    yield from relationships
+    for section, document in sections:
+      if section == RELATIONSHIPS:
+        yield document
+
+  with ThreadPoolExecutor(max_workers=max_workers) as pool:
+    phase_started = time.perf_counter()
+    for document, error in _bounded_map(pool, upsert_twin, twins(), limit):
+      if error is None:
+        stats.twins += 1
+      else:
+        fail(TWINS, document["$dtId"], error)
+    stats.seconds[TWINS] = time.perf_counter() - phase_started
+
+    phase_started = time.perf_counter()
+    for document, error in _bounded_map(pool, upsert_relationship, remaining_relationships(), limit):
+      if error is None:
+        stats.relationships += 1
+      else:
+        fail(RELATIONSHIPS, document["$relationshipId"], error)
+    stats.seconds[RELATIONSHIPS] = time.perf_counter() - phase_started
+  return stats
+
+
+def _model_version(model_id):
+  base, _, version = model_id.rpartition(";")
+  return base, int(version)
+
+
+def migrate_twin_models(client, models=None, max_workers=16, rate_per_second=ADT_API_REQUESTS_PER_SECOND):
+  """
+  Move the twins of an existing instance onto the versions of `models` (default: `models/*.json`).
+  The models missing from the instance are created first, then every twin whose model is an older
+  version of one of them gets a `replace /$metadata/$model` patch; until then ADT validates the twin's
+  patches against the old definition, whatever `dtdl.ModelRegistry` accepted. Safe to re-run.
+  Returns `{twin_id: error_or_None}` for the twins migrated.
+  """
+  models = load_models() if models is None else list(models)
+  bulk_upsert(client, ((MODELS, model) for model in models), max_workers=max_workers, rate_per_second=rate_per_second)
+  latest = {}
+  for model in models:
+    base, version = _model_version(model["@id"])
+    if version > latest.get(base, (0, None))[0]:
+      latest[base] = (version, model["@id"])
+
+  writer = ConcurrentTwinWriter(client, max_workers=max_workers, rate_per_second=rate_per_second)
+  updates = []
+  for twin in writer.call(lambda: list(client.query_twins("SELECT * FROM digitaltwins"))):
+    base, version = _model_version(twin["$metadata"]["$model"])
+    if base in latest and version < latest[base][0]:
+      updates.append((twin["$dtId"], [{"op": "replace", "path": "/$metadata/$model", "value": latest[base][1]}]))
+  return writer.write_many(updates)
+
+
+def submit_import_job(adt_url, input_blob_uri, output_blob_uri, credential, job_id=None, session=None):
+  """
+  Start an ADT Import Job for an import NDJSON file already uploaded to `input_blob_uri`; the job
+  writes its log to `output_blob_uri`. Returns the job resource (poll it with `import_job`).
+  """
+  import uuid
+
+  import requests
+
+  job_id = job_id or f"import-{uuid.uuid4()}"
+  response = (session or requests).put(
+    f"https://{adt_url}/jobs/imports/{job_id}",
+    params={"api-version": IMPORT_JOBS_API_VERSION},
+    headers=_auth_headers(credential),
+    json={"inputBlobUri": input_blob_uri, "outputBlobUri": output_blob_uri},
+  )
+  response.raise_for_status()
+  return response.json()
+
+
+def import_job(adt_url, job_id, credential, session=None):
+  """Current state of an import job (`status` is notstarted, running, succeeded, failed, ...)."""
+  import requests
+
+  response = (session or requests).get(
+    f"https://{adt_url}/jobs/imports/{job_id}",
+    params={"api-version": IMPORT_JOBS_API_VERSION},
+    headers=_auth_headers(credential),
+  )
+  response.raise_for_status()
+  return response.json()
+
+
+def _auth_headers(credential):
+  token = credential.get_token("https://digitaltwins.azure.net/.default").token
+  return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,163 @@
+"""
+Per-station debouncing of the prediction stream.
+
+Readings are mostly repeats of the same state, and a single noisy reading should not flip a twin.
+A `Debouncer` confirms a new label only once it makes up at least `n` of a station's last `m`
+readings (hysteresis), and emits a row only for confirmed transitions, plus a heartbeat repeating
+the confirmed label when nothing has been emitted for `heartbeat_seconds`. The same logic runs on
+pandas (`run`) and in Structured Streaming (`debounce_predictions`, via `applyInPandasWithState`),
+where per-station state is evicted after `ttl_seconds` without readings.
+"""
+
+from collections import Counter
+from dataclasses import dataclass
+
+TRANSITION = "transition"
+HEARTBEAT = "heartbeat"
+
+# Spark state per station: confirmed label, last m labels, and epoch milliseconds of the last emit and last reading
+STATE_SCHEMA_DDL = "confirmed string, recent array<string>, last_emitted_ms long, last_seen_ms long"
+
+
+def _epoch_ms(times):
+  """Epoch milliseconds of a pandas Series of timestamps, whatever its resolution or time zone."""
+  import pandas as pd
+
+  times = pd.to_datetime(times, utc=True)
+  return ((times - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(milliseconds=1)).to_numpy()
+
+
+def _carried(readings, label_column, carry_columns, emits):
+  """
+  Values of `carry_columns` (e.g. the prediction probability) for each emit, taken from the reading
+  that caused it; a heartbeat caused by a reading of another label carries None.
+  """
+  labels = readings[label_column].to_numpy()
+  columns = [readings[column].to_numpy() for column in carry_columns]
+  return [
+    tuple(values[position] if labels[position] == label else None for values in columns)
+    for label, _, _, position in emits
+  ]
+
+
+@dataclass(frozen=True)
+class Debouncer:
+  n: int = 4
+  m: int = 5
+  heartbeat_seconds: float = 300.0
+  ttl_seconds: float = 3600.0
+
+  def __post_init__(self):
+    if not 0 < self.n <= self.m:
+      raise ValueError("hysteresis needs 0 < n <= m")
+
+  def confirm(self, confirmed, recent):
+    """The label `recent` readings confirm: the most frequent one once it reaches `n`, else the current one."""
+    if not recent:
+      return confirmed
+    label, count = Counter(recent).most_common(1)[0]
+    return label if count >= self.n else confirmed
+
+  def step(self, state, labels, times_ms):
+    """
+    Feed one station's readings (ordered by time) to its `state` tuple (None for a new station).
+    Returns the new state and a list of `(label, time_ms, reason, position)` emits, where `position`
+    is the index of the reading that caused the emit.
+    """
+    confirmed, recent, last_emitted, last_seen = state or (None, [], None, None)
+    recent = list(recent)
+    heartbeat_ms = self.heartbeat_seconds * 1000
+    emits = []
+    for position, (label, time_ms) in enumerate(zip(labels, times_ms)):
+      recent.append(label)
+      del recent[:-self.m]
+      label = self.confirm(confirmed, recent)
+      if label != confirmed:
+        confirmed, last_emitted = label, time_ms
+        emits.append((label, time_ms, TRANSITION, position))
+      elif confirmed is not None and time_ms - last_emitted >= heartbeat_ms:
+        last_emitted = time_ms
+        emits.append((confirmed, time_ms, HEARTBEAT, position))
+      last_seen = time_ms if last_seen is None else max(last_seen, time_ms)
+    return (confirmed, recent, last_emitted, last_seen), emits
+
+  def run(self, frame, key_column="station_id", label_column="prediction", time_column="event_time", states=None,
+          carry_columns=()):
+    """
+    Debounce a pandas DataFrame of readings. `states` (`{station: state}`, updated in place) carries
+    state across calls; returns a DataFrame of emits with the key, label and time columns plus `reason`
+    and the `carry_columns` of the reading behind each emit.
+    """
+    import pandas as pd
+
+    states = {} if states is None else states
+    rows = []
+    frame = frame.sort_values(time_column, kind="stable")
+    times_ms = _epoch_ms(frame[time_column])
+    labels = frame[label_column].to_numpy()
+    for key, positions in frame.groupby(key_column, sort=False).indices.items():
+      states[key], emits = self.step(states.get(key), labels[positions], times_ms[positions])
+      carried = _carried(frame.iloc[positions], label_column, carry_columns, emits)
+      rows.extend((key, label, time_ms, reason, *values) for (label, time_ms, reason, _), values in zip(emits, carried))
+    emitted = pd.DataFrame(rows, columns=[key_column, label_column, time_column, "reason", *carry_columns])
+    emitted[time_column] = pd.to_datetime(emitted[time_column], unit="ms", utc=True)
+    return emitted.sort_values(time_column, kind="stable", ignore_index=True)
+
+
+def debounce_predictions(df, debouncer=Debouncer(), key_column="station_id", label_column="prediction",
+                         time_column="event_time", watermark="10 minutes", carry_columns=()):
+  """
+  Streaming transitions and heartbeats of `df`'s predictions, keyed by `key_column`, with the
+  `carry_columns` of the reading behind each emit (e.g. `fault_class` and `fault_probability`).
+
+  Uses `applyInPandasWithState` with an event-time watermark on `time_column`; a station's state is
+  dropped once the watermark passes `ttl_seconds` after its last reading, so state stays bounded.
+  """
+  from pyspark.sql.streaming.state import GroupStateTimeout
+
+  carry_columns = list(carry_columns)
+  output_schema = ", ".join(
+    [f"{key_column} string, {label_column} string, {time_column} timestamp, reason string"]
+    + [f"{column} {df.schema[column].dataType.simpleString()}" for column in carry_columns]
+  )
+
+  debounce = _group_state_function(debouncer, key_column, label_column, time_column, carry_columns)
+  return (
+    df
+      .select(key_column, label_column, time_column, *carry_columns)
+      .withWatermark(time_column, watermark)
+      .groupBy(key_column)
+      .applyInPandasWithState(debounce, output_schema, STATE_SCHEMA_DDL, "append", GroupStateTimeout.EventTimeTimeout)
+  )
+
+
+def _group_state_function(debouncer, key_column, label_column, time_column, carry_columns):
+  """
+  The `applyInPandasWithState` function of `debounce_predictions`: debounces one station's batch into
+  its `GroupState` and sets an event-time timeout `ttl_seconds` after its last reading.
+  """
+  import pandas as pd
+
+  ttl_ms = int(debouncer.ttl_seconds * 1000)
+
+  def debounce(key, batches, state):
+    if state.hasTimedOut:
+      state.remove()  # station went silent: evict its state
+      return
+    frame = pd.concat(list(batches), ignore_index=True).sort_values(time_column, kind="stable")
+    times_ms = _epoch_ms(frame[time_column])
+    current, emits = debouncer.step(state.get if state.exists else None, frame[label_column].to_numpy(), times_ms)
+    confirmed, recent, last_emitted, last_seen = current
+    state.update((confirmed, list(recent), None if last_emitted is None else int(last_emitted), int(last_seen)))
+    state.setTimeoutTimestamp(max(int(last_seen) + ttl_ms, state.getCurrentWatermarkMs() + 1))
+    if emits:
+      carried = _carried(frame, label_column, carry_columns, emits)
+      yield pd.DataFrame({
+        key_column: key[0],
+        label_column: [label for label, _, _, _ in emits],
+        time_column: pd.to_datetime([time_ms for _, time_ms, _, _ in emits], unit="ms", utc=True),
+        "reason": [reason for _, _, reason, _ in emits],
+        **{column: [values[i] for values in carried] for i, column in enumerate(carry_columns)},
+      })
+
+  return debounce
@@ -0,0 +1,279 @@
+"""
+Compiled DTDL v2 model registry for validating twin patches before they are sent.
+
+`ModelRegistry` loads the interfaces in `models/*.json` once, resolves `extends` chains, components
+and schemas (including named ones from an interface's `schemas` section, such as the
+`production_step:status` Enum), and flattens every model into a `ModelValidator`: a dict from each
+JSON pointer a patch may target (`/HealthPrediction`, `/BallBearings/faultPredicted`, `/GeoLocation/Latitude`, ...)
+to a precompiled `PropertySpec`. Validating a patch is then one dict lookup and one type check per
+operation, so whole micro-batches can be checked locally instead of being rejected by ADT one
+request at a time.
+"""
+
+import math
+import re
+from dataclasses import dataclass
+
+_DATE = r"\d{4}-\d{2}-\d{2}"
+_TIME = r"\d{2}:\d{2}:\d{2}(\.\d+)?"
+_ZONE = r"(Z|[+-]\d{2}:\d{2})?"
+_TEMPORAL_PATTERNS = {
+  "date": re.compile(f"^{_DATE}$"),
+  "dateTime": re.compile(f"^{_DATE}T{_TIME}{_ZONE}$"),
+  "time": re.compile(f"^{_TIME}{_ZONE}$"),
+  "duration": re.compile(r"^P(?!$)(\d+Y)?(\d+M)?(\d+W)?(\d+D)?(T(?=\d)(\d+H)?(\d+M)?(\d+(\.\d+)?S)?)?$"),
+}
+_INTEGER_SCHEMAS = ("integer", "long")
+_NUMBER_SCHEMAS = ("double", "float")
+_PATCH_OPS = ("add", "replace", "remove", "test")
+
+
+def _as_list(value):
+  if value is None:
+    return []
+  return value if isinstance(value, list) else [value]
+
+
+def _escape(token):
+  return token.replace("~", "~0").replace("/", "~1")
+
+
+def _primitive_check(schema):
+  """A fast `value -> bool` check for a primitive DTDL schema name, or None if unknown."""
+  if schema == "boolean":
+    return lambda value: value is True or value is False
+  if schema == "string":
+    return lambda value: isinstance(value, str)
+  if schema in _INTEGER_SCHEMAS:
+    return lambda value: isinstance(value, int) and not isinstance(value, bool)
+  if schema in _NUMBER_SCHEMAS:
+    return lambda value: isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+  pattern = _TEMPORAL_PATTERNS.get(schema)
+  if pattern is not None:
+    return lambda value: isinstance(value, str) and pattern.match(value) is not None
+  return None
+
+
+def model_dependencies(model):
+  """Interfaces a model needs to exist before it can be created: the ones it extends and its component schemas."""
+  dependencies = set(_as_list(model.get("extends")))
+  for content in model.get("contents", []):
+    if "Component" in _as_list(content["@type"]) and isinstance(content["schema"], str):
+      dependencies.add(content["schema"])
+  return dependencies
+
+
+def dependency_order(models):
+  """
+  Models grouped into levels that can each be created in one call: every model's dependencies are in
+  earlier levels (or not in `models` at all, i.e. assumed to exist already). Raises ValueError on cycles.
+  """
+  pending = {model["@id"]: model for model in models}
+  levels = []
+  while pending:
+    level = [model for model in pending.values() if not model_dependencies(model) & pending.keys()]
+    if not level:
+      raise ValueError(f"Cyclic model dependencies between {sorted(pending)}")
+    levels.append(level)
+    for model in level:
+      del pending[model["@id"]]
+  return levels
+
+
+@dataclass(frozen=True)
+class PropertySpec:
+  """One patchable location of a model, with everything needed to check a value written to it."""
+  path: str
+  schema: str  # primitive schema name, or Enum / Object / Map / Array / Component
+  writable: bool = False
+  enum_values: frozenset = None
+  check: object = None  # value -> bool
+  component: str = None  # interface id, for components
+
+  def accepts(self, value):
+    return self.check(value)
+
+
+class ModelValidator:
+  """Flattened, precompiled view of one model: `paths` maps every patchable JSON pointer to its PropertySpec."""
+
+  def __init__(self, model_id, paths):
+    self.model_id = model_id
+    self.paths = paths
+
+  def validate(self, patch, require_writable=False):
+    """List of problems with an RFC 6902 `patch` (empty when it is valid)."""
+    errors = []
+    for operation in patch:
+      op, path = operation.get("op"), operation.get("path")
+      if op not in _PATCH_OPS:
+        errors.append(f"unsupported operation '{op}'")
+        continue
+      spec = self.paths.get(path)
+      if spec is None:
+        errors.append(f"'{path}' is not a property of {self.model_id}")
+        continue
+      if require_writable and op != "test" and not spec.writable:
+        errors.append(f"'{path}' is not writable")
+      if op == "remove":
+        continue
+      if "value" not in operation:
+        errors.append(f"'{op}' of '{path}' has no value")
+      elif not spec.accepts(operation["value"]):
+        expected = sorted(spec.enum_values) if spec.enum_values is not None else spec.schema
+        errors.append(f"{operation['value']!r} is not a valid {expected} for '{path}'")
+    return errors
+
+
+class ModelRegistry:
+  """DTDL interfaces by id, with per-model validators compiled on first use and cached."""
+
+  def __init__(self, models):
+    self.interfaces = {}
+    self.schemas = {}
+    for model in models:
+      self.interfaces[model["@id"]] = model
+      for schema in _as_list(model.get("schemas")):
+        self.schemas[schema["@id"]] = schema
+    self._validators = {}
+
+  @classmethod
+  def from_repo(cls):
+    """Registry of this repo's `models/*.json`."""
+    from digital_twin.resources import load_models
+    return cls(load_models())
+
+  def ancestors(self, model_id):
+    """`model_id` followed by every interface it extends, breadth first."""
+    chain, pending = [], [model_id]
+    while pending:
+      current = pending.pop(0)
+      if current in chain or current not in self.interfaces:
+        continue
+      chain.append(current)
+      pending.extend(_as_list(self.interfaces[current].get("extends")))
+    return chain
+
+  def is_of_model(self, model_id, base_model_id):
+    return base_model_id in self.ancestors(model_id)
+
+  def contents(self, model_id):
+    """Contents of `model_id` and its bases; a name declared by the model itself wins over inherited ones."""
+    contents = {}
+    for interface in self.ancestors(model_id):
+      for content in self.interfaces[interface].get("contents", []):
+        contents.setdefault(content["name"], content)
+    return list(contents.values())
+
+  def properties(self, model_id, schemas=None):
+    """Names of the Property/Telemetry contents of `model_id`, optionally only those with one of `schemas`."""
+    return [
+      content["name"] for content in self.contents(model_id)
+      if {"Property", "Telemetry"} & set(_as_list(content["@type"]))
+      and (schemas is None or content.get("schema") in schemas)
+    ]
+
+  def validator(self, model_id):
+    validator = self._validators.get(model_id)
+    if validator is None:
+      if model_id not in self.interfaces:
+        raise KeyError(f"Unknown model '{model_id}'")
+      paths = {}
+      self._compile_interface(model_id, "", True, paths)
+      validator = self._validators[model_id] = ModelValidator(model_id, paths)
+    return validator
+
+  def _compile_interface(self, model_id, prefix, top_level, paths):
+    for content in self.contents(model_id):
+      types = _as_list(content["@type"])
+      path = f"{prefix}/{_escape(content['name'])}"
+      if "Component" in types and top_level:  # DTDL v2 components cannot nest
+        component_paths = {}
+        self._compile_interface(content["schema"], path, False, component_paths)
+        paths[path] = self._component_spec(path, content["schema"], component_paths)
+        paths.update(component_paths)
+      elif "Property" in types:
+        self._compile_schema(path, content["schema"], content.get("writable", False), paths)
+
+  def _component_spec(self, path, interface_id, component_paths):
+    """A whole component may be written as one object of its (nested) properties plus `$metadata`."""
+    children = {p[len(path) + 1:]: spec for p, spec in component_paths.items() if "/" not in p[len(path) + 1:]}
+
+    def check(value):
+      return isinstance(value, dict) and all(
+        key == "$metadata" or (key in children and children[key].accepts(item)) for key, item in value.items()
+      )
+
+    return PropertySpec(path, "Component", writable=any(spec.writable for spec in children.values()),
+                        check=check, component=interface_id)
+
+  def _compile_schema(self, path, schema, writable, paths):
+    if isinstance(schema, str) and schema in self.schemas:
+      schema = self.schemas[schema]
+    if isinstance(schema, str):
+      check = _primitive_check(schema)
+      if check is None:
+        raise ValueError(f"Unsupported schema '{schema}' for '{path}'")
+      paths[path] = PropertySpec(path, schema, writable, check=check)
+      return paths[path]
+
+    kind = schema["@type"]
+    if kind == "Enum":
+      values = frozenset(item["enumValue"] for item in schema["enumValues"])
+      value_check = _primitive_check(schema["valueSchema"])
+      paths[path] = PropertySpec(path, "Enum", writable, enum_values=values,
+                                 check=lambda value: value_check(value) and value in values)
+    elif kind == "Object":
+      fields = {
+        field["name"]: self._compile_schema(f"{path}/{_escape(field['name'])}", field["schema"], writable, paths)
+        for field in schema["fields"]
+      }
+      paths[path] = PropertySpec(path, "Object", writable, check=lambda value: isinstance(value, dict) and all(
+        key in fields and fields[key].accepts(item) for key, item in value.items()
+      ))
+    elif kind == "Map":
+      value_spec = self._compile_schema(f"{path}/*", schema["mapValue"]["schema"], writable, {})
+      paths[path] = PropertySpec(path, "Map", writable, check=lambda value: isinstance(value, dict) and all(
+        isinstance(key, str) and value_spec.accepts(item) for key, item in value.items()
+      ))
+    elif kind == "Array":
+      item_spec = self._compile_schema(f"{path}/*", schema["elementSchema"], writable, {})
+      paths[path] = PropertySpec(path, "Array", writable, check=lambda value: isinstance(value, list) and all(
+        item_spec.accepts(item) for item in value
+      ))
+    else:
+      raise ValueError(f"Unsupported schema type '{kind}' for '{path}'")
+    return paths[path]
+
+  def validate(self, model_id, patch, require_writable=False):
+    return self.validator(model_id).validate(patch, require_writable)
+
+  def validate_twin(self, twin):
+    """Errors of a whole twin document (as in TwinGraph.json) against the model in its `$metadata`."""
+    model_id = twin.get("$metadata", {}).get("$model")
+    if model_id not in self.interfaces:
+      return [f"unknown model '{model_id}'"]
+    patch = [
+      {"op": "add", "path": "/" + _escape(key), "value": value}
+      for key, value in twin.items() if not key.startswith("$")
+    ]
+    return self.validator(model_id).validate(patch)
+
+  def validate_many(self, updates, model_of, require_writable=False):
+    """`{twin_id: errors}` for the invalid entries of `[(twin_id, patch), ...]`; `model_of` maps twin ids to model ids."""
+    invalid = {}
+    for twin_id, patch in updates:
+      model_id = model_of(twin_id)
+      if model_id is None:
+        invalid[twin_id] = [f"unknown twin '{twin_id}'"]
+        continue
+      errors = self.validator(model_id).validate(patch, require_writable)
+      if errors:
+        invalid[twin_id] = errors
+    return invalid
+
+  def patch_checker(self, model_of, require_writable=False):
+    """`validate_many` bound to a twin -> model lookup (e.g. `TwinGraphStore.model_of`), for `TwinPatchPublisher(validator=...)`."""
+    def check(updates):
+      return self.validate_many(updates, model_of, require_writable)
+    return check
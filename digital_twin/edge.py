@@ -0,0 +1,330 @@
+"""
+Single-node pipeline for edge boxes and small plants, without Spark.
+
+`EdgePipeline` runs the stages of the streaming notebook on one machine: it watches a local landing
+directory (`LandingWatcher`), parses new files with Arrow and scores them with the shared
+`inference.FaultClassifier` in a process pool (the model is loaded once per worker process), and
+publishes the results with the same `publisher.TwinPatchPublisher`, optionally behind the same
+`debounce.Debouncer`. Landing files are the simulator's CSV, NDJSON or Parquet layouts, read with
+the `schema` column definitions, and every record gets the `latency.STAGE_COLUMNS` stamps, so a
+`latency.PipelineLatency` reports the same per-stage histograms as the Spark path.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from digital_twin.inference import FaultClassifier
+from digital_twin.latency import SPARK_INTERVALS, STAGE_COLUMNS, STAGES, LatencyHistogram
+from digital_twin.publisher import PublishStats
+from digital_twin.schema import FAULT_CLASSES, FEATURE_COLUMNS, NORMAL_CLASS
+from digital_twin.simulator import LANDING_EXTENSIONS
+
+RECORD_COLUMNS = [
+  "fileName", "station_id", "device_id", "event_time", *(STAGE_COLUMNS[stage] for stage in STAGES if stage != "publish"),
+  "fault_class", "fault_probability",
+]
+CARRY_COLUMNS = ["fault_class", "fault_probability", STAGE_COLUMNS["upload"], STAGE_COLUMNS["score"]]
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def load_classifier(model):
+  """
+  `FaultClassifier` for `model`, loaded once per process: an `IncrementalFaultClassifier` checkpoint
+  (`.npz`), an MLflow model URI or local path (`inference.load_model`), or a fitted classifier.
+  """
+  if isinstance(model, FaultClassifier):
+    return model
+  if not isinstance(model, str):
+    return FaultClassifier(model)
+  if not model.endswith(".npz"):
+    from digital_twin.inference import load_model
+
+    return load_model(model)
+  with _classifiers_lock:
+    classifier = _classifiers.get(model)
+    if classifier is None:
+      from digital_twin.training import IncrementalFaultClassifier
+
+      classifier = _classifiers[model] = FaultClassifier(IncrementalFaultClassifier.load(model)[0])
+    return classifier
+
+
+# --- landing files ----------------------------------------------------------------------------
+
+
+class LandingWatcher:
+  """
+  New files of one landing format under `directory`. Files are remembered only within `grace_seconds`
+  of the newest modification time seen, so the bookkeeping stays bounded on a long-running box;
+  a file that lands with an older modification time than that is skipped.
+  """
+
+  def __init__(self, directory, landing_format="csv", grace_seconds=60.0):
+    self.directory = directory
+    self.extension = "." + LANDING_EXTENSIONS[landing_format]
+    self.grace_seconds = grace_seconds
+    self.watermark = float("-inf")
+    self.seen = {}  # path -> modification time
+
+  def _scan(self, directory):
+    try:
+      entries = list(os.scandir(directory))
+    except FileNotFoundError:
+      return
+    for entry in entries:
+      if entry.name.startswith("."):
+        continue  # e.g. LocalDirectorySink's temporary files
+      if entry.is_dir(follow_symlinks=False):
+        yield from self._scan(entry.path)
+      elif entry.name.endswith(self.extension):
+        yield entry.path, entry.stat().st_mtime
+
+  def poll(self, max_files=None):
+    """Paths of files not returned before, oldest first."""
+    horizon = self.watermark - self.grace_seconds
+    new = sorted(
+      ((mtime, path) for path, mtime in self._scan(self.directory) if mtime >= horizon and path not in self.seen)
+    )[:max_files]
+    for mtime, path in new:
+      self.seen[path] = mtime
+      self.watermark = max(self.watermark, mtime)
+    horizon = self.watermark - self.grace_seconds
+    self.seen = {path: mtime for path, mtime in self.seen.items() if mtime >= horizon}
+    return [path for _, path in new]
+
+
+def read_landing_file(path, landing_format="csv"):
+  """One landing file as an Arrow table with float32 features; ids and `event_time` only if the file has them."""
+  import pyarrow as pa
+
+  types = {column: pa.float32() for column in FEATURE_COLUMNS}
+  types.update(station_id=pa.string(), device_id=pa.string(), event_time=pa.timestamp("us", tz="UTC"))
+  if landing_format == "csv":
+    import pyarrow.csv as pc
+
+    # landing files are small and many run in parallel, so Arrow's own thread pool only adds overhead
+    return pc.read_csv(path, read_options=pc.ReadOptions(use_threads=False), convert_options=pc.ConvertOptions(column_types=types))
+  if landing_format == "ndjson":
+    import pyarrow.json as pj
+
+    schema = pa.schema([(column, types[column]) for column in (*FEATURE_COLUMNS, "station_id", "device_id", "event_time")])
+    return pj.read_json(path, read_options=pj.ReadOptions(use_threads=False), parse_options=pj.ParseOptions(explicit_schema=schema, unexpected_field_behavior="ignore"))
+  if landing_format == "parquet":
+    import pyarrow.parquet as pq
+
+    return pq.read_table(path, use_threads=False)
+  raise ValueError(f"Unknown landing format: {landing_format}")
+
+
+def read_landing_files(paths, landing_format="csv", default_station=None):
+  """
+  pandas DataFrame of `paths` in the layout of `ingestion.read_landing_zone` plus `fileName`, with the
+  ingest (file modification), upload (`event_time`, else ingest) and parse stamps of `latency.stamp_ingestion`.
+  """
+  import pandas as pd
+  import pyarrow as pa
+
+  tables, names, modified = [], [], []
+  for path in paths:
+    table = read_landing_file(path, landing_format)
+    tables.append(table)
+    names.append(np.full(table.num_rows, path, dtype=object))
+    modified.append(np.full(table.num_rows, os.stat(path).st_mtime))
+  if not tables:
+    return pd.DataFrame(columns=["fileName", *FEATURE_COLUMNS, "station_id", "device_id", "event_time"])
+  frame = pa.concat_tables(tables, promote_options="default").to_pandas()
+  frame.insert(0, "fileName", np.concatenate(names))
+  for column in ("station_id", "device_id", "event_time"):
+    if column not in frame:
+      frame[column] = pd.Series(pd.NaT, index=frame.index, dtype="datetime64[us, UTC]") if column == "event_time" else None
+  if default_station is not None:
+    frame["station_id"] = frame["station_id"].fillna(default_station)
+  frame[STAGE_COLUMNS["ingest"]] = pd.to_datetime(np.concatenate(modified), unit="s", utc=True)
+  frame[STAGE_COLUMNS["upload"]] = frame["event_time"].fillna(frame[STAGE_COLUMNS["ingest"]])
+  frame[STAGE_COLUMNS["parse"]] = pd.Timestamp.now(tz="UTC")
+  return frame
+
+
+def process_files(paths, landing_format, model, feature_columns=FEATURE_COLUMNS, default_station=None):
+  """Process-pool task: parse `paths` and score them; returns the `RECORD_COLUMNS` of every reading."""
+  import pandas as pd
+
+  frame = read_landing_files(paths, landing_format, default_station)
+  classifier = load_classifier(model)
+  fault_class, fault_probability = classifier.predict(frame[list(feature_columns)].to_numpy(dtype=np.float32))
+  frame["fault_class"], frame["fault_probability"] = fault_class, fault_probability
+  frame[STAGE_COLUMNS["score"]] = pd.Timestamp.now(tz="UTC")
+  return frame[RECORD_COLUMNS]
+
+
+def _warm_worker(model):
+  load_classifier(model)
+  return os.getpid()
+
+
+def interval_metrics(records, intervals=SPARK_INTERVALS):
+  """The `latency.latency_aggregates` of a pandas batch, for `PipelineLatency.record_progress`."""
+  metrics = {}
+  for interval, start, end in intervals:
+    ms = (records[STAGE_COLUMNS[end]] - records[STAGE_COLUMNS[start]]).dt.total_seconds().to_numpy() * 1000
+    histogram = LatencyHistogram().observe(ms)
+    metrics[f"{interval}_histogram"], metrics[f"{interval}_max_ms"] = histogram.counts.tolist(), histogram.max_ms
+  return metrics
+
+
+# --- pipeline ---------------------------------------------------------------------------------
+
+
+@dataclass
+class EdgeStats:
+  batches: int = 0
+  files: int = 0
+  records: int = 0
+  emits: int = 0
+  startup_seconds: float = 0.0  # process pool started and the model loaded in every worker
+  first_batch_seconds: float = None  # from `start` until the first batch was published
+  processing_seconds: float = 0.0
+  publish: PublishStats = field(default_factory=PublishStats)
+
+  @property
+  def records_per_second(self):
+    return self.records / self.processing_seconds if self.processing_seconds else 0.0
+
+
+class EdgePipeline:
+  """
+  Watch `directory` for `landing_format` files and publish their predictions through `publisher`.
+
+  Every micro-batch takes up to `max_files_per_batch` new files, split into tasks of
+  `files_per_task` files parsed and scored on `workers` processes (0 runs them in this process).
+  `model` is anything `load_classifier` accepts; paths are preferable to objects, so workers load it
+  themselves instead of unpickling it with every task. With `publish_components` each reading's label
+  is its fault class (for `publisher.component_health_states`), otherwise NORMAL / BALL_FAULT_PREDICTED.
+  A `debouncer` passes on only confirmed transitions and heartbeats, with its per-station state kept
+  across batches; a `latency` (`PipelineLatency`) records the stage histograms of every batch.
+  """
+
+  def __init__(self, directory, publisher, model, landing_format="csv", workers=None, files_per_task=256,
+               max_files_per_batch=None, publish_components=True, debouncer=None, default_station=None,
+               latency=None, grace_seconds=60.0, clock=time.perf_counter):
+    self.watcher = LandingWatcher(directory, landing_format, grace_seconds)
+    self.publisher = publisher
+    self.model = model
+    self.landing_format = landing_format
+    self.workers = os.cpu_count() if workers is None else workers
+    self.files_per_task = files_per_task
+    self.max_files_per_batch = max_files_per_batch
+    self.publish_components = publish_components
+    self.debouncer = debouncer
+    self.default_station = default_station
+    self.latency = latency
+    self.clock = clock
+    self.states = {}  # debouncer state per station
+    self.stats = EdgeStats()
+    self._pool = None
+    self._started = None
+
+  def start(self):
+    """Start the worker processes and load the model in each of them."""
+    if self._started is not None:
+      return self
+    self._started = self.clock()
+    if self.workers:
+      self._pool = ProcessPoolExecutor(max_workers=self.workers)
+      list(self._pool.map(_warm_worker, [self.model] * self.workers))
+    else:
+      load_classifier(self.model)
+    self.stats.startup_seconds = self.clock() - self._started
+    return self
+
+  def close(self):
+    if self._pool is not None:
+      self._pool.shutdown()
+      self._pool = None
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def score(self, paths):
+    """Parse and score `paths` on the pool; returns one pandas DataFrame of `RECORD_COLUMNS`."""
+    import pandas as pd
+
+    tasks = [paths[i:i + self.files_per_task] for i in range(0, len(paths), self.files_per_task)]
+    args = (self.landing_format, self.model, FEATURE_COLUMNS, self.default_station)
+    if self._pool is None:
+      frames = [process_files(task, *args) for task in tasks]
+    else:
+      frames = list(self._pool.map(process_files, tasks, *[[arg] * len(tasks) for arg in args]))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=RECORD_COLUMNS)
+
+  def label(self, records):
+    if self.publish_components:
+      records["prediction"] = np.asarray(FAULT_CLASSES, dtype=object)[records["fault_class"].to_numpy()]
+    else:
+      records["prediction"] = np.where(records["fault_class"] == NORMAL_CLASS, "NORMAL", "BALL_FAULT_PREDICTED")
+    return records
+
+  def publish(self, records, batch_id):
+    """Debounce (if configured), collapse to the latest record per station by event time and publish."""
+    records = records.assign(event_time=records["event_time"].fillna(records[STAGE_COLUMNS["upload"]]))
+    if self.debouncer is not None:
+      records = self.debouncer.run(records, carry_columns=CARRY_COLUMNS, states=self.states)
+      self.stats.emits += len(records)
+    if not len(records):
+      return PublishStats()
+    latest = records.sort_values("event_time", kind="stable").drop_duplicates("station_id", keep="last")
+    latest = {record["station_id"]: record for record in latest.to_dict("records")}
+    stats = self.publisher.publish_latest(latest, rows_seen=len(records))
+    if self.latency is not None:
+      self.latency.record_published(batch_id, self.publisher.last_records, self.publisher.last_sent)
+    return stats
+
+  def run_batch(self):
+    """Process the files that landed since the last batch; returns its `PublishStats`, or None if there were none."""
+    self.start()
+    paths = self.watcher.poll(self.max_files_per_batch)
+    if not paths:
+      return None
+    batch_id, started = self.stats.batches, self.clock()
+    records = self.label(self.score(paths))
+    if self.latency is not None:
+      self.latency.record_progress(batch_id, interval_metrics(records))
+    stats = self.publish(records, batch_id)
+    finished = self.clock()
+    self.stats.batches += 1
+    self.stats.files += len(paths)
+    self.stats.records += len(records)
+    self.stats.processing_seconds += finished - started
+    self.stats.publish += stats
+    if self.stats.first_batch_seconds is None:
+      self.stats.first_batch_seconds = finished - self._started
+    return stats
+
+  def run(self, duration=None, max_batches=None, idle_batches=None, trigger_seconds=1.0, sleep=time.sleep):
+    """
+    Run a micro-batch every `trigger_seconds` until `duration` seconds have passed, `max_batches`
+    batches were published or `idle_batches` consecutive triggers found no new files.
+    """
+    self.start()
+    started, idle = self.clock(), 0
+    while True:
+      triggered = self.clock()
+      idle = idle + 1 if self.run_batch() is None else 0
+      if max_batches is not None and self.stats.batches >= max_batches:
+        break
+      if idle_batches is not None and idle >= idle_batches:
+        break
+      if duration is not None and self.clock() - started >= duration:
+        break
+      sleep(max(0.0, trigger_seconds - (self.clock() - triggered)))
+    return self.stats
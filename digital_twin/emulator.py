@@ -0,0 +1,379 @@
+"""
+In-memory stand-in for an Azure Digital Twins instance.
+
+`DigitalTwinsEmulator` holds models, twins and relationships (optionally loaded from this repo's
+`models/` and `twins/TwinGraph.json`). `FakeDigitalTwinsClient` exposes the subset of the
+`azure.digitaltwins.core.DigitalTwinsClient` API used by the notebooks and publishers, with
+configurable per-request latency and throttling (HTTP 429 + `Retry-After`), so publishing paths
+can be load-tested and regression-tested without a live instance.
+"""
+
+import copy
+import random
+import re
+import threading
+import time
+import uuid
+
+from digital_twin.dtdl import model_dependencies
+from digital_twin.resources import TWIN_GRAPH_PATH, load_models, load_twin_graph
+from digital_twin.writer import TokenBucket
+
+
+class _Response:
+  def __init__(self, status_code, headers=None):
+    self.status_code = status_code
+    self.headers = headers or {}
+
+
+class EmulatorHttpError(Exception):
+  """Mirrors the `status_code`/`response.headers` shape of `azure.core.exceptions.HttpResponseError`."""
+
+  def __init__(self, status_code, message, headers=None):
+    super().__init__(f"({status_code}) {message}")
+    self.status_code = status_code
+    self.response = _Response(status_code, headers)
+
+
+def _new_etag():
+  return f'W/"{uuid.uuid4()}"'
+
+
+def _unescape(token):
+  return token.replace("~1", "/").replace("~0", "~")
+
+
+def apply_json_patch(document, patch):
+  """Apply RFC 6902 `add`/`replace`/`remove`/`test` operations to `document` in place."""
+  for operation in patch:
+    op, path = operation["op"], operation["path"]
+    tokens = [_unescape(t) for t in path.split("/")[1:]]
+    if not tokens:
+      raise EmulatorHttpError(400, f"Invalid patch path '{path}'")
+    parent = document
+    for token in tokens[:-1]:
+      if not isinstance(parent, dict) or token not in parent:
+        raise EmulatorHttpError(400, f"Path '{path}' does not exist")
+      parent = parent[token]
+    leaf = tokens[-1]
+    if op == "add":
+      parent[leaf] = copy.deepcopy(operation["value"])
+    elif op == "replace":
+      if leaf not in parent:
+        raise EmulatorHttpError(400, f"Cannot replace missing property '{path}'")
+      parent[leaf] = copy.deepcopy(operation["value"])
+    elif op == "remove":
+      if leaf not in parent:
+        raise EmulatorHttpError(400, f"Cannot remove missing property '{path}'")
+      del parent[leaf]
+    elif op == "test":
+      if parent.get(leaf) != operation["value"]:
+        raise EmulatorHttpError(412, f"Test failed for '{path}'")
+    else:
+      raise EmulatorHttpError(400, f"Unsupported patch operation '{op}'")
+  return document
+
+
+class DigitalTwinsEmulator:
+  """Thread-safe in-memory twin graph with optional simulated latency and throttling."""
+
+  def __init__(self, latency=0.0, latency_jitter=0.0, max_requests_per_second=None, sleep=time.sleep):
+    self.models = {}
+    self.twins = {}
+    self.relationships = {}  # source dtId -> {relationship id -> relationship}
+    self.latency = latency
+    self.latency_jitter = latency_jitter
+    self.bucket = TokenBucket(max_requests_per_second) if max_requests_per_second else None
+    self.sleep = sleep
+    self.request_count = 0
+    self.throttled_count = 0
+    self._lock = threading.RLock()
+
+  @classmethod
+  def from_repo(cls, twin_graph_path=TWIN_GRAPH_PATH, **kwargs):
+    """Emulator pre-loaded with `models/*.json` and `twins/TwinGraph.json`."""
+    emulator = cls(**kwargs)
+    emulator.load_models(load_models())
+    emulator.load_graph(load_twin_graph(twin_graph_path))
+    return emulator
+
+  def load_models(self, models):
+    with self._lock:
+      for model in models:
+        self.models[model["@id"]] = copy.deepcopy(model)
+
+  def load_graph(self, graph):
+    with self._lock:
+      for twin in graph.get("digitalTwins", []):
+        self.twins[twin["$dtId"]] = copy.deepcopy(twin)
+      for relationship in graph.get("relationships", []):
+        self.relationships.setdefault(relationship["$sourceId"], {})[relationship["$relationshipId"]] = copy.deepcopy(relationship)
+
+  def request(self):
+    """Account for one API call: throttle, then sleep for the simulated latency."""
+    with self._lock:
+      self.request_count += 1
+    if self.bucket is not None:
+      wait = self.bucket.try_acquire()
+      if wait:
+        with self._lock:
+          self.throttled_count += 1
+        raise EmulatorHttpError(429, "Too many requests", headers={"Retry-After": f"{wait:.3f}"})
+    if self.latency or self.latency_jitter:
+      self.sleep(max(0.0, self.latency + random.uniform(-self.latency_jitter, self.latency_jitter)))
+
+  def twin(self, twin_id):
+    twin = self.twins.get(twin_id)
+    if twin is None:
+      raise EmulatorHttpError(404, f"Twin '{twin_id}' not found")
+    return twin
+
+  def outgoing(self, twin_id, relationship_name=None):
+    return [
+      relationship for relationship in self.relationships.get(twin_id, {}).values()
+      if relationship_name is None or relationship["$relationshipName"] == relationship_name
+    ]
+
+  def is_of_model(self, twin, model_id):
+    """Whether `twin` uses `model_id` or a model extending it."""
+    pending = [twin.get("$metadata", {}).get("$model")]
+    seen = set()
+    while pending:
+      current = pending.pop()
+      if current == model_id:
+        return True
+      if current in seen or current not in self.models:
+        continue
+      seen.add(current)
+      extends = self.models[current].get("extends", [])
+      pending.extend([extends] if isinstance(extends, str) else extends)
+    return False
+
+
+class FakeDigitalTwinsClient:
+  """Drop-in replacement for the `DigitalTwinsClient` methods used in this repo."""
+
+  def __init__(self, emulator=None):
+    self.emulator = emulator if emulator is not None else DigitalTwinsEmulator.from_repo()
+
+  def get_digital_twin(self, digital_twin_id, **kwargs):
+    """Honours an `If-None-Match` request header (`headers=`) with an empty 304, like a conditional GET."""
+    self.emulator.request()
+    etag = (kwargs.get("headers") or {}).get("If-None-Match")
+    with self.emulator._lock:
+      twin = self.emulator.twin(digital_twin_id)
+      if etag is not None and etag == twin.get("$etag"):
+        raise EmulatorHttpError(304, f"Twin '{digital_twin_id}' not modified", headers={"ETag": etag})
+      return copy.deepcopy(twin)
+
+  def upsert_digital_twin(self, digital_twin_id, digital_twin, **kwargs):
+    self.emulator.request()
+    twin = copy.deepcopy(digital_twin)
+    twin["$dtId"] = digital_twin_id
+    model_id = twin.get("$metadata", {}).get("$model")
+    if model_id not in self.emulator.models:
+      raise EmulatorHttpError(400, f"Model '{model_id}' of twin '{digital_twin_id}' not found")
+    twin["$etag"] = _new_etag()
+    with self.emulator._lock:
+      self.emulator.twins[digital_twin_id] = twin
+      return copy.deepcopy(twin)
+
+  def update_digital_twin(self, digital_twin_id, json_patch, **kwargs):
+    self.emulator.request()
+    with self.emulator._lock:
+      twin = self.emulator.twin(digital_twin_id)
+      etag = kwargs.get("etag")
+      if etag is not None and etag != twin["$etag"]:
+        raise EmulatorHttpError(412, f"ETag mismatch for '{digital_twin_id}'")
+      updated = apply_json_patch(copy.deepcopy(twin), json_patch)
+      model_id = updated.get("$metadata", {}).get("$model")
+      if model_id not in self.emulator.models:
+        raise EmulatorHttpError(400, f"Model '{model_id}' of twin '{digital_twin_id}' not found")
+      updated["$etag"] = _new_etag()
+      self.emulator.twins[digital_twin_id] = updated
+
+  def delete_digital_twin(self, digital_twin_id, **kwargs):
+    self.emulator.request()
+    with self.emulator._lock:
+      self.emulator.twin(digital_twin_id)
+      if self.emulator.relationships.get(digital_twin_id):
+        raise EmulatorHttpError(400, f"Twin '{digital_twin_id}' still has relationships")
+      del self.emulator.twins[digital_twin_id]
+
+  def get_relationship(self, digital_twin_id, relationship_id, **kwargs):
+    self.emulator.request()
+    with self.emulator._lock:
+      relationship = self.emulator.relationships.get(digital_twin_id, {}).get(relationship_id)
+      if relationship is None:
+        raise EmulatorHttpError(404, f"Relationship '{relationship_id}' not found")
+      return copy.deepcopy(relationship)
+
+  def upsert_relationship(self, digital_twin_id, relationship_id, relationship=None, **kwargs):
+    self.emulator.request()
+    relationship = copy.deepcopy(relationship or {})
+    relationship.update({"$sourceId": digital_twin_id, "$relationshipId": relationship_id, "$etag": _new_etag()})
+    with self.emulator._lock:
+      self.emulator.twin(digital_twin_id)
+      self.emulator.twin(relationship["$targetId"])
+      self.emulator.relationships.setdefault(digital_twin_id, {})[relationship_id] = relationship
+      return copy.deepcopy(relationship)
+
+  def delete_relationship(self, digital_twin_id, relationship_id, **kwargs):
+    self.emulator.request()
+    with self.emulator._lock:
+      if self.emulator.relationships.get(digital_twin_id, {}).pop(relationship_id, None) is None:
+        raise EmulatorHttpError(404, f"Relationship '{relationship_id}' not found")
+
+  def list_relationships(self, digital_twin_id, relationship_id=None, **kwargs):
+    """As in the SDK, `relationship_id` filters by relationship *name*."""
+    self.emulator.request()
+    with self.emulator._lock:
+      return copy.deepcopy(self.emulator.outgoing(digital_twin_id, relationship_id))
+
+  def list_incoming_relationships(self, digital_twin_id, **kwargs):
+    self.emulator.request()
+    with self.emulator._lock:
+      return [
+        {key: relationship[key] for key in ("$relationshipId", "$sourceId", "$relationshipName")}
+        for relationships in self.emulator.relationships.values()
+        for relationship in relationships.values()
+        if relationship["$targetId"] == digital_twin_id
+      ]
+
+  def create_models(self, dtdl_models, **kwargs):
+    self.emulator.request()
+    with self.emulator._lock:
+      duplicates = [model["@id"] for model in dtdl_models if model["@id"] in self.emulator.models]
+      if duplicates:
+        raise EmulatorHttpError(409, f"Model(s) already exist: {', '.join(duplicates)}")
+      known = set(self.emulator.models) | {model["@id"] for model in dtdl_models}
+      missing = sorted({dependency for model in dtdl_models for dependency in model_dependencies(model)} - known)
+      if missing:
+        raise EmulatorHttpError(400, f"Referenced model(s) not found: {', '.join(missing)}")
+      self.emulator.load_models(dtdl_models)
+      return [{"id": model["@id"]} for model in dtdl_models]
+
+  def get_model(self, model_id, **kwargs):
+    self.emulator.request()
+    with self.emulator._lock:
+      if model_id not in self.emulator.models:
+        raise EmulatorHttpError(404, f"Model '{model_id}' not found")
+      return {"id": model_id, "model": copy.deepcopy(self.emulator.models[model_id])}
+
+  def list_models(self, **kwargs):
+    self.emulator.request()
+    with self.emulator._lock:
+      return [{"id": model_id, "model": copy.deepcopy(model)} for model_id, model in self.emulator.models.items()]
+
+  def delete_model(self, model_id, **kwargs):
+    self.emulator.request()
+    with self.emulator._lock:
+      if self.emulator.models.pop(model_id, None) is None:
+        raise EmulatorHttpError(404, f"Model '{model_id}' not found")
+
+  def query_twins(self, query_expression, **kwargs):
+    self.emulator.request()
+    with self.emulator._lock:
+      return copy.deepcopy(run_query(self.emulator, query_expression))
+
+
+# --- Query subset ---------------------------------------------------------------------------
+#
+# Supported:
+#   SELECT * FROM digitaltwins [WHERE ...]
+#   SELECT <alias> FROM DIGITALTWINS <source> JOIN <alias> RELATED <source>.<relationship> [WHERE ...]
+# where conditions are AND-ed comparisons (=, !=, <, <=, >, >=) between a (dotted) property path and
+# a string/number/boolean literal, or IS_OF_MODEL([alias,] 'dtmi:...').
+
+_QUERY = re.compile(
+  r"^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+DIGITALTWINS(?:\s+(?!WHERE\b|JOIN\b)(?P<source>\w+))?"
+  r"(?:\s+JOIN\s+(?P<target>\w+)\s+RELATED\s+(?P<join_source>\w+)\.(?P<relationship>\w+))?"
+  r"(?:\s+WHERE\s+(?P<where>.+?))?\s*$",
+  re.IGNORECASE | re.DOTALL,
+)
+_CONDITION = re.compile(r"^\s*(?P<path>[\w$.]+)\s*(?P<op>!=|<>|<=|>=|=|<|>)\s*(?P<literal>.+?)\s*$")
+_IS_OF_MODEL = re.compile(r"^\s*IS_OF_MODEL\(\s*(?:(?P<alias>\w+)\s*,\s*)?'(?P<model>[^']+)'\s*\)\s*$", re.IGNORECASE)
+_COMPARE = {
+  "=": lambda a, b: a == b,
+  "!=": lambda a, b: a != b,
+  "<>": lambda a, b: a != b,
+  "<": lambda a, b: a < b,
+  "<=": lambda a, b: a <= b,
+  ">": lambda a, b: a > b,
+  ">=": lambda a, b: a >= b,
+}
+
+
+def _literal(text):
+  if text[0] in "'\"" and text[-1] == text[0]:
+    return text[1:-1]
+  lowered = text.lower()
+  if lowered in ("true", "false"):
+    return lowered == "true"
+  try:
+    return float(text) if "." in text else int(text)
+  except ValueError:
+    raise EmulatorHttpError(400, f"Unsupported literal {text}") from None
+
+
+def _split_and(where):
+  return [part for part in re.split(r"\s+AND\s+", where, flags=re.IGNORECASE) if part.strip()]
+
+
+def _compile_condition(emulator, text, aliases):
+  match = _IS_OF_MODEL.match(text)
+  if match:
+    alias, model = match.group("alias") or aliases[0], match.group("model")
+    return lambda row: emulator.is_of_model(row[alias], model)
+
+  match = _CONDITION.match(text)
+  if not match:
+    raise EmulatorHttpError(400, f"Unsupported condition '{text}'")
+  path = match.group("path").split(".")
+  alias = path.pop(0) if len(path) > 1 and path[0] in aliases else aliases[0]
+  compare, expected = _COMPARE[match.group("op")], _literal(match.group("literal"))
+
+  def condition(row):
+    value = row[alias]
+    for token in path:
+      if not isinstance(value, dict) or token not in value:
+        return False  # undefined properties never match, as in ADT
+      value = value[token]
+    try:
+      return compare(value, expected)
+    except TypeError:
+      return False
+
+  return condition
+
+
+def run_query(emulator, query):
+  match = _QUERY.match(query)
+  if not match:
+    raise EmulatorHttpError(400, f"Unsupported query: {query}")
+  source = match.group("source") or "digitaltwins"
+  target = match.group("target")
+  if target and match.group("join_source") != source:
+    raise EmulatorHttpError(400, "JOIN must be RELATED to the FROM alias")
+  aliases = [source] + ([target] if target else [])
+  conditions = [_compile_condition(emulator, part, aliases) for part in _split_and(match.group("where") or "")]
+
+  rows = []
+  for twin in emulator.twins.values():
+    if target:
+      for relationship in emulator.outgoing(twin["$dtId"], match.group("relationship")):
+        related = emulator.twins.get(relationship["$targetId"])
+        if related is not None:
+          rows.append({source: twin, target: related})
+    else:
+      rows.append({source: twin})
+
+  select = match.group("select").strip()
+  results = []
+  for row in rows:
+    if all(condition(row) for condition in conditions):
+      if select == "*":
+        results.append(row[aliases[-1]] if not target else row)
+      else:
+        results.append({alias.strip(): row[alias.strip()] for alias in select.split(",")})
+  return results
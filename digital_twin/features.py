@@ -0,0 +1,190 @@
+"""
+Vibration summary features computed from raw accelerometer samples.
+
+Produces the nine statistics of the landing-zone files (`schema.FEATURE_COLUMNS`) for tumbling or
+sliding windows. Moments are centred on each window's own mean (power sums of deviations from one
+level cancel catastrophically when a window sits far from it), and every window is computed with
+array arithmetic rather than a Python loop per window.
+
+Definitions follow data/vibration_reports.csv, whose reports use 2,048-sample windows:
+`sd` is the sample standard deviation (n - 1), `skewness` is m3 / m2^1.5, `kurtosis` is the excess
+kurtosis m4 / m2² - 3, `crest` is max / rms and `form` is rms / mean.
+"""
+
+import numpy as np
+
+from digital_twin.schema import FEATURE_COLUMNS
+
+DEFAULT_WINDOW = 2048
+_CHUNK_SAMPLES = 1 << 22  # window samples centred at a time, bounding the temporaries of sliding windows
+
+
+def _finish(n, mean, m2, m3, m4, maximum, minimum):
+  """Assemble the nine features from central moments; returns an (n_windows, 9) float32 array."""
+  with np.errstate(divide="ignore", invalid="ignore"):
+    m2 = np.maximum(m2, 0.0)
+    sd = np.sqrt(m2 * n / (n - 1))
+    rms = np.sqrt(m2 + mean * mean)
+    skewness = m3 / m2 ** 1.5
+    kurtosis = m4 / (m2 * m2) - 3.0
+    crest = maximum / rms
+    form = rms / mean
+  return np.stack([maximum, minimum, mean, sd, rms, skewness, kurtosis, crest, form], axis=-1).astype(np.float32)
+
+
+def _central_moments(blocks, mean):
+  """`(m2, m3, m4)` of each window along the last axis of `blocks`, centred on the window's `mean`."""
+  moments = np.empty((3,) + mean.shape)
+  chunk = max(1, _CHUNK_SAMPLES // max(1, blocks.shape[0] * blocks.shape[-1]))
+  for start in range(0, blocks.shape[1], chunk):
+    part = slice(start, start + chunk)
+    d = blocks[:, part] - mean[:, part, None]
+    d2 = d * d
+    moments[0, :, part] = d2.mean(axis=-1)
+    moments[1, :, part] = (d2 * d).mean(axis=-1)
+    moments[2, :, part] = (d2 * d2).mean(axis=-1)
+  return moments
+
+
+def window_starts(n_samples, window=DEFAULT_WINDOW, step=None):
+  step = step or window
+  if n_samples < window:
+    return np.empty(0, dtype=np.int64)
+  return np.arange(0, n_samples - window + 1, step, dtype=np.int64)
+
+
+def window_features(samples, window=DEFAULT_WINDOW, step=None):
+  """
+  Features of every complete window of a 1-D signal (or of each row of a 2-D `(signals, samples)` array).
+  `step` defaults to `window` (tumbling windows); smaller steps give sliding windows.
+  Returns float32 `(n_windows, 9)`, or `(signals, n_windows, 9)` for 2-D input.
+  """
+  x = np.asarray(samples, dtype=np.float64)
+  squeeze = x.ndim == 1
+  x = np.atleast_2d(x)
+  starts = window_starts(x.shape[1], window, step)
+  if not len(starts):
+    empty = np.empty((x.shape[0], 0, len(FEATURE_COLUMNS)), dtype=np.float32)
+    return empty[0] if squeeze else empty
+
+  if step is None or step == window:
+    blocks = x[:, :len(starts) * window].reshape(x.shape[0], len(starts), window)
+  else:
+    blocks = np.lib.stride_tricks.sliding_window_view(x, window, axis=1)[:, starts]
+  mean = blocks.mean(axis=-1)
+  m2, m3, m4 = _central_moments(blocks, mean)
+  features = _finish(window, mean, m2, m3, m4, blocks.max(axis=-1), blocks.min(axis=-1))
+  return features[0] if squeeze else features
+
+
+def features_frame(signals, window=DEFAULT_WINDOW, step=None, station_column="station_id"):
+  """
+  pandas DataFrame of window features for `{station_id: 1-D samples}`, with `window_start`
+  (sample offset) and the float32 feature columns in landing-zone order.
+  """
+  import pandas as pd
+
+  frames = []
+  for station_id, samples in signals.items():
+    features = window_features(samples, window, step)
+    frame = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+    frame.insert(0, "window_start", window_starts(len(samples), window, step))
+    frame.insert(0, station_column, station_id)
+    frames.append(frame)
+  if not frames:
+    return pd.DataFrame(columns=[station_column, "window_start"] + FEATURE_COLUMNS)
+  return pd.concat(frames, ignore_index=True)
+
+
+class RunningMoments:
+  """
+  Mergeable running statistics (count, mean, central moments, min, max) that are updated with
+  each new block of samples using the pairwise update formulas of Pébay (2008).
+  """
+
+  def __init__(self):
+    self.n = 0
+    self.mean = 0.0
+    self.m2 = self.m3 = self.m4 = 0.0  # sums of centered powers
+    self.max = -np.inf
+    self.min = np.inf
+
+  def update(self, samples):
+    x = np.asarray(samples, dtype=np.float64).ravel()
+    if not x.size:
+      return self
+    other = RunningMoments()
+    other.n = x.size
+    other.mean = x.mean()
+    d = x - other.mean
+    d2 = d * d
+    other.m2, other.m3, other.m4 = d2.sum(), (d2 * d).sum(), (d2 * d2).sum()
+    other.max, other.min = x.max(), x.min()
+    return self.merge(other)
+
+  def merge(self, other):
+    if not other.n:
+      return self
+    n_a, n_b = self.n, other.n
+    n = n_a + n_b
+    delta = other.mean - self.mean
+    m2 = self.m2 + other.m2 + delta ** 2 * n_a * n_b / n
+    m3 = (self.m3 + other.m3 + delta ** 3 * n_a * n_b * (n_a - n_b) / n ** 2
+          + 3 * delta * (n_a * other.m2 - n_b * self.m2) / n)
+    m4 = (self.m4 + other.m4 + delta ** 4 * n_a * n_b * (n_a ** 2 - n_a * n_b + n_b ** 2) / n ** 3
+          + 6 * delta ** 2 * (n_a ** 2 * other.m2 + n_b ** 2 * self.m2) / n ** 2
+          + 4 * delta * (n_a * other.m3 - n_b * self.m3) / n)
+    self.n, self.mean, self.m2, self.m3, self.m4 = n, self.mean + delta * n_b / n, m2, m3, m4
+    self.max, self.min = max(self.max, other.max), min(self.min, other.min)
+    return self
+
+  def features(self):
+    """The nine features of everything seen so far, as a float32 array."""
+    n = self.n
+    return _finish(n, np.float64(self.mean), np.float64(self.m2 / n), np.float64(self.m3 / n),
+                   np.float64(self.m4 / n), np.float64(self.max), np.float64(self.min))
+
+
+class StreamingFeatureExtractor:
+  """
+  Incremental windowing per station: feed raw sample blocks as they arrive and get back features for
+  every window they complete. Only the tail of each station's signal that can still start a window is kept.
+  """
+
+  def __init__(self, window=DEFAULT_WINDOW, step=None):
+    if step is not None and step > window:
+      raise ValueError("step must not exceed window: windows have to cover the whole signal")
+    self.window = window
+    self.step = step or window
+    self.pending = {}  # station_id -> samples not yet consumed by a window start
+    self.offsets = {}  # station_id -> absolute sample index of pending[0]
+
+  def update(self, station_id, samples):
+    """Returns `(window_starts, features)` for the windows completed by this block."""
+    buffered = self.pending.get(station_id)
+    samples = np.asarray(samples, dtype=np.float64)
+    signal = samples if buffered is None else np.concatenate([buffered, samples])
+    offset = self.offsets.get(station_id, 0)
+
+    starts = window_starts(len(signal), self.window, self.step)
+    features = window_features(signal, self.window, self.step)
+    consumed = int(starts[-1]) + self.step if len(starts) else 0
+    self.pending[station_id] = signal[consumed:]
+    self.offsets[station_id] = offset + consumed
+    return starts + offset, features
+
+  def update_many(self, blocks, station_column="station_id"):
+    """Feed `{station_id: samples}` and return a features DataFrame for all completed windows."""
+    import pandas as pd
+
+    frames = []
+    for station_id, samples in blocks.items():
+      starts, features = self.update(station_id, samples)
+      if len(starts):
+        frame = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+        frame.insert(0, "window_start", starts)
+        frame.insert(0, station_column, station_id)
+        frames.append(frame)
+    if not frames:
+      return pd.DataFrame(columns=[station_column, "window_start"] + FEATURE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
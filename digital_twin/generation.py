@@ -0,0 +1,255 @@
+"""
+Vectorized synthetic telemetry for coating stations (root cause analysis dataset).
+
+Signals are generated for all stations and periods at once: each chunk draws one
+`(stations, samples)` NumPy array per signal, with a random phase offset per station and period,
+and healthy or faulty behaviour per `(station, period)`. Chunks are yielded one at a time, so
+arbitrarily long datasets stream to Parquet or Delta with bounded memory. The same seed and
+parameters always reproduce the same data.
+
+Healthy signals: Gaussian noise around the nominal value plus a small sine component.
+Faulty signals (e.g. a failing dryer fan controller): 5x the noise plus a square wave.
+
+`spark_telemetry` runs the same generator inside `mapInPandas` for every twin of any production step
+model, with signals taken from the model's DTDL properties and per-station `FaultProfile`s.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+SAMPLES_PER_PERIOD = 1000  # 1 kHz sampling: one period is one second
+TARGET_CHUNK_ROWS = 1_000_000
+HALF_CYCLES_PER_PERIOD = 30  # the sine/square components complete 15 cycles per period
+
+
+@dataclass(frozen=True)
+class SignalSpec:
+  """
+  One telemetry property. Noise and periodic amplitudes are fractions of `mean`.
+  A signal that `follows` another is that signal rescaled to this one's mean (e.g. dryer temperature tracks fan speed).
+  Signals that are not `affected` keep behaving healthily while their station is faulty.
+  """
+  name: str
+  mean: float
+  healthy_sd: float = 0.001
+  faulty_sd: float = 0.005
+  healthy_sine: float = 0.001
+  faulty_square: float = 0.01
+  follows: str = None
+  affected: bool = True
+
+
+# Telemetry properties of dtmi:com:microsoft:iot:e2e:digital_factory:production_step_coating;3,
+# with nominal values from twins/TwinGraph.json
+COATING_SIGNALS = (
+  SignalSpec("dryerFanSpeed", 500.0),
+  SignalSpec("dryerTemperature", 25.0, follows="dryerFanSpeed"),
+  SignalSpec("coatingSurfaceTemperature", 60.0, healthy_sd=0.002, affected=False),
+)
+
+
+def _square(phase):
+  """Same as `scipy.signal.square`: +1 for the first half of each 2π cycle, -1 for the second."""
+  return np.where(np.mod(phase, 2 * np.pi) < np.pi, 1.0, -1.0)
+
+
+class TelemetryGenerator:
+  """
+  Generates `signals` for `stations`, `n_periods` periods of `samples_per_period` samples each.
+
+  `faulty_stations` switch to faulty behaviour from `fault_start_period` (default: the last period)
+  onwards. Output is produced in chunks of `chunk_periods` periods (by default as many as fit in
+  about `TARGET_CHUNK_ROWS` rows); `seed` and `chunk_periods` together fully determine the data.
+  """
+
+  def __init__(self, stations, faulty_stations=(), n_periods=2, signals=COATING_SIGNALS,
+               samples_per_period=SAMPLES_PER_PERIOD, fault_start_period=None, chunk_periods=None,
+               seed=0, dtype=np.float64):
+    self.stations = list(stations)
+    self.faulty = np.isin(self.stations, list(faulty_stations))
+    self.n_periods = n_periods
+    self.signals = tuple(signals)
+    self.samples_per_period = samples_per_period
+    self.fault_start_period = n_periods - 1 if fault_start_period is None else fault_start_period
+    self.chunk_periods = chunk_periods or max(1, TARGET_CHUNK_ROWS // max(1, len(self.stations) * samples_per_period))
+    self.seed = seed
+    self.dtype = dtype
+    self._by_name = {signal.name: signal for signal in self.signals}
+
+  @property
+  def n_chunks(self):
+    return -(-self.n_periods // self.chunk_periods)
+
+  @property
+  def n_rows(self):
+    return len(self.stations) * self.n_periods * self.samples_per_period
+
+  def chunk_arrays(self, chunk):
+    """`(first_sample_index, {signal: array[stations, samples]})` for one chunk."""
+    first_period = chunk * self.chunk_periods
+    periods = min(self.chunk_periods, self.n_periods - first_period)
+    n_stations, n = len(self.stations), self.samples_per_period
+    rng = np.random.default_rng([*np.atleast_1d(self.seed), chunk])
+
+    # (stations, periods, 1): which station-periods are faulty, broadcast over samples
+    period_index = np.arange(first_period, first_period + periods)
+    faulty = (self.faulty[:, None] & (period_index >= self.fault_start_period)[None, :])[:, :, None]
+    sample_phase = (np.arange(n) / n * HALF_CYCLES_PER_PERIOD * np.pi)[None, None, :]
+
+    arrays = {}
+    for signal in self.signals:
+      if signal.follows:
+        continue
+      phase = sample_phase + rng.random((n_stations, periods, 1))
+      noise = rng.standard_normal((n_stations, periods, n))
+      signal_faulty = faulty & signal.affected
+      sd = np.where(signal_faulty, signal.faulty_sd, signal.healthy_sd)
+      periodic = np.where(signal_faulty, signal.faulty_square * _square(phase), signal.healthy_sine * np.sin(phase))
+      arrays[signal.name] = (signal.mean * (1.0 + sd * noise + periodic)).reshape(n_stations, periods * n)
+    for signal in self.signals:
+      if signal.follows:
+        leader = self._by_name[signal.follows]
+        arrays[signal.name] = arrays[leader.name] / leader.mean * signal.mean
+    return first_period * n, {name: values.astype(self.dtype, copy=False) for name, values in arrays.items()}
+
+  def chunk_frame(self, chunk):
+    """One chunk as a long pandas DataFrame: signal columns, `station_id` and a per-station `_index`."""
+    import pandas as pd
+
+    first_sample, arrays = self.chunk_arrays(chunk)
+    n_stations, n_samples = next(iter(arrays.values())).shape
+    frame = pd.DataFrame({name: values.ravel() for name, values in arrays.items()})
+    frame["station_id"] = pd.Categorical.from_codes(np.repeat(np.arange(n_stations), n_samples), self.stations)
+    frame["_index"] = np.tile(np.arange(first_sample, first_sample + n_samples, dtype=np.int64), n_stations)
+    return frame
+
+  def frames(self):
+    """Yield every chunk as a DataFrame; only one chunk is held in memory at a time."""
+    for chunk in range(self.n_chunks):
+      yield self.chunk_frame(chunk)
+
+  def to_pandas(self):
+    """The whole dataset in memory, for small runs only."""
+    import pandas as pd
+    return pd.concat(self.frames(), ignore_index=True)
+
+  def write_parquet(self, path):
+    """Stream all chunks into one Parquet file, one row group per chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+      for frame in self.frames():
+        frame["station_id"] = frame["station_id"].astype(str)
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if writer is None:
+          writer = pq.ParquetWriter(path, table.schema)
+        writer.write_table(table)
+    finally:
+      if writer is not None:
+        writer.close()
+    return path
+
+  def write_table(self, spark, table_name, mode="overwrite"):
+    """Append chunk by chunk to a (Delta) table; the first chunk applies `mode`."""
+    for chunk, frame in enumerate(self.frames()):
+      frame["station_id"] = frame["station_id"].astype(str)
+      spark.createDataFrame(frame).write.mode(mode if chunk == 0 else "append").saveAsTable(table_name)
+
+
+# --- Spark-native generation for every production step model ----------------------------------
+
+NUMERIC_SCHEMAS = ("double", "float", "integer", "long")
+
+
+def _column_name(property_name):
+  return property_name[:1].lower() + property_name[1:]
+
+
+def telemetry_properties(models, model_id):
+  """Numeric properties declared by a DTDL interface and the interfaces it extends, in declaration order."""
+  from digital_twin.dtdl import ModelRegistry
+  return ModelRegistry(models).properties(model_id, schemas=NUMERIC_SCHEMAS)
+
+
+@dataclass(frozen=True)
+class FaultProfile:
+  """How a station misbehaves from `onset_period` on; `signals` limits the fault to some DTDL properties."""
+  onset_period: int = 0
+  noise_factor: float = 5.0
+  square: float = 0.01
+  signals: tuple = None
+
+
+def station_signals(twin, properties, profile=None, healthy_sd=0.001, healthy_sine=0.001):
+  """SignalSpecs for one twin, centred on the twin's current property values (1.0 when unset)."""
+  specs = []
+  for name in properties:
+    mean = twin.get(name)
+    mean = float(mean) if isinstance(mean, (int, float)) and not isinstance(mean, bool) and mean else 1.0
+    affected = profile is not None and (profile.signals is None or name in profile.signals)
+    specs.append(SignalSpec(
+      _column_name(name), mean,
+      healthy_sd=healthy_sd,
+      faulty_sd=healthy_sd * (profile.noise_factor if profile else 1.0),
+      healthy_sine=healthy_sine,
+      faulty_square=profile.square if profile else 0.0,
+      affected=affected,
+    ))
+  return specs
+
+
+def spark_telemetry(spark, twins, models, model_id, n_periods, fault_profiles=None, periods_per_task=10,
+                    samples_per_period=SAMPLES_PER_PERIOD, seed=0, num_partitions=None):
+  """
+  Telemetry for every twin of `model_id`, generated on the executors.
+
+  The task list (twin x chunk of `periods_per_task` periods) is itself built with `spark.range`, and
+  each task generates its block inside `mapInPandas`, so nothing but the small per-twin signal plan
+  goes through the driver and output scales with the cluster. Columns are `station_id`, `_index` and
+  one double per numeric DTDL property of the model. `fault_profiles` maps station ids to FaultProfiles.
+  """
+  import pyspark.sql.functions as F
+
+  fault_profiles = dict(fault_profiles or {})
+  properties = telemetry_properties(models, model_id)
+  plans = {
+    twin["$dtId"]: station_signals(twin, properties, fault_profiles.get(twin["$dtId"]))
+    for twin in twins if twin["$metadata"]["$model"] == model_id
+  }
+  columns = [_column_name(name) for name in properties]
+  n_chunks = -(-n_periods // periods_per_task)
+
+  def generate(batches):
+    import zlib
+
+    for tasks in batches:
+      for station_id, chunk in zip(tasks["station_id"], tasks["chunk"]):
+        profile = fault_profiles.get(station_id)
+        generator = TelemetryGenerator(
+          [station_id], [station_id] if profile else [], n_periods, signals=plans[station_id],
+          samples_per_period=samples_per_period, fault_start_period=profile.onset_period if profile else None,
+          chunk_periods=periods_per_task, seed=(seed, zlib.crc32(station_id.encode())),
+        )
+        frame = generator.chunk_frame(int(chunk))
+        frame["station_id"] = station_id
+        yield frame[["station_id", "_index"] + columns]
+
+  schema = ", ".join(["station_id string", "_index long"] + [f"{column} double" for column in columns])
+  stations = spark.createDataFrame([(station_id,) for station_id in plans], "station_id string")
+  tasks = stations.crossJoin(spark.range(n_chunks).select(F.col("id").alias("chunk")))
+  tasks = tasks.repartition(num_partitions or max(1, spark.sparkContext.defaultParallelism * 2))
+  return tasks.mapInPandas(generate, schema)
+
+
+def spark_step_telemetry(spark, graph, models, n_periods, fault_profiles=None, **kwargs):
+  """`{model_id: DataFrame}` of `spark_telemetry` for every production step model used in a twin graph."""
+  from digital_twin.graph import step_type
+
+  model_ids = sorted({twin["$metadata"]["$model"] for twin in graph["digitalTwins"]})
+  return {
+    model_id: spark_telemetry(spark, graph["digitalTwins"], models, model_id, n_periods, fault_profiles, **kwargs)
+    for model_id in model_ids if step_type(model_id) is not None
+  }
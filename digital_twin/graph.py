@@ -0,0 +1,284 @@
+"""
+Compact, indexed in-memory twin graph built from an ADT Explorer export such as `twins/TwinGraph.json`.
+
+Twins are numbered 0..n-1; model and relationship names are interned to small integers and
+relationships are kept as CSR adjacency arrays in both directions, so neighbour, ancestor and
+downstream (`leads_to`) traversals touch only the twins involved. Twins are also indexed by model,
+step type, site and line. The whole store serializes to a compact binary blob (`to_bytes`) that is
+cheap to broadcast to Spark executors.
+"""
+
+import io
+import json
+import zlib
+
+import numpy as np
+
+SITE_RUNS_LINES = "rel_runs_lines"
+LINE_RUNS_STEPS = "rel_runs_steps"
+LEADS_TO = "leads_to"
+CONTAINMENT = (SITE_RUNS_LINES, LINE_RUNS_STEPS)
+
+_SITE_MODEL = "production_site"
+_LINE_MODEL = "production_line"
+_STEP_PREFIX = "production_step_"
+
+
+def model_name(model_id):
+  """`dtmi:...:production_step_mixing;3` -> `production_step_mixing`."""
+  return model_id.rsplit(":", 1)[-1].split(";", 1)[0]
+
+
+def step_type(model_id):
+  """`mixing`, `coating`, `calendering`, ... for production step models, otherwise None."""
+  name = model_name(model_id)
+  return name[len(_STEP_PREFIX):] if name.startswith(_STEP_PREFIX) else None
+
+
+def _csr(n, sources, targets, kinds):
+  order = np.argsort(sources, kind="stable")
+  offsets = np.zeros(n + 1, dtype=np.int32)
+  np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+  return offsets, targets[order].astype(np.int32), kinds[order].astype(np.int16)
+
+
+def _gather(offsets, targets, kinds, frontier, kind_ids=None, with_sources=False):
+  """Vectorized concatenation of the adjacency lists of every twin in `frontier`."""
+  frontier = np.asarray(frontier, dtype=np.int32)
+  starts, ends = offsets[frontier], offsets[frontier + 1]
+  lengths = ends - starts
+  total = int(lengths.sum())
+  positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+  neighbours = targets[positions]
+  sources = np.repeat(frontier, lengths)
+  if kind_ids is not None:
+    keep = np.isin(kinds[positions], kind_ids)
+    neighbours, sources = neighbours[keep], sources[keep]
+  return (sources, neighbours) if with_sources else neighbours
+
+
+class TwinGraphStore:
+  """Read-only twin graph with CSR adjacency and secondary indexes."""
+
+  def __init__(self, ids, models, relationship_names, twin_model, out_csr, in_csr, twin_site, twin_line,
+               documents=None, relationship_ids=None):
+    self.ids = list(ids)
+    self.index = {twin_id: i for i, twin_id in enumerate(self.ids)}
+    self.models = list(models)
+    self.relationship_names = list(relationship_names)
+    self.twin_model = twin_model
+    self.out_offsets, self.out_targets, self.out_kinds = out_csr
+    self.in_offsets, self.in_sources, self.in_kinds = in_csr
+    self.twin_site = twin_site
+    self.twin_line = twin_line
+    self.documents = documents
+    self.relationship_ids = relationship_ids
+    self._build_indexes()
+
+  @classmethod
+  def from_graph(cls, graph, keep_documents=True):
+    """Build from a `digitalTwinsGraph` dict (`{"digitalTwins": [...], "relationships": [...]}`)."""
+    return cls.from_iterables(graph["digitalTwins"], graph.get("relationships", []), keep_documents)
+
+  @classmethod
+  def from_iterables(cls, twins, relationships, keep_documents=True):
+    ids, models, twin_model, documents = [], {}, [], [] if keep_documents else None
+    for twin in twins:
+      ids.append(twin["$dtId"])
+      twin_model.append(models.setdefault(twin["$metadata"]["$model"], len(models)))
+      if keep_documents:
+        documents.append({key: value for key, value in twin.items() if key != "$dtId"})
+    index = {twin_id: i for i, twin_id in enumerate(ids)}
+
+    names, sources, targets, kinds, relationship_ids = {}, [], [], [], {}
+    for relationship in relationships:
+      source, target = index[relationship["$sourceId"]], index[relationship["$targetId"]]
+      kind = names.setdefault(relationship["$relationshipName"], len(names))
+      sources.append(source)
+      targets.append(target)
+      kinds.append(kind)
+      relationship_ids[(source, target, kind)] = relationship.get("$relationshipId")
+
+    n = len(ids)
+    sources = np.asarray(sources, dtype=np.int32)
+    targets = np.asarray(targets, dtype=np.int32)
+    kinds = np.asarray(kinds, dtype=np.int16)
+    out_csr = _csr(n, sources, targets, kinds)
+    in_csr = _csr(n, targets, sources, kinds)
+    twin_model = np.asarray(twin_model, dtype=np.int32)
+    twin_site, twin_line = cls._membership(n, list(models), twin_model, list(names), out_csr)
+    return cls(ids, list(models), list(names), twin_model, out_csr, in_csr, twin_site, twin_line,
+               documents, relationship_ids)
+
+  @staticmethod
+  def _membership(n, models, twin_model, relationship_names, out_csr):
+    """Assign every twin the site and line it belongs to by walking containment relationships down from each site."""
+    twin_site = np.full(n, -1, dtype=np.int32)
+    twin_line = np.full(n, -1, dtype=np.int32)
+    kinds = {name: i for i, name in enumerate(relationship_names)}
+    runs_lines = [kinds[SITE_RUNS_LINES]] if SITE_RUNS_LINES in kinds else []
+    runs_steps = [kinds[LINE_RUNS_STEPS]] if LINE_RUNS_STEPS in kinds else []
+    site_models = [i for i, model in enumerate(models) if model_name(model) == _SITE_MODEL]
+    line_models = [i for i, model in enumerate(models) if model_name(model) == _LINE_MODEL]
+
+    sites = np.flatnonzero(np.isin(twin_model, site_models))
+    twin_site[sites] = sites
+    owners, lines = _gather(*out_csr, sites, runs_lines, with_sources=True)
+    twin_site[lines] = owners
+    lines = np.union1d(lines, np.flatnonzero(np.isin(twin_model, line_models)))  # include lines not run by any site
+    twin_line[lines] = lines
+    owners, steps = _gather(*out_csr, lines, runs_steps, with_sources=True)
+    twin_site[steps] = twin_site[owners]
+    twin_line[steps] = owners
+    return twin_site, twin_line
+
+  def _build_indexes(self):
+    self.by_model = {model: np.flatnonzero(self.twin_model == i).astype(np.int32) for i, model in enumerate(self.models)}
+    self.by_step_type = {}
+    for model, members in self.by_model.items():
+      kind = step_type(model)
+      if kind is not None:
+        self.by_step_type[kind] = np.union1d(self.by_step_type.get(kind, members), members).astype(np.int32)
+
+  def __len__(self):
+    return len(self.ids)
+
+  def __contains__(self, twin_id):
+    return twin_id in self.index
+
+  # --- lookups -------------------------------------------------------------------------------
+
+  def _kind_ids(self, relationships):
+    if relationships is None:
+      return None
+    if isinstance(relationships, str):
+      relationships = (relationships,)
+    return [self.relationship_names.index(name) for name in relationships if name in self.relationship_names]
+
+  def _names(self, indexes):
+    return [self.ids[i] for i in indexes]
+
+  def model_of(self, twin_id):
+    return self.models[self.twin_model[self.index[twin_id]]]
+
+  def site_of(self, twin_id):
+    site = self.twin_site[self.index[twin_id]]
+    return self.ids[site] if site >= 0 else None
+
+  def line_of(self, twin_id):
+    line = self.twin_line[self.index[twin_id]]
+    return self.ids[line] if line >= 0 else None
+
+  def document(self, twin_id):
+    """The twin's original JSON document (only if built with `keep_documents=True`)."""
+    if self.documents is None:
+      raise ValueError("TwinGraphStore was built without twin documents")
+    return dict(self.documents[self.index[twin_id]], **{"$dtId": twin_id})
+
+  def select(self, model=None, step=None, site=None, line=None):
+    """dtIds matching every given filter, e.g. `select(step="mixing", site="MunichSite")`."""
+    mask = np.ones(len(self.ids), dtype=bool)
+    if model is not None:
+      mask &= self.twin_model == (self.models.index(model) if model in self.models else -1)
+    if step is not None:
+      members = np.zeros(len(self.ids), dtype=bool)
+      members[self.by_step_type.get(step, [])] = True
+      mask &= members
+    if site is not None:
+      mask &= self.twin_site == self.index.get(site, -2)
+    if line is not None:
+      mask &= self.twin_line == self.index.get(line, -2)
+    return self._names(np.flatnonzero(mask))
+
+  # --- traversal -----------------------------------------------------------------------------
+
+  def neighbors(self, twin_id, relationships=None, direction="out"):
+    """Direct targets (`direction="out"`) or sources (`"in"`) of a twin's relationships."""
+    csr = (self.out_offsets, self.out_targets, self.out_kinds) if direction == "out" else (self.in_offsets, self.in_sources, self.in_kinds)
+    return self._names(_gather(*csr, np.array([self.index[twin_id]]), self._kind_ids(relationships)))
+
+  def _reachable(self, start, csr, kind_ids):
+    # visited set kept as a sorted array, so the cost follows the size of the traversal, not of the graph
+    frontier = visited = np.unique(np.asarray(start, dtype=np.int32))
+    found = []
+    while frontier.size:
+      neighbours = np.setdiff1d(_gather(*csr, frontier, kind_ids), visited)
+      visited = np.union1d(visited, neighbours)
+      found.append(neighbours)
+      frontier = neighbours
+    return np.concatenate(found).astype(np.int32) if found else np.empty(0, dtype=np.int32)
+
+  def reachable(self, indexes, relationships=LEADS_TO, direction="out"):
+    """Indexes of the twins (transitively) reached from twin `indexes` by following `relationships`."""
+    csr = (self.out_offsets, self.out_targets, self.out_kinds) if direction == "out" else (self.in_offsets, self.in_sources, self.in_kinds)
+    return self._reachable(np.atleast_1d(indexes), csr, self._kind_ids(relationships))
+
+  def ancestors(self, twin_id, relationships=CONTAINMENT):
+    """Twins that (transitively) contain this one, nearest first: e.g. step -> line -> site."""
+    csr = (self.in_offsets, self.in_sources, self.in_kinds)
+    return self._names(self._reachable([self.index[twin_id]], csr, self._kind_ids(relationships)))
+
+  def descendants(self, twin_id, relationships=CONTAINMENT):
+    """Twins (transitively) contained by this one: e.g. site -> lines -> steps."""
+    csr = (self.out_offsets, self.out_targets, self.out_kinds)
+    return self._names(self._reachable([self.index[twin_id]], csr, self._kind_ids(relationships)))
+
+  def downstream(self, twin_ids, relationships=LEADS_TO):
+    """Steps reached from the given step(s) by following `leads_to`."""
+    if isinstance(twin_ids, str):
+      twin_ids = [twin_ids]
+    csr = (self.out_offsets, self.out_targets, self.out_kinds)
+    return self._names(self._reachable([self.index[t] for t in twin_ids], csr, self._kind_ids(relationships)))
+
+  def upstream(self, twin_ids, relationships=LEADS_TO):
+    """Steps that (transitively) lead to the given step(s)."""
+    if isinstance(twin_ids, str):
+      twin_ids = [twin_ids]
+    csr = (self.in_offsets, self.in_sources, self.in_kinds)
+    return self._names(self._reachable([self.index[t] for t in twin_ids], csr, self._kind_ids(relationships)))
+
+  def relationships(self):
+    """Yield relationships in ADT export form."""
+    for source in range(len(self.ids)):
+      for position in range(self.out_offsets[source], self.out_offsets[source + 1]):
+        target, kind = int(self.out_targets[position]), int(self.out_kinds[position])
+        relationship_id = (self.relationship_ids or {}).get((source, target, kind))
+        yield {
+          "$relationshipId": relationship_id or f"{self.ids[source]}-{self.relationship_names[kind]}-{self.ids[target]}",
+          "$sourceId": self.ids[source],
+          "$targetId": self.ids[target],
+          "$relationshipName": self.relationship_names[kind],
+        }
+
+  # --- serialization -------------------------------------------------------------------------
+
+  def to_bytes(self, include_documents=True):
+    """Compact binary form: zlib-compressed JSON header plus raw numpy arrays."""
+    header = {"ids": self.ids, "models": self.models, "relationship_names": self.relationship_names}
+    if include_documents and self.documents is not None:
+      header["documents"] = self.documents
+    if self.relationship_ids is not None:
+      header["relationship_ids"] = [[s, t, k, r] for (s, t, k), r in self.relationship_ids.items()]
+    buffer = io.BytesIO()
+    np.savez(
+      buffer,
+      header=np.frombuffer(zlib.compress(json.dumps(header, separators=(",", ":")).encode()), dtype=np.uint8),
+      twin_model=self.twin_model, twin_site=self.twin_site, twin_line=self.twin_line,
+      out_offsets=self.out_offsets, out_targets=self.out_targets, out_kinds=self.out_kinds,
+      in_offsets=self.in_offsets, in_sources=self.in_sources, in_kinds=self.in_kinds,
+    )
+    return buffer.getvalue()
+
+  @classmethod
+  def from_bytes(cls, data):
+    arrays = np.load(io.BytesIO(data), allow_pickle=False)
+    header = json.loads(zlib.decompress(arrays["header"].tobytes()))
+    relationship_ids = None
+    if "relationship_ids" in header:
+      relationship_ids = {(s, t, k): r for s, t, k, r in header["relationship_ids"]}
+    return cls(
+      header["ids"], header["models"], header["relationship_names"], arrays["twin_model"],
+      (arrays["out_offsets"], arrays["out_targets"], arrays["out_kinds"]),
+      (arrays["in_offsets"], arrays["in_sources"], arrays["in_kinds"]),
+      arrays["twin_site"], arrays["twin_line"], header.get("documents"), relationship_ids,
+    )
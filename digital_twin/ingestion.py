@@ -0,0 +1,105 @@
+"""
+Streaming readers for vibration readings from IoT devices (or `digital_twin.simulator`): files in
+the landing zone, or binary messages on Kafka / Event Hubs (`digital_twin.messages`).
+"""
+
+from digital_twin.schema import FEATURE_SCHEMA_DDL, LANDING_SCHEMA_DDL
+
+# landing format -> (Auto Loader `cloudFiles.format`, file extension)
+LANDING_ZONE_FORMATS = {
+  "csv": ("csv", "csv"),
+  "ndjson": ("json", "json"),
+  "parquet": ("parquet", "parquet"),
+}
+
+
+def read_landing_zone(spark, path, schema_location, landing_format="csv", max_files_per_trigger=None):
+  """
+  Auto Loader stream over the landing zone. `landing_format` is `csv` for one small CSV per reading,
+  or `ndjson`/`parquet` for batched files holding many typed readings each. Only files with the
+  format's extension are picked up, so a landing zone can be migrated from one layout to the other.
+  """
+  cloud_files_format, extension = LANDING_ZONE_FORMATS[landing_format]
+  reader = (
+    spark
+      .readStream
+      .format("cloudFiles")
+      .option("cloudFiles.format", cloud_files_format)
+      .option("cloudFiles.schemaLocation", schema_location)
+      .option("cloudFiles.schemaHints", LANDING_SCHEMA_DDL)
+      .option("cloudFiles.useIncrementalListing", "true")
+      .option("pathGlobFilter", f"*.{extension}")
+  )
+  if landing_format == "csv":
+    reader = reader.option("header", "true")
+  if max_files_per_trigger is not None:
+    reader = reader.option("cloudFiles.maxFilesPerTrigger", str(max_files_per_trigger))
+  return reader.load(path)
+
+
+def _decode_struct_batches(batches):
+  """`mapInPandas` body: fixed-layout `value` bytes to feature and `event_time` columns."""
+  import pandas as pd
+
+  from digital_twin.messages import decode_struct
+  from digital_twin.schema import FEATURE_COLUMNS
+
+  for batch in batches:
+    event_times_ms, features = decode_struct(batch["value"].tolist())
+    frame = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+    frame["event_time"] = pd.to_datetime(event_times_ms, unit="ms", utc=True)
+    yield pd.concat([batch.drop(columns="value").reset_index(drop=True), frame], axis=1)
+
+
+def read_message_stream(spark, bootstrap_servers, topic, encoding="struct", options=None,
+                        starting_offsets="latest", max_offsets_per_trigger=None):
+  """
+  Structured Streaming read of vibration messages from Kafka, or Event Hubs' Kafka endpoint (pass
+  `digital_twin.messages.event_hubs_spark_options` as `options`), in the landing-zone layout of
+  `read_landing_zone`. Values are decoded from the binary `encoding` of `digital_twin.messages`
+  (`struct` with one `np.frombuffer` per Arrow batch, `avro` with Spark's `from_avro`), the message
+  key is the station id and the `device_id` header the device id. `fileName` becomes
+  `topic/partition@offset` so downstream lineage keeps working, and the broker's append time is kept
+  as `enqueued_time` for latency measurements.
+  """
+  import pyspark.sql.functions as F
+
+  from digital_twin.messages import AVRO_SCHEMA_JSON, DEVICE_ID_HEADER
+  from digital_twin.schema import FEATURE_COLUMNS
+
+  reader = (
+    spark
+      .readStream
+      .format("kafka")
+      .option("kafka.bootstrap.servers", bootstrap_servers)
+      .option("subscribe", topic)
+      .option("startingOffsets", starting_offsets)
+      .option("includeHeaders", "true")
+  )
+  for key, value in (options or {}).items():
+    reader = reader.option(key, value)
+  if max_offsets_per_trigger is not None:
+    reader = reader.option("maxOffsetsPerTrigger", str(max_offsets_per_trigger))
+
+  device_header = F.filter("headers", lambda header: header["key"] == DEVICE_ID_HEADER)
+  messages = reader.load().select(
+    F.format_string("%s/%d@%d", "topic", "partition", "offset").alias("fileName"),
+    "value",
+    F.col("key").cast("string").alias("station_id"),
+    F.element_at(device_header, 1)["value"].cast("string").alias("device_id"),
+    F.col("timestamp").alias("enqueued_time"),
+  )
+  landing_columns = ["fileName", *FEATURE_COLUMNS, "station_id", "device_id", "event_time", "enqueued_time"]
+  if encoding == "struct":
+    schema = f"fileName string, station_id string, device_id string, enqueued_time timestamp, {FEATURE_SCHEMA_DDL}, event_time timestamp"
+    return messages.mapInPandas(_decode_struct_batches, schema).select(*landing_columns)
+  if encoding == "avro":
+    from pyspark.sql.avro.functions import from_avro
+
+    return (
+      messages
+        .withColumn("reading", from_avro("value", AVRO_SCHEMA_JSON))
+        .select("fileName", "station_id", "device_id", "enqueued_time", "reading.*")
+        .select(*landing_columns)
+    )
+  raise ValueError(f"Unknown message encoding: {encoding}")
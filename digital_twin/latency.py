@@ -0,0 +1,219 @@
+"""
+Per-record latency instrumentation from device upload to twin update.
+
+Every reading carries one timestamp column per pipeline stage (`STAGE_COLUMNS`):
+
+- `upload_time`: taken on the device (its `event_time`, else when its landing file was written)
+- `ingest_time`: accepted by the platform (landing file modification time, or the Kafka / Event Hubs enqueue time)
+- `parse_time`: picked up and parsed by a micro-batch (the batch's `current_timestamp()`)
+- `score_time`: scored by the model (wall clock per Arrow batch, see `inference.with_fault_predictions`)
+- `publish_time`: acknowledged by ADT (wall clock on the driver, after the publish)
+
+Latencies between consecutive stamps are kept as fixed log2-bucket histograms in milliseconds, so a
+micro-batch only ships a few dozen counters. The Spark-side stages are aggregated with
+`DataFrame.observe` inside the streaming query itself (no extra job) and handed over by
+`latency_listener`; the publish stage is recorded on the driver from the records the publisher has
+already collected. `PipelineLatency.flush` appends per-batch rows to a Delta metrics table.
+"""
+
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+STAGES = ("upload", "ingest", "parse", "score", "publish")
+STAGE_COLUMNS = {stage: f"{stage}_time" for stage in STAGES}
+
+# (interval, from stage, to stage): measured per record in Spark, or on the driver after publishing
+SPARK_INTERVALS = (("ingest", "upload", "ingest"), ("parse", "ingest", "parse"), ("score", "parse", "score"))
+PUBLISH_INTERVALS = (("publish", "score", "publish"), ("end_to_end", "upload", "publish"))
+
+# Bucket i counts latencies in (BUCKET_BOUNDS_MS[i-1], BUCKET_BOUNDS_MS[i]]; the last bucket is everything above ~131 s
+BUCKET_BOUNDS_MS = np.array([2.0 ** i for i in range(18)])
+BUCKETS = len(BUCKET_BOUNDS_MS) + 1
+
+METRICS_TABLE = "digital_twins.pipeline_latency"
+METRICS_COLUMNS = ["recorded_at", "query", "batch_id", "stage", "count", "p50_ms", "p90_ms", "p99_ms", "max_ms", "histogram"]
+METRICS_SCHEMA_DDL = (
+  "recorded_at timestamp, query string, batch_id long, stage string, count long, "
+  "p50_ms double, p90_ms double, p99_ms double, max_ms double, histogram array<bigint>"
+)
+
+
+class LatencyHistogram:
+  """Counts of latencies (ms) per log2 bucket, with percentiles read off the bucket bounds."""
+
+  def __init__(self, counts=None, max_ms=0.0):
+    self.counts = np.zeros(BUCKETS, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+    self.max_ms = max_ms or 0.0
+
+  @property
+  def count(self):
+    return int(self.counts.sum())
+
+  def observe(self, latencies_ms):
+    latencies_ms = np.asarray(latencies_ms, dtype=np.float64)
+    latencies_ms = latencies_ms[~np.isnan(latencies_ms)]
+    if len(latencies_ms):
+      self.counts += np.bincount(np.searchsorted(BUCKET_BOUNDS_MS, latencies_ms), minlength=BUCKETS)
+      self.max_ms = max(self.max_ms, float(latencies_ms.max()))
+    return self
+
+  def merge(self, other):
+    self.counts += other.counts
+    self.max_ms = max(self.max_ms, other.max_ms)
+    return self
+
+  def percentile(self, q):
+    """Upper bound of the bucket holding the nearest-rank `q`th percentile, capped at the maximum seen."""
+    if not self.count:
+      return float("nan")
+    bucket = int(np.searchsorted(np.cumsum(self.counts), max(1, math.ceil(q / 100 * self.count))))
+    return min(float(BUCKET_BOUNDS_MS[bucket]), self.max_ms) if bucket < len(BUCKET_BOUNDS_MS) else self.max_ms
+
+  def summary(self):
+    return {
+      "count": self.count, "p50_ms": self.percentile(50), "p90_ms": self.percentile(90),
+      "p99_ms": self.percentile(99), "max_ms": self.max_ms if self.count else float("nan"),
+    }
+
+
+# --- Spark side -------------------------------------------------------------------------------
+
+
+def stamp_ingestion(df, ingest_column):
+  """
+  Add `upload_time` (the device's `event_time`, else `ingest_column`), `ingest_time` and
+  `parse_time` (the micro-batch's timestamp) to a freshly read stream.
+  """
+  import pyspark.sql.functions as F
+
+  return (
+    df
+      .withColumn(STAGE_COLUMNS["ingest"], F.col(ingest_column))
+      .withColumn(STAGE_COLUMNS["upload"], F.coalesce(F.col("event_time"), F.col(STAGE_COLUMNS["ingest"])))
+      .withColumn(STAGE_COLUMNS["parse"], F.current_timestamp())
+  )
+
+
+def latency_aggregates(intervals=SPARK_INTERVALS):
+  """Aggregate expressions giving, per interval, a `<interval>_histogram` count array and `<interval>_max_ms`."""
+  import pyspark.sql.functions as F
+
+  expressions = []
+  for interval, start, end in intervals:
+    ms = (F.col(STAGE_COLUMNS[end]).cast("double") - F.col(STAGE_COLUMNS[start]).cast("double")) * 1000
+    bucket = F.when(ms.isNotNull(), F.least(F.ceil(F.log2(F.greatest(ms, F.lit(1.0)))), F.lit(BUCKETS - 1)))
+    expressions.append(F.array(*[F.sum(F.when(bucket == i, 1).otherwise(0)) for i in range(BUCKETS)]).alias(f"{interval}_histogram"))
+    expressions.append(F.max(ms).alias(f"{interval}_max_ms"))
+  return expressions
+
+
+def observe_latency(df, name="latency", intervals=SPARK_INTERVALS):
+  """Attach the stage histograms to `df` as observed metrics, reported with each micro-batch's progress."""
+  return df.observe(name, *latency_aggregates(intervals))
+
+
+def latency_listener(latency, name="latency"):
+  """`StreamingQueryListener` passing each query progress (observed histograms and trigger durations) to `latency`."""
+  from pyspark.sql.streaming import StreamingQueryListener
+
+  class LatencyListener(StreamingQueryListener):
+    def onQueryStarted(self, event):
+      pass
+
+    def onQueryProgress(self, event):
+      progress = event.progress
+      metrics = progress.observedMetrics.get(name)
+      latency.record_progress(
+        progress.batchId, metrics.asDict() if metrics is not None else {},
+        durations=dict(progress.durationMs or {}), query=progress.name,
+      )
+
+    def onQueryIdle(self, event):
+      pass
+
+    def onQueryTerminated(self, event):
+      pass
+
+  return LatencyListener()
+
+
+# --- driver side ------------------------------------------------------------------------------
+
+
+def _epoch_seconds(value):
+  if value is None:
+    return float("nan")
+  if isinstance(value, (int, float)):
+    return float(value)
+  return value.timestamp()  # datetime collected from Spark, or pandas Timestamp
+
+
+class PipelineLatency:
+  """
+  Cumulative per-interval histograms for a pipeline, plus per-batch metric rows waiting to be flushed.
+  Progress arrives on the listener thread and publishes on the `foreachBatch` thread, hence the lock.
+  """
+
+  def __init__(self, query="digital_twin", clock=time.time):
+    self.query = query
+    self.clock = clock
+    self.histograms = {}
+    self.pending = []
+    self._lock = threading.Lock()
+
+  def _record(self, batch_id, interval, histogram, query=None):
+    self.histograms.setdefault(interval, LatencyHistogram()).merge(histogram)
+    self.pending.append({
+      "recorded_at": datetime.fromtimestamp(self.clock(), tz=timezone.utc), "query": query or self.query,
+      "batch_id": batch_id, "stage": interval, **histogram.summary(), "histogram": histogram.counts.tolist(),
+    })
+
+  def record_progress(self, batch_id, metrics, durations=None, query=None):
+    """Observed `latency_aggregates` of one micro-batch, and its trigger phase durations (`trigger.addBatch`, ...)."""
+    with self._lock:
+      for interval, _, _ in SPARK_INTERVALS:
+        counts = metrics.get(f"{interval}_histogram")
+        if counts is not None and sum(counts):
+          self._record(batch_id, interval, LatencyHistogram(counts, metrics.get(f"{interval}_max_ms")), query)
+      self._record_durations(batch_id, durations or {}, "trigger", query)
+
+  def _record_durations(self, batch_id, durations, prefix, query=None):
+    for phase, ms in durations.items():
+      self._record(batch_id, f"{prefix}.{phase}", LatencyHistogram().observe([ms]), query)
+
+  def record_durations(self, batch_id, durations, prefix, query=None):
+    """One-off `{phase: ms}` durations, recorded as `<prefix>.<phase>` stages (e.g. `startup.StartupTimer.durations_ms`)."""
+    with self._lock:
+      self._record_durations(batch_id, durations, prefix, query)
+
+  def record_published(self, batch_id, records, sent, publish_time=None):
+    """
+    Publish and end-to-end latency of the `{twin_id: record}` batch a publisher collected
+    (`TwinPatchPublisher.last_records`), for the twins it actually updated (`sent`).
+    """
+    publish_time = self.clock() if publish_time is None else publish_time
+    sent = [records[twin_id] for twin_id in sent if twin_id in records]
+    if not sent:
+      return
+    with self._lock:
+      for interval, start, _ in PUBLISH_INTERVALS:
+        started = np.array([_epoch_seconds(record.get(STAGE_COLUMNS[start])) for record in sent])
+        self._record(batch_id, interval, LatencyHistogram().observe((publish_time - started) * 1000))
+
+  def summary(self):
+    """Cumulative `{interval: {count, p50_ms, p90_ms, p99_ms, max_ms}}`."""
+    with self._lock:
+      return {interval: histogram.summary() for interval, histogram in self.histograms.items()}
+
+  def flush(self, spark, table=METRICS_TABLE):
+    """Append the pending per-batch rows to a Delta table; returns how many were written."""
+    with self._lock:
+      rows, self.pending = self.pending, []
+    if rows:
+      frame = spark.createDataFrame([[row[column] for column in METRICS_COLUMNS] for row in rows], METRICS_SCHEMA_DDL)
+      frame.write.format("delta").mode("append").saveAsTable(table)
+    return len(rows)
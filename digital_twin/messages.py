@@ -0,0 +1,236 @@
+"""
+Message-based ingestion: vibration readings as compact binary Kafka / Event Hubs records.
+
+Each reading is one message keyed by its station id, with the device id in a `device_id` header
+and one of two value encodings, both carrying the reading's event time (epoch milliseconds) and the
+nine `FEATURE_COLUMNS` as float32:
+
+- `struct`: a fixed 44-byte little-endian layout (`RECORD_DTYPE`), decoded for a whole batch with
+  a single `np.frombuffer`
+- `avro`: an Avro binary datum of `AVRO_SCHEMA`, decoded natively by Spark's `from_avro`
+
+Either way there is no text parsing. `LocalBroker` is an in-process, Kafka-like stand-in (topics,
+key-hashed partitions, offsets) for running the simulator and latency benchmarks without a cluster;
+`KafkaProducerSink` sends to a real Kafka or Event Hubs (Kafka endpoint) through `confluent_kafka`.
+"""
+
+import json
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from digital_twin.schema import FEATURE_COLUMNS
+
+RECORD_DTYPE = np.dtype([("event_time_ms", "<i8")] + [(column, "<f4") for column in FEATURE_COLUMNS])
+RECORD_SIZE = RECORD_DTYPE.itemsize
+
+AVRO_SCHEMA = {
+  "type": "record",
+  "name": "VibrationReading",
+  "namespace": "digital_twin",
+  "fields": [{"name": "event_time", "type": {"type": "long", "logicalType": "timestamp-millis"}}]
+  + [{"name": column, "type": "float"} for column in FEATURE_COLUMNS],
+}
+AVRO_SCHEMA_JSON = json.dumps(AVRO_SCHEMA)
+
+DEVICE_ID_HEADER = "device_id"
+_FEATURES_DTYPE = np.dtype([(column, "<f4") for column in FEATURE_COLUMNS])
+
+
+def encode_struct(features, event_times_ms):
+  """One fixed-layout value per reading of an `(n, 9)` feature array."""
+  records = np.empty(len(features), dtype=RECORD_DTYPE)
+  records["event_time_ms"] = event_times_ms
+  for i, column in enumerate(FEATURE_COLUMNS):
+    records[column] = features[:, i]
+  data = records.tobytes()
+  return [data[i:i + RECORD_SIZE] for i in range(0, len(data), RECORD_SIZE)]
+
+
+def decode_struct(values):
+  """`(event_times_ms int64[n], features float32[n, 9])` of a sequence of fixed-layout values."""
+  records = np.frombuffer(b"".join(values), dtype=RECORD_DTYPE)
+  features = np.stack([records[column] for column in FEATURE_COLUMNS], axis=1) if len(records) else np.empty((0, len(FEATURE_COLUMNS)), np.float32)
+  return records["event_time_ms"].astype(np.int64), features
+
+
+def _zigzag_varint(value):
+  value = (value << 1) ^ (value >> 63)
+  out = bytearray()
+  while value > 0x7F:
+    out.append((value & 0x7F) | 0x80)
+    value >>= 7
+  out.append(value)
+  return bytes(out)
+
+
+def encode_avro(features, event_times_ms):
+  """One Avro binary datum of `AVRO_SCHEMA` per reading (a zig-zag varint long, then nine little-endian floats)."""
+  floats = np.ascontiguousarray(features, dtype="<f4").view(_FEATURES_DTYPE).ravel()
+  return [_zigzag_varint(int(t)) + row.tobytes() for t, row in zip(event_times_ms, floats)]
+
+
+def decode_avro(values):
+  """Same as `decode_struct`, for Avro datums (decoded in Python; Spark uses `from_avro` instead)."""
+  times, blobs = np.empty(len(values), dtype=np.int64), []
+  for i, value in enumerate(values):
+    result = shift = position = 0
+    while True:
+      byte = value[position]
+      result |= (byte & 0x7F) << shift
+      position += 1
+      if byte < 0x80:
+        break
+      shift += 7
+    times[i] = (result >> 1) ^ -(result & 1)
+    blobs.append(value[position:position + 4 * len(FEATURE_COLUMNS)])
+  features = np.frombuffer(b"".join(blobs), dtype="<f4").reshape(-1, len(FEATURE_COLUMNS))
+  return times, features
+
+
+MESSAGE_ENCODERS = {"struct": encode_struct, "avro": encode_avro}
+MESSAGE_DECODERS = {"struct": decode_struct, "avro": decode_avro}
+MESSAGE_FORMATS = tuple(MESSAGE_ENCODERS)
+
+
+def messages_frame(messages, encoding="struct"):
+  """
+  pandas DataFrame of `(key, value, headers, timestamp_ms)` messages in the landing-zone layout
+  (`FEATURE_COLUMNS`, `station_id`, `device_id`, `event_time`) plus the broker's `enqueued_time`.
+  """
+  import pandas as pd
+
+  event_times_ms, features = MESSAGE_DECODERS[encoding]([value for _, value, _, _ in messages])
+  frame = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+  frame["station_id"] = [key.decode() if isinstance(key, bytes) else key for key, _, _, _ in messages]
+  frame["device_id"] = [(headers or {}).get(DEVICE_ID_HEADER) for _, _, headers, _ in messages]
+  frame["event_time"] = pd.to_datetime(event_times_ms, unit="ms", utc=True)
+  frame["enqueued_time"] = pd.to_datetime([timestamp for _, _, _, timestamp in messages], unit="ms", utc=True)
+  return frame
+
+
+# --- brokers and sinks ------------------------------------------------------------------------
+
+
+class LocalBroker:
+  """
+  In-process stand-in for a Kafka topic: messages are appended to partitions chosen by key hash and
+  read back by offset. `latency` (seconds) is added to every produce call, like a network round trip.
+  """
+
+  def __init__(self, partitions=4, latency=0.0):
+    self.partitions = partitions
+    self.latency = latency
+    self.topics = {}
+    self._lock = threading.Lock()
+
+  def _topic(self, topic):
+    if topic not in self.topics:
+      self.topics[topic] = [[] for _ in range(self.partitions)]
+    return self.topics[topic]
+
+  def produce(self, topic, key, value, headers=None):
+    if self.latency:
+      time.sleep(self.latency)
+    key = key.encode() if isinstance(key, str) else key
+    partition = zlib.crc32(key or b"") % self.partitions
+    with self._lock:
+      log = self._topic(topic)[partition]
+      log.append((key, value, dict(headers or {}), int(time.time() * 1000)))
+      return partition, len(log) - 1
+
+  def fetch(self, topic, offsets, max_messages=None):
+    """Messages after `offsets` (`{partition: next offset}`, updated in place), oldest first per partition."""
+    with self._lock:
+      partitions = self._topic(topic)
+      batch = []
+      for partition, log in enumerate(partitions):
+        start = offsets.get(partition, 0)
+        end = len(log) if max_messages is None else min(len(log), start + max_messages - len(batch))
+        batch.extend(log[start:end])
+        offsets[partition] = end
+      return batch
+
+
+class LocalConsumer:
+  """Polls one topic of a `LocalBroker`, tracking its own offsets."""
+
+  def __init__(self, broker, topic, max_messages=None):
+    self.broker = broker
+    self.topic = topic
+    self.max_messages = max_messages
+    self.offsets = {}
+
+  def poll(self):
+    return self.broker.fetch(self.topic, self.offsets, self.max_messages)
+
+
+class BrokerSink:
+  """Simulator sink producing to a `LocalBroker` topic."""
+
+  def __init__(self, broker, topic):
+    self.broker = broker
+    self.topic = topic
+
+  def send(self, key, value, headers=None):
+    self.broker.produce(self.topic, key, value, headers)
+
+  def flush(self):
+    pass
+
+
+class KafkaProducerSink:
+  """Simulator sink producing to Kafka or Event Hubs through a `confluent_kafka.Producer` (batched by the client)."""
+
+  def __init__(self, producer, topic):
+    self.producer = producer
+    self.topic = topic
+
+  @classmethod
+  def from_config(cls, config, topic):
+    from confluent_kafka import Producer
+    return cls(Producer(config), topic)
+
+  def send(self, key, value, headers=None):
+    headers = [(name, item.encode() if isinstance(item, str) else item) for name, item in (headers or {}).items()]
+    while True:
+      try:
+        self.producer.produce(self.topic, key=key, value=value, headers=headers)
+        break
+      except BufferError:  # local queue full: let deliveries drain, then retry
+        self.producer.poll(0.1)
+    self.producer.poll(0)
+
+  def flush(self):
+    self.producer.flush()
+
+
+def event_hubs_producer_config(namespace, connection_string, **overrides):
+  """`confluent_kafka` config for an Event Hubs namespace's Kafka endpoint."""
+  config = {
+    "bootstrap.servers": f"{namespace}.servicebus.windows.net:9093",
+    "security.protocol": "SASL_SSL",
+    "sasl.mechanisms": "PLAIN",
+    "sasl.username": "$ConnectionString",
+    "sasl.password": connection_string,
+    "linger.ms": 5,
+    "compression.type": "lz4",
+  }
+  config.update(overrides)
+  return config
+
+
+def event_hubs_spark_options(namespace, connection_string):
+  """Spark Kafka source options for an Event Hubs namespace's Kafka endpoint (Databricks' shaded Kafka client)."""
+  jaas = (
+    "kafkashaded.org.apache.kafka.common.security.plain.PlainLoginModule required "
+    f'username="$ConnectionString" password="{connection_string}";'
+  )
+  return {
+    "kafka.bootstrap.servers": f"{namespace}.servicebus.windows.net:9093",
+    "kafka.security.protocol": "SASL_SSL",
+    "kafka.sasl.mechanism": "PLAIN",
+    "kafka.sasl.jaas.config": jaas,
+  }
@@ -0,0 +1,249 @@
+"""
+Mirror of live twin properties in Delta, so analytics and publishers read twin state at scan speed.
+
+Every patch the publishers send is also applied to a state table (one row per twin, properties as a
+`map<string,string>` of JSON pointer -> JSON-encoded value), merged per micro-batch and partitioned
+by site and model, and appended to a change-history table (one row per patch operation). Dashboards
+and the root cause analysis can join twin state in SQL, e.g. `get_json_object(properties['/HealthPrediction'], '$')`,
+and a restarted publisher can seed what it last published from the mirror (`published_state`)
+instead of reading every twin back from ADT.
+
+Replayed micro-batches are recognised by their `batch_id` within a run (`run_id`, e.g. the streaming
+query id from `stream_run_id`, which is stable across restarts from the same checkpoint): batch ids
+start again at 0 when a stream runs without its checkpoint, so batches of another run always apply.
+
+`DeltaTwinMirror` is the Spark/Delta implementation; `ParquetTwinMirror` keeps the same layout as
+plain partitioned Parquet files and runs with pandas/pyarrow only, for local runs.
+"""
+
+import json
+import os
+import time
+
+from digital_twin.graph import model_name
+
+STATE_SCHEMA_DDL = (
+  "twin_id string, site_id string, model string, model_id string, line_id string, "
+  "properties map<string,string>, version long, run_id string, batch_id long, updated_at timestamp"
+)
+HISTORY_SCHEMA_DDL = (
+  "twin_id string, site_id string, model string, path string, op string, value string, "
+  "run_id string, batch_id long, changed_at timestamp"
+)
+PARTITION_COLUMNS = ["site_id", "model"]
+
+
+def stream_run_id(spark):
+  """
+  Id of the streaming query whose `foreachBatch` function is running (call it from there): kept
+  across restarts from the same checkpoint, new when the query starts without one.
+  """
+  return spark.sparkContext.getLocalProperty("sql.streaming.queryId")
+
+
+def merge_patches(*patch_sets):
+  """Combine `{twin_id: patch}` mappings from several publishers, keeping operation order per twin."""
+  merged = {}
+  for patches in patch_sets:
+    for twin_id, patch in patches.items():
+      merged[twin_id] = merged.get(twin_id, []) + list(patch)
+  return merged
+
+
+def change_rows(patches, store, batch_id, changed_at, run_id=None):
+  """
+  `(state_rows, history_rows)` for a micro-batch of `{twin_id: patch}`: per twin the properties set
+  and removed, per operation one history row. Site, line and model come from a `TwinGraphStore`.
+  """
+  state_rows, history_rows = [], []
+  for twin_id, patch in patches.items():
+    known = twin_id in store
+    site_id = store.site_of(twin_id) if known else None
+    model_id = store.model_of(twin_id) if known else None
+    line_id = store.line_of(twin_id) if known else None
+    model = model_name(model_id) if model_id else None
+    properties, removed = {}, []
+    for operation in patch:
+      op, path = operation["op"], operation["path"]
+      if op == "test":
+        continue
+      value = json.dumps(operation["value"]) if op != "remove" else None
+      if op == "remove":
+        properties.pop(path, None)
+        removed.append(path)
+      else:
+        properties[path] = value
+        if path in removed:
+          removed.remove(path)
+      history_rows.append((twin_id, site_id, model, path, op, value, run_id, batch_id, changed_at))
+    state_rows.append((twin_id, site_id, model, model_id, line_id, properties, removed, run_id, batch_id, changed_at))
+  return state_rows, history_rows
+
+
+def _published(rows):
+  return {twin_id: {path: json.loads(value) for path, value in properties.items()} for twin_id, properties in rows}
+
+
+class DeltaTwinMirror:
+  """Twin state and change history as Delta tables, merged/appended once per micro-batch."""
+
+  def __init__(self, spark, store, state_table="digital_twins.twin_state", history_table="digital_twins.twin_state_history"):
+    self.spark = spark
+    self.store = store
+    self.state_table = state_table
+    self.history_table = history_table
+
+  def create(self):
+    for table, schema in ((self.state_table, STATE_SCHEMA_DDL), (self.history_table, HISTORY_SCHEMA_DDL)):
+      self.spark.sql(
+        f"CREATE TABLE IF NOT EXISTS {table} ({schema}) USING DELTA PARTITIONED BY ({', '.join(PARTITION_COLUMNS)})"
+      )
+      if "run_id" not in self.spark.table(table).columns:  # tables created before runs were tracked
+        self.spark.sql(f"ALTER TABLE {table} ADD COLUMNS (run_id string)")
+    return self
+
+  def apply(self, patches, batch_id, run_id=None):
+    """
+    Merge one micro-batch of sent `{twin_id: patch}` into the state table and append its history.
+    Replays of the same `batch_id` within `run_id` (e.g. after a `foreachBatch` retry) are no-ops
+    for both tables; batches of another run are always applied.
+    """
+    if not patches:
+      return
+    from datetime import datetime, timezone
+
+    from delta.tables import DeltaTable
+
+    state_rows, history_rows = change_rows(patches, self.store, batch_id, datetime.now(timezone.utc), run_id)
+    source_schema = STATE_SCHEMA_DDL.replace("version long, ", "").replace(
+      "properties map<string,string>, ", "properties map<string,string>, removed array<string>, "
+    )
+    source = self.spark.createDataFrame(state_rows, source_schema)
+    # mirrored properties this batch neither sets nor removes, then this batch's values: no duplicate keys to dedup
+    merged = (
+      "map_concat(map_filter(t.properties, (k, v) -> NOT array_contains(map_keys(s.properties), k) "
+      "AND NOT array_contains(s.removed, k)), s.properties)"
+    )
+    (
+      DeltaTable.forName(self.spark, self.state_table).alias("t")
+        .merge(source.alias("s"), "t.twin_id = s.twin_id AND t.site_id <=> s.site_id AND t.model <=> s.model")
+        .whenMatchedUpdate(condition="NOT (t.run_id <=> s.run_id) OR t.batch_id < s.batch_id", set={
+          "properties": merged, "version": "t.version + 1", "run_id": "s.run_id", "batch_id": "s.batch_id",
+          "updated_at": "s.updated_at",
+        })
+        .whenNotMatchedInsert(values={
+          "twin_id": "s.twin_id", "site_id": "s.site_id", "model": "s.model", "model_id": "s.model_id",
+          "line_id": "s.line_id", "properties": "s.properties", "version": "1", "run_id": "s.run_id",
+          "batch_id": "s.batch_id", "updated_at": "s.updated_at",
+        })
+        .execute()
+    )
+    (
+      self.spark.createDataFrame(history_rows, HISTORY_SCHEMA_DDL)
+        .write.format("delta").mode("append")
+        .option("txnAppId", f"twin-mirror:{self.history_table}:{run_id}").option("txnVersion", batch_id)
+        .saveAsTable(self.history_table)
+    )
+
+  def state(self):
+    return self.spark.table(self.state_table)
+
+  def history(self):
+    return self.spark.table(self.history_table)
+
+  def published_state(self):
+    """`{twin_id: {json_pointer: value}}` as mirrored, to seed `TwinPatchPublisher(published=...)`."""
+    return _published((row["twin_id"], row["properties"]) for row in self.state().select("twin_id", "properties").collect())
+
+
+class ParquetTwinMirror:
+  """
+  Same tables as plain Parquet under `directory` (`state/` and `history/`, partitioned by site and model).
+  Each apply rewrites only the state partitions it touches; history files are named by run and batch
+  id, so a replayed batch is not appended twice.
+  """
+
+  def __init__(self, directory, store):
+    self.directory = directory
+    self.store = store
+    self.state_path = os.path.join(directory, "state")
+    self.history_path = os.path.join(directory, "history")
+
+  def _read(self, path, partitioned=False):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if not os.path.isdir(path):
+      return None
+    partitioning = ds.partitioning(pa.schema([(c, pa.string()) for c in PARTITION_COLUMNS]), flavor="hive") if partitioned else None
+    return ds.dataset(path, format="parquet", partitioning=partitioning).to_table().to_pandas()
+
+  def state(self):
+    import pandas as pd
+
+    frame = self._read(self.state_path, partitioned=True)
+    if frame is None:
+      return pd.DataFrame(columns=[c.split(" ")[0] for c in STATE_SCHEMA_DDL.split(", ")])
+    frame["properties"] = frame["properties"].map(dict)
+    for column in ("site_id", "model", "model_id", "line_id", "run_id"):  # None for twins outside the graph or runs
+      frame[column] = frame[column].astype(object).where(frame[column].notna(), None)
+    return frame
+
+  def history(self):
+    import pandas as pd
+
+    frame = self._read(self.history_path)
+    if frame is None:
+      return pd.DataFrame(columns=[c.split(" ")[0] for c in HISTORY_SCHEMA_DDL.split(", ")])
+    return frame.sort_values(["changed_at"], kind="stable", ignore_index=True)
+
+  def apply(self, patches, batch_id, run_id=None):
+    if not patches:
+      return
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    changed_at = pd.Timestamp(time.time(), unit="s", tz="UTC")
+    state_rows, history_rows = change_rows(patches, self.store, batch_id, changed_at, run_id)
+
+    current = self.state()
+    touched = {(site_id, model) for _, site_id, model, *_ in state_rows}
+    in_touched = [(site_id, model) in touched for site_id, model in zip(current["site_id"], current["model"])]
+    rows = {row["twin_id"]: row for row in current[in_touched].to_dict("records")}
+    for twin_id, site_id, model, model_id, line_id, properties, removed, _, _, updated_at in state_rows:
+      row = rows.get(twin_id)
+      if row is not None and row["run_id"] == run_id and row["batch_id"] >= batch_id:
+        continue  # replayed batch
+      merged = {**(row["properties"] if row else {}), **properties}
+      for path in removed:
+        merged.pop(path, None)
+      rows[twin_id] = {
+        "twin_id": twin_id, "site_id": site_id, "model": model, "model_id": model_id, "line_id": line_id,
+        "properties": merged, "version": (row["version"] + 1) if row else 1, "run_id": run_id, "batch_id": batch_id,
+        "updated_at": updated_at,
+      }
+
+    schema = pa.schema([
+      ("twin_id", pa.string()), ("site_id", pa.string()), ("model", pa.string()), ("model_id", pa.string()),
+      ("line_id", pa.string()), ("properties", pa.map_(pa.string(), pa.string())), ("version", pa.int64()),
+      ("run_id", pa.string()), ("batch_id", pa.int64()), ("updated_at", pa.timestamp("us", tz="UTC")),
+    ])
+    records = list(rows.values())
+    table = pa.Table.from_pydict({
+      name: [list(r[name].items()) if name == "properties" else r[name] for r in records] for name in schema.names
+    }, schema=schema)
+    # rewrites exactly the site/model partitions present in `table`, like a partition-pruned MERGE
+    pq.write_to_dataset(table, self.state_path, partition_cols=PARTITION_COLUMNS, existing_data_behavior="delete_matching")
+
+    name = f"batch-{batch_id:012d}.parquet" if run_id is None else f"run-{run_id}-batch-{batch_id:012d}.parquet"
+    history_file = os.path.join(self.history_path, name)
+    if not os.path.exists(history_file):  # replayed batch: its history is already there
+      history = pd.DataFrame(history_rows, columns=[c.split(" ")[0] for c in HISTORY_SCHEMA_DDL.split(", ")])
+      history["run_id"] = history["run_id"].astype("string")  # typed even when there is no run id
+      os.makedirs(self.history_path, exist_ok=True)
+      pq.write_table(pa.Table.from_pandas(history, preserve_index=False), history_file)
+
+  def published_state(self):
+    state = self.state()
+    return _published(zip(state["twin_id"], state["properties"]))
@@ -0,0 +1,60 @@
+"""
+Access to the reference artifacts checked into this repo (`models/`, `twins/`, `data/`).
+
+`cached_artifact` resolves an artifact to a local file: the repo's copy when it is checked out next
+to this package (e.g. Databricks Repos), otherwise a one-time download kept in `cache_dir`, so job
+restarts read from disk instead of fetching over HTTP.
+"""
+
+import glob
+import json
+import os
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(REPO_ROOT, "models")
+TWIN_GRAPH_PATH = os.path.join(REPO_ROOT, "twins", "TwinGraph.json")
+VIBRATION_REPORTS_PATH = os.path.join(REPO_ROOT, "data", "vibration_reports.csv")
+
+ARTIFACT_CACHE_DIR = os.environ.get("DIGITAL_TWIN_ARTIFACT_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "digital_twin"))
+
+
+def cached_artifact(path, url=None, cache_dir=ARTIFACT_CACHE_DIR):
+  """
+  Local path of a reference artifact: `path` if it exists, else `url` downloaded (once, atomically)
+  into `cache_dir` under the same file name, e.g. `/dbfs/tmp/digital_twin/artifacts` to share it across clusters.
+  """
+  if os.path.exists(path):
+    return path
+  if url is None:
+    raise FileNotFoundError(f"{path} does not exist and no url was given to download it from")
+  cached = os.path.join(cache_dir, os.path.basename(path))
+  if not os.path.exists(cached):
+    from urllib.request import urlopen
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=cache_dir, prefix=".tmp-")
+    try:
+      with os.fdopen(fd, "wb") as f, urlopen(url) as response:
+        f.write(response.read())
+      os.replace(temporary, cached)
+    except BaseException:
+      os.remove(temporary)
+      raise
+  return cached
+
+
+def load_models(models_dir=MODELS_DIR):
+  """All DTDL interfaces from `models/*.json`, flattened into one list."""
+  models = []
+  for path in sorted(glob.glob(os.path.join(models_dir, "*.json"))):
+    with open(path) as f:
+      content = json.load(f)
+    models.extend(content if isinstance(content, list) else [content])
+  return models
+
+
+def load_twin_graph(path=TWIN_GRAPH_PATH):
+  """The `digitalTwinsGraph` section of an ADT Explorer export: `{"digitalTwins": [...], "relationships": [...]}`."""
+  with open(path) as f:
+    return json.load(f)["digitalTwinsGraph"]
@@ -0,0 +1,34 @@
+"""Column names, schemas and label encodings shared by the ingestion, scoring and publishing stages."""
+
+# Summary statistics reported per vibration window, in landing-zone column order
+FEATURE_COLUMNS = ["max", "min", "mean", "sd", "rms", "skewness", "kurtosis", "crest", "form"]
+
+# DDL used as Auto Loader `cloudFiles.schemaHints`
+FEATURE_SCHEMA_DDL = ", ".join(f"{column} float" for column in FEATURE_COLUMNS)
+
+# Landing-zone files from the fleet simulator also say which station and device produced each reading,
+# and batched (NDJSON/Parquet) files when each reading was taken
+LANDING_SCHEMA_DDL = FEATURE_SCHEMA_DDL + ", station_id string, device_id string, event_time timestamp"
+
+LABEL_COLUMN = "fault"
+
+# Labels in data/vibration_reports.csv, encoded by position; 0 is the healthy class
+FAULT_CLASSES = [
+  "Normal_1",
+  "Ball_007_1", "Ball_014_1", "Ball_021_1",
+  "IR_007_1", "IR_014_1", "IR_021_1",
+  "OR_007_6_1", "OR_014_6_1", "OR_021_6_1",
+]
+NORMAL_CLASS = 0
+FAULT_CLASS_INDEX = {label: i for i, label in enumerate(FAULT_CLASSES)}
+
+# Bearing components of the mixing station model, and per fault class the component it names
+# (index into FAULT_COMPONENTS, -1 for the healthy class) and its severity as fault diameter in mils
+FAULT_COMPONENTS = ["InnerRing", "OuterRing", "BallBearings"]
+_COMPONENT_PREFIXES = {"IR": 0, "OR": 1, "Ball": 2}
+FAULT_CLASS_COMPONENT = [_COMPONENT_PREFIXES.get(label.split("_")[0], -1) for label in FAULT_CLASSES]
+FAULT_CLASS_SEVERITY = [0 if label.startswith("Normal") else int(label.split("_")[1]) for label in FAULT_CLASSES]
+
+
+def fault_label(fault_class):
+  return FAULT_CLASSES[fault_class]
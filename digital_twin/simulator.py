@@ -0,0 +1,403 @@
+"""
+Parallel IoT upload simulator for load-testing landing-zone ingestion.
+
+A fleet of simulated devices is attached to the mixing stations in TwinGraph.json. Each device has
+its own fault onset and fault class, and emits vibration reports sampled from
+data/vibration_reports.csv. Uploads run on a bounded thread pool that shares one pooled HTTP
+connection (or writes locally), paced by a token bucket to hold a target aggregate files/sec.
+With a message format (`struct`/`avro`) the simulator is a producer instead: every reading is sent
+as one binary message to a Kafka / Event Hubs topic (or `digital_twin.messages.LocalBroker`).
+"""
+
+import io
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from digital_twin.messages import DEVICE_ID_HEADER, MESSAGE_ENCODERS, MESSAGE_FORMATS
+from digital_twin.resources import VIBRATION_REPORTS_PATH
+from digital_twin.schema import FEATURE_COLUMNS, LABEL_COLUMN
+from digital_twin.writer import TokenBucket
+
+LANDING_ZONE_PREFIX = "digital-twin/data/landing_zone"
+HEALTHY_LABEL = "Normal_1"
+DEFAULT_FAULT_LABELS = ("Ball_007_1",)
+
+
+@dataclass
+class Device:
+  device_id: str
+  station_id: str
+  fault_onset: float = None  # seconds after the start of the simulation, None for a healthy device
+  fault_label: str = DEFAULT_FAULT_LABELS[0]
+
+  def label_at(self, elapsed):
+    return self.fault_label if self.fault_onset is not None and elapsed >= self.fault_onset else HEALTHY_LABEL
+
+
+def device_fleet(stations, devices_per_station=1, fault_fraction=0.2, onset_range=(30, 300),
+                 fault_labels=DEFAULT_FAULT_LABELS, seed=0):
+  """Devices for each station id; a `fault_fraction` of them develop a random fault at a random onset time."""
+  rng = random.Random(seed)
+  fleet = []
+  for station_id in stations:
+    for i in range(devices_per_station):
+      faulty = rng.random() < fault_fraction
+      fleet.append(Device(
+        device_id=f"{station_id}-dev{i:03d}",
+        station_id=station_id,
+        fault_onset=rng.uniform(*onset_range) if faulty else None,
+        fault_label=rng.choice(fault_labels),
+      ))
+  return fleet
+
+
+class ReportSampler:
+  """Samples feature rows per fault label from the labelled vibration reports, as float32 arrays."""
+
+  def __init__(self, reports=None):
+    if reports is None:
+      import pandas as pd
+      reports = pd.read_csv(VIBRATION_REPORTS_PATH)
+    self.pools = {
+      label: group[FEATURE_COLUMNS].to_numpy(dtype=np.float32)
+      for label, group in reports.groupby(LABEL_COLUMN)
+    }
+
+  def sample(self, label, n, rng):
+    pool = self.pools[label]
+    return pool[rng.integers(0, len(pool), size=n)]
+
+
+def _id_columns(n, station_id, device_id, event_times):
+  columns = {}
+  if station_id is not None:
+    columns["station_id"] = [station_id] * n
+  if device_id is not None:
+    columns["device_id"] = [device_id] * n
+  if event_times is not None:
+    columns["event_time"] = event_times
+  return columns
+
+
+def render_csv(features, station_id=None, device_id=None, event_times=None):
+  """CSV with a header and one row per reading; optional id and event time columns follow the features."""
+  columns = list(FEATURE_COLUMNS)
+  suffix = ""
+  if station_id is not None:
+    columns.append("station_id")
+    suffix += f",{station_id}"
+  if device_id is not None:
+    columns.append("device_id")
+    suffix += f",{device_id}"
+  if event_times is not None:
+    columns.append("event_time")
+  buffer = io.StringIO()
+  buffer.write(",".join(columns) + "\n")
+  for i, row in enumerate(features):
+    line = ",".join(repr(float(value)) for value in row) + suffix
+    if event_times is not None:
+      line += "," + _iso_timestamp(event_times[i])
+    buffer.write(line + "\n")
+  return buffer.getvalue()
+
+
+def _iso_timestamp(epoch_seconds):
+  return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(epoch_seconds)) + f".{int(epoch_seconds % 1 * 1e6):06d}Z"
+
+
+def render_ndjson(features, station_id=None, device_id=None, event_times=None):
+  """Newline-delimited JSON, one object per reading."""
+  extra = _id_columns(len(features), station_id, device_id, None)
+  lines = []
+  for i, row in enumerate(features):
+    record = dict(zip(FEATURE_COLUMNS, map(float, row)))
+    record.update({column: values[i] for column, values in extra.items()})
+    if event_times is not None:
+      record["event_time"] = _iso_timestamp(event_times[i])
+    lines.append(json.dumps(record, separators=(",", ":")))
+  return "\n".join(lines) + "\n"
+
+
+def render_parquet(features, station_id=None, device_id=None, event_times=None):
+  """Parquet with float32 feature columns, string ids and a microsecond UTC `event_time`."""
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+
+  columns = {column: pa.array(features[:, i], type=pa.float32()) for i, column in enumerate(FEATURE_COLUMNS)}
+  for column, values in _id_columns(len(features), station_id, device_id, None).items():
+    columns[column] = pa.array(values, type=pa.string())
+  if event_times is not None:
+    columns["event_time"] = pa.array((np.asarray(event_times) * 1e6).astype(np.int64), type=pa.timestamp("us", tz="UTC"))
+  buffer = io.BytesIO()
+  pq.write_table(pa.table(columns), buffer)
+  return buffer.getvalue()
+
+
+LANDING_FORMATS = ("csv", "ndjson", "parquet")
+LANDING_EXTENSIONS = {"csv": "csv", "ndjson": "json", "parquet": "parquet"}
+RENDERERS = {"csv": render_csv, "ndjson": render_ndjson, "parquet": render_parquet}
+
+
+# --- sinks ------------------------------------------------------------------------------------
+
+
+class LocalDirectorySink:
+  """Writes uploads under a local directory, atomically, so file-based readers never see partial files."""
+
+  def __init__(self, root):
+    self.root = root
+
+  def upload(self, name, data):
+    path = os.path.join(self.root, name.lstrip("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = "wb" if isinstance(data, bytes) else "w"
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, mode) as f:
+      f.write(data)
+    os.replace(temporary, path)
+
+
+class ContainerSink:
+  """Uploads through an `azure.storage.blob.ContainerClient` (or `LocalContainerClient`)."""
+
+  def __init__(self, container_client):
+    self.container_client = container_client
+
+  def upload(self, name, data):
+    self.container_client.upload_blob(name=name, data=data, overwrite=True)
+
+
+class _Download:
+  def __init__(self, data):
+    self.data = data
+
+  def readall(self):
+    return self.data
+
+
+class LocalContainerClient:
+  """In-memory stand-in for the `ContainerClient` calls used by the simulator notebook, with optional latency."""
+
+  def __init__(self, latency=0.0):
+    self.blobs = {}
+    self.latency = latency
+    self._lock = threading.Lock()
+
+  def upload_blob(self, name, data, overwrite=False, **kwargs):
+    if self.latency:
+      time.sleep(self.latency)
+    name = name.lstrip("/")
+    with self._lock:
+      if not overwrite and name in self.blobs:
+        raise FileExistsError(name)
+      self.blobs[name] = {"data": data.encode() if isinstance(data, str) else data, "last_modified": time.time()}
+
+  def list_blobs(self, name_starts_with=""):
+    with self._lock:
+      return [
+        {"name": name, "last_modified": blob["last_modified"], "size": len(blob["data"])}
+        for name, blob in sorted(self.blobs.items()) if name.startswith(name_starts_with)
+      ]
+
+  def download_blob(self, name):
+    with self._lock:
+      return _Download(self.blobs[name.lstrip("/")]["data"])
+
+  def delete_blob(self, name):
+    with self._lock:
+      del self.blobs[name.lstrip("/")]
+
+
+def pooled_container_client(container_url, credential, pool_size=32):
+  """`ContainerClient` whose `requests` session keeps up to `pool_size` connections alive for concurrent uploads."""
+  import requests
+  from azure.core.pipeline.transport import RequestsTransport
+  from azure.storage.blob import ContainerClient
+
+  session = requests.Session()
+  adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+  session.mount("https://", adapter)
+  session.mount("http://", adapter)
+  transport = RequestsTransport(session=session, session_owner=False)
+  return ContainerClient.from_container_url(container_url=container_url, credential=credential, transport=transport)
+
+
+# --- simulation -------------------------------------------------------------------------------
+
+
+@dataclass
+class SimulationStats:
+  files: int = 0
+  messages: int = 0
+  rows: int = 0
+  faulty_rows: int = 0
+  seconds: float = 0.0
+
+  @property
+  def files_per_second(self):
+    return self.files / self.seconds if self.seconds else 0.0
+
+  @property
+  def messages_per_second(self):
+    return self.messages / self.seconds if self.seconds else 0.0
+
+  @property
+  def rows_per_second(self):
+    return self.rows / self.seconds if self.seconds else 0.0
+
+
+class UploadSimulator:
+  """
+  Uploads readings for every device in `fleet` to `sink`, using up to `max_workers` concurrent uploads.
+
+  By default every reading is its own file of `rows_per_file` rows, uploaded at an aggregate
+  `files_per_second` (or `rows_per_second`). Setting `flush_rows` and/or `flush_interval` switches
+  to batched landing files: readings arrive at `rows_per_second`, are buffered per device, and
+  each buffer is written as a single `landing_format` file once it holds `flush_rows` readings or its
+  oldest reading is `flush_interval` seconds old.
+
+  A message `landing_format` (`struct` or `avro`) turns the simulator into a producer: `sink` has a
+  `send(key, value, headers)` method (`digital_twin.messages.BrokerSink`/`KafkaProducerSink`) and
+  each reading becomes one message keyed by its station id and stamped with its event time, paced by
+  `rows_per_second` (or `files_per_second` ticks of `rows_per_file` readings).
+
+  Devices take turns round-robin; a device's readings switch to its fault class once its fault
+  onset has elapsed.
+  """
+
+  def __init__(self, fleet, sink, files_per_second=10.0, rows_per_second=None, rows_per_file=1,
+               max_workers=16, prefix=LANDING_ZONE_PREFIX, include_ids=True, sampler=None, seed=0,
+               landing_format="csv", flush_rows=None, flush_interval=None):
+    if landing_format not in LANDING_FORMATS + MESSAGE_FORMATS:
+      raise ValueError(f"landing_format must be one of {LANDING_FORMATS + MESSAGE_FORMATS}")
+    self.messages = landing_format in MESSAGE_FORMATS
+    if self.messages and (flush_rows is not None or flush_interval is not None):
+      raise ValueError("Messages are sent per reading; flush_rows/flush_interval only apply to landing files")
+    self.fleet = list(fleet)
+    self.sink = sink
+    self.batched = flush_rows is not None or flush_interval is not None
+    if self.batched:
+      if rows_per_second is None:
+        raise ValueError("Batched landing files are paced by rows_per_second")
+      self.ticks_per_second, self.rows_per_file = rows_per_second, 1
+    else:
+      self.rows_per_file = rows_per_file
+      self.ticks_per_second = rows_per_second / rows_per_file if rows_per_second is not None else files_per_second
+    self.max_workers = max_workers
+    self.prefix = prefix.strip("/")
+    self.include_ids = include_ids
+    self.sampler = sampler or ReportSampler()
+    self.seed = seed
+    self.landing_format = landing_format
+    self.flush_rows = flush_rows
+    self.flush_interval = flush_interval
+    self.stats = SimulationStats()
+    self._lock = threading.Lock()
+
+  def file_name(self, device, sequence):
+    kind = "batch" if self.batched else "upload"
+    return f"{self.prefix}/device_{kind}_{device.device_id}_{sequence:06d}.{LANDING_EXTENSIONS[self.landing_format]}"
+
+  def render(self, device, sequence, labels, event_times=None):
+    """Sample one feature row per label and render them in the landing format; returns `(data, faulty_rows)`."""
+    rng = np.random.default_rng((self.seed, zlib.crc32(device.device_id.encode()), sequence))
+    labels = np.asarray(labels)
+    features = np.empty((len(labels), len(FEATURE_COLUMNS)), dtype=np.float32)
+    for label in np.unique(labels):
+      rows = labels == label
+      features[rows] = self.sampler.sample(label, int(rows.sum()), rng)
+    if self.messages:
+      if event_times is None:
+        event_times = np.full(len(labels), time.time())
+      data = MESSAGE_ENCODERS[self.landing_format](features, (np.asarray(event_times) * 1000).astype(np.int64))
+      return data, int((labels != HEALTHY_LABEL).sum())
+    ids = (device.station_id, device.device_id) if self.include_ids else (None, None)
+    data = RENDERERS[self.landing_format](features, *ids, event_times=event_times)
+    return data, int((labels != HEALTHY_LABEL).sum())
+
+  def _upload(self, device, sequence, labels, event_times=None):
+    data, faulty_rows = self.render(device, sequence, labels, event_times)
+    if self.messages:
+      for value in data:
+        self.sink.send(device.station_id, value, {DEVICE_ID_HEADER: device.device_id})
+    else:
+      self.sink.upload(self.file_name(device, sequence), data)
+    with self._lock:
+      if self.messages:
+        self.stats.messages += len(data)
+      else:
+        self.stats.files += 1
+      self.stats.rows += len(labels)
+      self.stats.faulty_rows += faulty_rows
+
+  def run(self, duration=None, max_files=None, max_rows=None):
+    """
+    Upload until `duration` seconds have passed, `max_files` files (or message batches) were sent or
+    `max_rows` readings were produced, whichever comes first. Batched buffers are flushed before returning.
+    """
+    if duration is None and max_files is None and max_rows is None:
+      raise ValueError("Provide a duration, max_files and/or max_rows, otherwise the simulation never stops")
+    bucket = TokenBucket(self.ticks_per_second, capacity=max(1.0, self.ticks_per_second / 10))
+    in_flight = threading.BoundedSemaphore(self.max_workers * 2)
+    started = time.monotonic()
+    schedule = ((device, tick) for tick in itertools.count(1) for device in self.fleet)
+    buffers, sequences, errors = {}, {}, []
+    last_sweep = started
+
+    def done(future):
+      in_flight.release()
+      if future.exception() is not None:
+        errors.append(future.exception())
+
+    def submit(pool, device, labels, event_times=None):
+      sequences[device.device_id] = sequence = sequences.get(device.device_id, 0) + 1
+      in_flight.acquire()
+      pool.submit(self._upload, device, sequence, labels, event_times).add_done_callback(done)
+
+    def flush(pool, device):
+      buffer = buffers.pop(device.device_id, None)
+      if buffer:
+        submit(pool, device, [label for label, _ in buffer], np.array([t for _, t in buffer]))
+
+    with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+      for ticks, (device, _) in enumerate(schedule):
+        now = time.monotonic()
+        files = ticks if not self.batched else sum(sequences.values())
+        if (errors or (duration is not None and now - started >= duration)
+            or (max_files is not None and files >= max_files)
+            or (max_rows is not None and ticks * self.rows_per_file >= max_rows)):
+          break
+        bucket.acquire()
+        label = device.label_at(time.monotonic() - started)
+        if not self.batched:
+          submit(pool, device, [label] * self.rows_per_file)
+          continue
+
+        buffer = buffers.setdefault(device.device_id, [])
+        buffer.append((label, time.time()))
+        if self.flush_rows is not None and len(buffer) >= self.flush_rows:
+          flush(pool, device)
+        if self.flush_interval is not None and now - last_sweep >= self.flush_interval / 4:
+          last_sweep, cutoff = now, time.time() - self.flush_interval
+          for stale in [d for d in self.fleet if buffers.get(d.device_id) and buffers[d.device_id][0][1] <= cutoff]:
+            flush(pool, stale)
+
+      for device in self.fleet:
+        flush(pool, device)
+
+    if self.messages and hasattr(self.sink, "flush"):
+      self.sink.flush()
+    self.stats.seconds = time.monotonic() - started
+    if errors:
+      raise errors[0]
+    return self.stats
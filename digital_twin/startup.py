@@ -0,0 +1,86 @@
+"""
+Cold-start instrumentation and dependency bootstrap for notebook jobs.
+
+A restarted streaming job spends its first minutes installing packages, importing libraries,
+fetching reference data and staging the model before the first micro-batch is published.
+`StartupTimer` is created in a job's first cell and times each of those phases, plus the
+time-to-first-batch; `record` hands them to a `latency.PipelineLatency`, so cold starts land as
+`startup.*` rows of the same `digital_twins.pipeline_latency` table as the per-stage latencies and
+regressions can be tracked from one place. `ensure_packages` installs only the packages that are
+missing, instead of a `%pip install` on every run.
+"""
+
+import importlib
+import importlib.util
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+STARTUP_PREFIX = "startup"
+FIRST_BATCH_PHASE = "time_to_first_batch"
+
+
+def missing_packages(requirements):
+  """The pip specs of `{module: pip spec}` whose module cannot be found, without importing the modules."""
+  missing = []
+  for module, spec in requirements.items():
+    try:
+      found = importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:  # a parent package is missing
+      found = False
+    if not found:
+      missing.append(spec)
+  return missing
+
+
+def ensure_packages(requirements, quiet=True):
+  """`pip install` the missing packages of `{module: pip spec}` into this interpreter; returns what was installed."""
+  missing = missing_packages(requirements)
+  if missing:
+    subprocess.run([sys.executable, "-m", "pip", "install", *(["--quiet"] if quiet else []), *missing], check=True)
+    importlib.invalidate_caches()
+  return missing
+
+
+class StartupTimer:
+  """Wall-clock seconds per startup phase since `started_at` (by default, when the timer was created)."""
+
+  def __init__(self, started_at=None, clock=time.time):
+    self.clock = clock
+    self.started_at = clock() if started_at is None else started_at
+    self.phases = {}
+    self.first_batch_id = None
+    self.first_batch_seconds = None
+
+  @contextmanager
+  def phase(self, name):
+    """Time a block; repeated phases add up."""
+    started = self.clock()
+    try:
+      yield
+    finally:
+      self.phases[name] = self.phases.get(name, 0.0) + self.clock() - started
+
+  def first_batch(self, batch_id=None):
+    """Mark the first published batch; True only the first time, so callers can report once."""
+    if self.first_batch_seconds is not None:
+      return False
+    self.first_batch_id = batch_id
+    self.first_batch_seconds = self.clock() - self.started_at
+    return True
+
+  def durations_ms(self):
+    durations = {name: seconds * 1000 for name, seconds in self.phases.items()}
+    if self.first_batch_seconds is not None:
+      durations[FIRST_BATCH_PHASE] = self.first_batch_seconds * 1000
+    return durations
+
+  def record(self, latency, batch_id=None, query=None):
+    """Append the phase durations and time-to-first-batch to a `PipelineLatency` as `startup.<phase>` stages."""
+    latency.record_durations(self.first_batch_id if batch_id is None else batch_id, self.durations_ms(), STARTUP_PREFIX, query)
+
+  def __str__(self):
+    phases = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.phases.items())
+    first = "pending" if self.first_batch_seconds is None else f"{self.first_batch_seconds:.1f}s"
+    return f"Startup: {phases or 'no phases'}; first batch {first}"
@@ -0,0 +1,180 @@
+"""
+Parametric plant topologies, for scaling every twin code path past the three sites of `twins/TwinGraph.json`.
+
+A `PlantTopology` describes a synthetic fleet: `sites`, each running `lines_per_site` production
+lines, each line running a mixing -> coating -> calendering chain with `stations_per_step` parallel
+stations per step (every station of a step `leads_to` every station of the next one). Twins are
+generated in the naming scheme of TwinGraph.json (`MunichSite`, `ProductionLine1-Munich`,
+`MixingStep-Line1-Munich`, ...) and take their property values from its twins of the same model, so
+they conform to `models/`. Twins and relationships are generated lazily and `write_twin_graph`
+streams them in the ADT Explorer export format, so graphs with thousands of sites are never held in
+memory.
+"""
+
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+
+from digital_twin.bulk import FILE_VERSION, MODELS, RELATIONSHIPS, TWINS, import_relationship, import_twin, iter_json_array
+from digital_twin.graph import LEADS_TO, LINE_RUNS_STEPS, SITE_RUNS_LINES
+from digital_twin.resources import TWIN_GRAPH_PATH, load_models
+
+MODEL_PREFIX = "dtmi:com:microsoft:iot:e2e:digital_factory:"
+SITE_MODEL = MODEL_PREFIX + "production_site;2"
+LINE_MODEL = MODEL_PREFIX + "production_line;2"
+STEP_MODELS = {
+  "mixing": MODEL_PREFIX + "production_step_mixing;3",
+  "coating": MODEL_PREFIX + "production_step_coating;3",
+  "calendering": MODEL_PREFIX + "production_step_calendering;3",
+}
+
+
+@lru_cache(maxsize=4)
+def _templates(twin_graph_path):
+  """Reference twins of TwinGraph.json by model id, in import form (no etags or property metadata)."""
+  templates = {}
+  for twin in iter_json_array(twin_graph_path, "digitalTwins"):
+    document = import_twin(twin)
+    del document["$dtId"]
+    templates.setdefault(document["$metadata"]["$model"], []).append(document)
+  return templates
+
+
+def _copy(template):
+  return json.loads(json.dumps(template))
+
+
+@dataclass(frozen=True)
+class PlantTopology:
+  sites: int = 3
+  lines_per_site: int = 2
+  stations_per_step: int = 1
+  steps: tuple = ("mixing", "coating", "calendering")
+  site_prefix: str = "Plant"
+  twin_graph_path: str = TWIN_GRAPH_PATH  # source of the property templates
+
+  def __post_init__(self):
+    unknown = [step for step in self.steps if step not in STEP_MODELS]
+    if unknown:
+      raise ValueError(f"Unknown step types {unknown}, expected some of {list(STEP_MODELS)}")
+    if min(self.sites, self.lines_per_site, self.stations_per_step, len(self.steps)) < 1:
+      raise ValueError("sites, lines_per_site, stations_per_step and steps must all be positive")
+
+  @property
+  def twin_count(self):
+    lines = self.sites * self.lines_per_site
+    return self.sites + lines * (1 + len(self.steps) * self.stations_per_step)
+
+  @property
+  def relationship_count(self):
+    lines = self.sites * self.lines_per_site
+    per_line = 1 + len(self.steps) * self.stations_per_step + (len(self.steps) - 1) * self.stations_per_step ** 2
+    return lines * per_line
+
+  def site_name(self, s):
+    return f"{self.site_prefix}{s + 1:05d}"
+
+  def site_id(self, s):
+    return f"{self.site_name(s)}Site"
+
+  def line_id(self, s, l):
+    return f"ProductionLine{l + 1}-{self.site_name(s)}"
+
+  def station_id(self, s, l, step, k):
+    suffix = "" if self.stations_per_step == 1 else str(k + 1)
+    return f"{step.capitalize()}Step{suffix}-Line{l + 1}-{self.site_name(s)}"
+
+  def stations(self, step=None):
+    """Ids of every generated station, optionally only those of one step type."""
+    for s in range(self.sites):
+      for l in range(self.lines_per_site):
+        for current in self.steps:
+          if step is None or current == step:
+            for k in range(self.stations_per_step):
+              yield self.station_id(s, l, current, k)
+
+  def twins(self):
+    """Twin documents, site by site: the site, then each of its lines followed by the line's stations."""
+    templates = _templates(self.twin_graph_path)
+
+    def twin(twin_id, model_id, i, **properties):
+      candidates = templates.get(model_id)
+      if not candidates:
+        raise ValueError(f"{self.twin_graph_path} has no twin of model '{model_id}' to use as a template")
+      document = {"$dtId": twin_id, **_copy(candidates[i % len(candidates)])}
+      document.update(properties)
+      return document
+
+    for s in range(self.sites):
+      site = twin(self.site_id(s), SITE_MODEL, s, SiteId=f"P{s + 1:05d}", SiteName=self.site_name(s))
+      yield site
+      for l in range(self.lines_per_site):
+        yield twin(self.line_id(s, l), LINE_MODEL, s * self.lines_per_site + l,
+                   LineId=f"{site['SiteId']}-{l + 1}", LineName=f"Line {l + 1}")
+        for position, step in enumerate(self.steps):
+          for k in range(self.stations_per_step):
+            yield twin(self.station_id(s, l, step, k), STEP_MODELS[step], s + l + k,
+                       FinalStep=position == len(self.steps) - 1)
+
+  def relationships(self):
+    """Relationship documents with TwinGraph.json style `$relationshipId`s, in the order of `twins`."""
+    def relationship(source, target, name, verb):
+      return {
+        "$relationshipId": f"{target} {verb} {source}" if verb == "follows" else f"{source} {verb} {target}",
+        "$sourceId": source, "$targetId": target, "$relationshipName": name,
+      }
+
+    for s in range(self.sites):
+      site = self.site_id(s)
+      for l in range(self.lines_per_site):
+        line = self.line_id(s, l)
+        yield relationship(site, line, SITE_RUNS_LINES, "runs")
+        previous = []
+        for step in self.steps:
+          current = [self.station_id(s, l, step, k) for k in range(self.stations_per_step)]
+          for station in current:
+            yield relationship(line, station, LINE_RUNS_STEPS, "runs")
+          for source in previous:
+            for target in current:
+              yield relationship(source, target, LEADS_TO, "follows")
+          previous = current
+
+  def twin_graph(self):
+    """The whole graph in memory as a `digitalTwinsGraph` dict, for `TwinGraphStore.from_graph` on small topologies."""
+    return {"digitalTwins": list(self.twins()), "relationships": list(self.relationships())}
+
+  def sections(self, models=None):
+    """`(section, document)` pairs for `digital_twin.bulk` (`write_import_file`, `bulk_upsert`)."""
+    for model in (load_models() if models is None else models):
+      yield MODELS, model
+    for twin in self.twins():
+      yield TWINS, twin
+    for relationship in self.relationships():
+      yield RELATIONSHIPS, import_relationship(relationship)
+
+
+def write_twin_graph(out, topology, models=None, registry=None):
+  """
+  Stream `topology` to the text stream `out` as an ADT Explorer export (same layout as
+  TwinGraph.json, including `digitalTwinsModels`; pass `models=[]` to leave them out). With a
+  `ModelRegistry`, every twin is validated against its model first. Returns `(twins, relationships)` written.
+  """
+  models = load_models() if models is None else models
+  twins = relationships = 0
+  out.write(json.dumps({"digitalTwinsFileInfo": {"fileVersion": FILE_VERSION}})[:-1] + ', "digitalTwinsGraph": {"digitalTwins": [')
+  for twin in topology.twins():
+    if registry is not None:
+      errors = registry.validate_twin(twin)
+      if errors:
+        raise ValueError(f"Generated twin '{twin['$dtId']}' does not match its model: {errors}")
+    out.write((",\n" if twins else "\n") + json.dumps(twin, separators=(",", ":")))
+    twins += 1
+  out.write('\n], "relationships": [')
+  for relationship in topology.relationships():
+    out.write((",\n" if relationships else "\n") + json.dumps(relationship, separators=(",", ":")))
+    relationships += 1
+  out.write('\n]}, "digitalTwinsModels": [')
+  out.write(",".join(json.dumps(model, separators=(",", ":")) for model in models))
+  out.write("]}\n")
+  return twins, relationships
+
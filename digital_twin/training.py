@@ -0,0 +1,273 @@
+"""
+Incremental training of the fault classifier from newly labelled vibration reports.
+
+`IncrementalFaultClassifier` is a softmax regression over the standardized `FEATURE_COLUMNS` and
+their pairwise products, trained with mini-batch Adam. `partial_fit` folds in a new batch of reports
+in time proportional to the batch (plus a bounded replay sample of earlier reports, so rarely seen
+classes are not forgotten), instead of retraining on the whole table. It exposes `classes_` and
+`predict_proba` like an sklearn classifier, so it is logged with `mlflow.sklearn` and scored by
+`digital_twin.inference` unchanged.
+
+`OnlineTrainer` checkpoints the model state after every batch and registers a new model version
+every `register_every_seconds`; `train_from_stream` drives it from a Structured Streaming source
+of labelled reports via `foreachBatch`.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from digital_twin.schema import FAULT_CLASS_INDEX, FAULT_CLASSES, FEATURE_COLUMNS, LABEL_COLUMN
+
+_STATE_ARRAYS = ("mean", "m2", "weights", "bias", "m_weights", "v_weights", "m_bias", "v_bias", "replay_x", "replay_y")
+
+
+class IncrementalFaultClassifier:
+  """Mini-batch softmax regression on quadratic features, updated in place by `partial_fit`."""
+
+  def __init__(self, classes=FAULT_CLASSES, degree=2, learning_rate=0.03, l2=1e-4, batch_size=64,
+               epochs=2, replay_size=5000, replay_ratio=4.0, seed=0):
+    if degree not in (1, 2):
+      raise ValueError("degree must be 1 or 2")
+    self.classes_ = np.asarray(classes)
+    self.degree = degree
+    self.learning_rate = learning_rate
+    self.l2 = l2
+    self.batch_size = batch_size
+    self.epochs = epochs
+    self.replay_size = replay_size
+    self.replay_ratio = replay_ratio
+    self.seed = seed
+    self.reset()
+
+  def reset(self):
+    n_features, n_classes = len(FEATURE_COLUMNS), len(self.classes_)
+    width = n_features + (n_features * (n_features + 1) // 2 if self.degree == 2 else 0)
+    self.rng = np.random.default_rng(self.seed)
+    self.n_seen_ = 0  # rows folded into the running feature statistics
+    self.n_steps_ = 0  # Adam steps taken
+    self.mean = np.zeros(n_features)
+    self.m2 = np.zeros(n_features)
+    self.weights = np.zeros((width, n_classes))
+    self.bias = np.zeros(n_classes)
+    self.m_weights, self.v_weights = np.zeros_like(self.weights), np.zeros_like(self.weights)
+    self.m_bias, self.v_bias = np.zeros_like(self.bias), np.zeros_like(self.bias)
+    self.replay_x = np.empty((0, n_features))
+    self.replay_y = np.empty(0, dtype=np.int32)
+    return self
+
+  # --- features --------------------------------------------------------------------------------
+
+  def _codes(self, y):
+    y = np.asarray(y)
+    if y.dtype.kind in "iu":
+      return y.astype(np.int32)
+    index = FAULT_CLASS_INDEX if list(self.classes_) == FAULT_CLASSES else {label: i for i, label in enumerate(self.classes_)}
+    return np.array([index[label] for label in y], dtype=np.int32)
+
+  def _update_statistics(self, x):
+    """Chan et al. parallel update of the running mean and sum of squared deviations."""
+    n, batch_mean = len(x), x.mean(axis=0)
+    total = self.n_seen_ + n
+    delta = batch_mean - self.mean
+    self.m2 += ((x - batch_mean) ** 2).sum(axis=0) + delta ** 2 * self.n_seen_ * n / total
+    self.mean += delta * n / total
+    self.n_seen_ = total
+
+  def _features(self, x):
+    scale = np.sqrt(self.m2 / max(self.n_seen_ - 1, 1))
+    z = (x - self.mean) / np.where(scale > 0, scale, 1.0)
+    if self.degree == 1:
+      return z
+    i, j = np.triu_indices(z.shape[1])
+    return np.hstack([z, z[:, i] * z[:, j]])
+
+  # --- training ----------------------------------------------------------------------------------
+
+  def _step(self, features, codes):
+    logits = features @ self.weights + self.bias
+    logits -= logits.max(axis=1, keepdims=True)
+    gradient = np.exp(logits)
+    gradient /= gradient.sum(axis=1, keepdims=True)
+    gradient[np.arange(len(codes)), codes] -= 1.0
+    gradient /= len(codes)
+    self.n_steps_ += 1
+    correction1, correction2 = 1 - 0.9 ** self.n_steps_, 1 - 0.999 ** self.n_steps_
+    for value, grad, m, v in (
+      (self.weights, features.T @ gradient + self.l2 * self.weights, self.m_weights, self.v_weights),
+      (self.bias, gradient.sum(axis=0), self.m_bias, self.v_bias),
+    ):
+      m *= 0.9
+      m += 0.1 * grad
+      v *= 0.999
+      v += 0.001 * grad * grad
+      value -= self.learning_rate * (m / correction1) / (np.sqrt(v / correction2) + 1e-8)
+
+  def _train(self, features, codes, epochs):
+    for _ in range(epochs):
+      order = self.rng.permutation(len(features))
+      for start in range(0, len(order), self.batch_size):
+        batch = order[start:start + self.batch_size]
+        self._step(features[batch], codes[batch])
+
+  def _remember(self, x, codes):
+    """Reservoir sample of every row seen so far, replayed alongside new batches."""
+    if not self.replay_size:
+      return
+    seen_before = self.n_seen_ - len(x)
+    room = max(0, self.replay_size - len(self.replay_x))
+    self.replay_x = np.vstack([self.replay_x, x[:room]])
+    self.replay_y = np.concatenate([self.replay_y, codes[:room]])
+    if room < len(x):
+      positions = self.rng.integers(0, seen_before + np.arange(room, len(x)) + 1)
+      keep = positions < self.replay_size
+      self.replay_x[positions[keep]] = x[room:][keep]
+      self.replay_y[positions[keep]] = codes[room:][keep]
+
+  def partial_fit(self, X, y, epochs=None):
+    """Fold a batch of labelled reports into the model: `X` is (n, 9), `y` labels or class codes."""
+    x = np.asarray(X, dtype=np.float64)
+    codes = self._codes(y)
+    if not len(x):
+      return self
+    replay = min(len(self.replay_x), int(len(x) * self.replay_ratio))
+    if replay:
+      sample = self.rng.choice(len(self.replay_x), replay, replace=False)
+      train_x, train_codes = np.vstack([x, self.replay_x[sample]]), np.concatenate([codes, self.replay_y[sample]])
+    else:
+      train_x, train_codes = x, codes
+    self._update_statistics(x)
+    self._remember(x, codes)
+    self._train(self._features(train_x), train_codes, self.epochs if epochs is None else epochs)
+    return self
+
+  def fit(self, X, y, epochs=20):
+    """Full retraining from scratch on every row, for comparison with `partial_fit`."""
+    x = np.asarray(X, dtype=np.float64)
+    self.reset()
+    self._update_statistics(x)
+    codes = self._codes(y)
+    self._remember(x, codes)
+    self._train(self._features(x), codes, epochs)
+    return self
+
+  # --- inference ---------------------------------------------------------------------------------
+
+  def predict_proba(self, X):
+    logits = self._features(np.asarray(X, dtype=np.float64)) @ self.weights + self.bias
+    logits -= logits.max(axis=1, keepdims=True)
+    probabilities = np.exp(logits)
+    return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+  def predict(self, X):
+    return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+  def score(self, X, y):
+    return float((self.predict_proba(X).argmax(axis=1) == self._codes(y)).mean())
+
+  # --- checkpoints -------------------------------------------------------------------------------
+
+  def save(self, path, **extra):
+    """Write the model state (plus scalar `extra` metadata) to `path` atomically, as `.npz`."""
+    arrays = {name: getattr(self, name) for name in _STATE_ARRAYS}
+    scalars = {
+      "classes": self.classes_, "degree": self.degree, "learning_rate": self.learning_rate, "l2": self.l2,
+      "batch_size": self.batch_size, "epochs": self.epochs, "replay_size": self.replay_size,
+      "replay_ratio": self.replay_ratio, "seed": self.seed,
+      "n_seen": self.n_seen_, "n_steps": self.n_steps_, "rng": json.dumps(self.rng.bit_generator.state),
+    }
+    temporary = f"{path}.tmp-{os.getpid()}"
+    with open(temporary, "wb") as f:
+      np.savez(f, **arrays, **scalars, **{f"extra_{key}": value for key, value in extra.items()})
+    os.replace(temporary, path)
+
+  @classmethod
+  def load(cls, path):
+    """`(model, extra)` from a checkpoint written by `save`."""
+    with np.load(path, allow_pickle=False) as data:
+      model = cls(
+        classes=data["classes"].tolist(), degree=int(data["degree"]), learning_rate=float(data["learning_rate"]),
+        l2=float(data["l2"]), batch_size=int(data["batch_size"]), epochs=int(data["epochs"]),
+        replay_size=int(data["replay_size"]), replay_ratio=float(data["replay_ratio"]), seed=int(data["seed"]),
+      )
+      for name in _STATE_ARRAYS:
+        setattr(model, name, data[name].copy())
+      model.n_seen_, model.n_steps_ = int(data["n_seen"]), int(data["n_steps"])
+      model.rng.bit_generator.state = json.loads(data["rng"].item())
+      extra = {key[len("extra_"):]: data[key].item() for key in data.files if key.startswith("extra_")}
+    return model, extra
+
+
+class OnlineTrainer:
+  """
+  Applies batches of labelled reports to a model, checkpointing after each one so a restarted stream
+  resumes where it stopped, and registers a new MLflow model version at most every `register_every_seconds`.
+  """
+
+  def __init__(self, checkpoint_path, model=None, registered_model_name=None, register_every_seconds=300.0,
+               clock=time.monotonic):
+    self.checkpoint_path = checkpoint_path
+    self.registered_model_name = registered_model_name
+    self.register_every_seconds = register_every_seconds
+    self.clock = clock
+    self.last_batch_id = -1
+    self.registered_version = None
+    self._last_registered = None
+    if os.path.exists(checkpoint_path):
+      self.model, extra = IncrementalFaultClassifier.load(checkpoint_path)
+      self.last_batch_id = int(extra.get("batch_id", -1))
+    else:
+      self.model = model or IncrementalFaultClassifier()
+
+  def update(self, frame, batch_id=None):
+    """
+    Train on a pandas DataFrame with `FEATURE_COLUMNS` and `LABEL_COLUMN`. A `batch_id` at or below
+    the checkpointed one (a replayed micro-batch) is skipped. Returns True if the model changed.
+    """
+    batch_id = self.last_batch_id + 1 if batch_id is None else batch_id
+    if batch_id <= self.last_batch_id:
+      return False
+    frame = frame.dropna(subset=FEATURE_COLUMNS + [LABEL_COLUMN])
+    self.model.partial_fit(frame[FEATURE_COLUMNS].to_numpy(dtype=np.float64), frame[LABEL_COLUMN].to_numpy())
+    self.last_batch_id = batch_id
+    os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True)
+    self.model.save(self.checkpoint_path, batch_id=batch_id)
+    if self.registered_model_name and (
+      self._last_registered is None or self.clock() - self._last_registered >= self.register_every_seconds
+    ):
+      self.register()
+    return True
+
+  def register(self):
+    """Log the current model and register it as a new version of `registered_model_name`."""
+    import mlflow
+    import mlflow.sklearn
+
+    with mlflow.start_run(run_name="incremental-fault-model"):
+      mlflow.log_metrics({"rows_seen": self.model.n_seen_, "batch_id": self.last_batch_id})
+      info = mlflow.sklearn.log_model(self.model, "model", registered_model_name=self.registered_model_name)
+    self._last_registered = self.clock()
+    self.registered_version = getattr(info, "registered_model_version", None)
+    return self.registered_version
+
+
+def train_from_stream(labelled_df, trainer, checkpoint_location, trigger_seconds=60):
+  """
+  Keep `trainer` updated from a streaming DataFrame of labelled reports (e.g. a Delta table of
+  newly labelled `vibration_reports_labelled` rows). Each micro-batch is small, so it is collected
+  to the driver and folded into the model there. Returns the StreamingQuery.
+  """
+  def train(batch_df, batch_id):
+    trainer.update(batch_df.toPandas(), batch_id)
+
+  return (
+    labelled_df
+      .select(*FEATURE_COLUMNS, LABEL_COLUMN)
+      .writeStream
+      .foreachBatch(train)
+      .option("checkpointLocation", checkpoint_location)
+      .trigger(processingTime=f"{trigger_seconds} seconds")
+      .start()
+  )
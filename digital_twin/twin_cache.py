@@ -0,0 +1,207 @@
+"""
+Per-executor cache of Azure Digital Twins documents.
+
+Twin documents are held in a bounded LRU (`max_twins`), so memory stays flat however large the fleet
+is, instead of broadcasting the whole twin graph to every executor. Entries older than `ttl_seconds`
+are revalidated with a conditional GET carrying the cached `$etag` (`If-None-Match`): a twin that has
+not changed comes back as HTTP 304 without a body and is simply kept. `warm` bulk-loads the cache
+from one ADT query, and `prefetch` fills a batch of misses concurrently. Hit, miss, revalidation and
+eviction counts are kept in `TwinCache.stats`.
+
+`TwinCache` can be passed as the `baseline` of a `publisher.TwinPatchPublisher`, which then diffs
+every patch against the cached twin and applies the patches it sends to the cached copies.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from digital_twin.writer import _status_code, pooled_client
+
+NOT_MODIFIED = 304
+NOT_FOUND = 404
+WARM_QUERY = "SELECT * FROM digitaltwins"
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+@dataclass
+class CacheStats:
+  hits: int = 0
+  misses: int = 0
+  not_modified: int = 0  # expired entries revalidated by a 304, no body transferred
+  refreshed: int = 0  # expired entries whose twin had changed
+  evictions: int = 0
+  warmed: int = 0
+
+  @property
+  def requests(self):
+    return self.misses + self.not_modified + self.refreshed
+
+  @property
+  def hit_rate(self):
+    lookups = self.hits + self.requests
+    return (self.hits + self.not_modified) / lookups if lookups else 0.0
+
+
+def _unescape(token):
+  return token.replace("~1", "/").replace("~0", "~")
+
+
+def apply_cached_patch(document, patch):
+  """Apply RFC 6902 `add`/`replace`/`remove` operations to a cached twin, creating missing components."""
+  for operation in patch:
+    tokens = [_unescape(t) for t in operation["path"].split("/")[1:]]
+    parent = document
+    for token in tokens[:-1]:
+      parent = parent.setdefault(token, {})
+    if operation["op"] == "remove":
+      parent.pop(tokens[-1], None)
+    elif operation["op"] in ("add", "replace"):
+      parent[tokens[-1]] = operation["value"]
+  return document
+
+
+class TwinCache:
+  """
+  LRU of `{dtId: twin}` with TTL revalidation, read through `client.get_digital_twin`.
+
+  `client` is a `DigitalTwinsClient` (or `emulator.FakeDigitalTwinsClient`), or a
+  `ConcurrentTwinWriter` wrapping one so reads share its rate limit and retries. Cached documents
+  are shared, not copied: callers must not modify them. Thread-safe; lookups of different twins
+  fetch concurrently.
+  """
+
+  def __init__(self, client, max_twins=100_000, ttl_seconds=300.0, max_workers=16, clock=time.monotonic):
+    self.client = client.client if hasattr(client, "call") else client
+    self._call = client.call if hasattr(client, "call") else (lambda fn, *args, **kwargs: fn(*args, **kwargs))
+    self.max_twins = max_twins
+    self.ttl_seconds = ttl_seconds
+    self.max_workers = max_workers
+    self.clock = clock
+    self.stats = CacheStats()
+    self._entries = OrderedDict()  # dtId -> [twin, fetched_at]
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __contains__(self, twin_id):
+    return twin_id in self._entries
+
+  def __getitem__(self, twin_id):
+    twin = self.get(twin_id)
+    if twin is None:
+      raise KeyError(twin_id)
+    return twin
+
+  def _store(self, twin_id, twin):
+    """Insert or replace an entry as most recently used, evicting the least recently used. Caller holds the lock."""
+    self._entries[twin_id] = [twin, self.clock()]
+    self._entries.move_to_end(twin_id)
+    while len(self._entries) > self.max_twins:
+      self._entries.popitem(last=False)
+      self.stats.evictions += 1
+
+  def _fetch(self, twin_id, etag=None):
+    """The twin, `None` if it does not exist, or the cached entry's marker `NOT_MODIFIED` if `etag` still matches."""
+    kwargs = {"headers": {"If-None-Match": etag}} if etag else {}
+    try:
+      return self._call(self.client.get_digital_twin, twin_id, **kwargs)
+    except Exception as error:
+      status = _status_code(error)
+      if status == NOT_MODIFIED and etag:
+        return NOT_MODIFIED
+      if status == NOT_FOUND:
+        return None
+      raise
+
+  def get(self, twin_id, default=None):
+    """The cached twin, revalidated if older than the TTL, or fetched on a miss."""
+    with self._lock:
+      entry = self._entries.get(twin_id)
+      if entry is not None:
+        self._entries.move_to_end(twin_id)
+        if self.clock() - entry[1] < self.ttl_seconds:
+          self.stats.hits += 1
+          return entry[0]
+    if entry is None:
+      twin = self._fetch(twin_id)
+      with self._lock:
+        self.stats.misses += 1
+        if twin is not None:
+          self._store(twin_id, twin)
+      return default if twin is None else twin
+
+    twin = self._fetch(twin_id, entry[0].get("$etag"))
+    with self._lock:
+      if twin is NOT_MODIFIED:
+        self.stats.not_modified += 1
+        entry[1] = self.clock()
+        return entry[0]
+      self.stats.refreshed += 1
+      if twin is None:
+        self._entries.pop(twin_id, None)
+        return default
+      self._store(twin_id, twin)
+      return twin
+
+  def prefetch(self, twin_ids):
+    """Fetch or revalidate, concurrently, the twins of `twin_ids` that are missing or expired."""
+    now = self.clock()
+    with self._lock:
+      stale = [
+        twin_id for twin_id in dict.fromkeys(twin_ids)
+        if twin_id not in self._entries or now - self._entries[twin_id][1] >= self.ttl_seconds
+      ]
+    if len(stale) > 1 and self.max_workers > 1:
+      with ThreadPoolExecutor(max_workers=min(self.max_workers, len(stale))) as pool:
+        list(pool.map(self.get, stale))
+    else:
+      for twin_id in stale:
+        self.get(twin_id)
+    return len(stale)
+
+  def warm(self, query=WARM_QUERY, limit=None):
+    """Load the twins returned by one ADT query (paged by the service), up to `limit` or `max_twins`."""
+    limit = self.max_twins if limit is None else min(limit, self.max_twins)
+    loaded = 0
+    for twin in self._call(self.client.query_twins, query):
+      if loaded >= limit:
+        break
+      with self._lock:
+        self._store(twin["$dtId"], twin)
+        self.stats.warmed += 1
+      loaded += 1
+    return loaded
+
+  def apply_patch(self, twin_id, patch):
+    """
+    Apply a patch that was just written to ADT to the cached copy, if any. The write returns no new
+    `$etag`, so the entry keeps the old one and its next revalidation transfers the twin again.
+    """
+    with self._lock:
+      entry = self._entries.get(twin_id)
+      if entry is not None:
+        apply_cached_patch(entry[0], patch)
+
+  def invalidate(self, twin_id=None):
+    """Drop one twin, or everything."""
+    with self._lock:
+      if twin_id is None:
+        self._entries.clear()
+      else:
+        self._entries.pop(twin_id, None)
+
+
+def executor_twin_cache(adt_url, max_twins=100_000, ttl_seconds=300.0, pool_size=16, credential=None):
+  """One `TwinCache` per process and URL (e.g. per Spark executor), over `writer.pooled_client`."""
+  with _caches_lock:
+    cache = _caches.get(adt_url)
+    if cache is None:
+      client = pooled_client(adt_url, pool_size=pool_size, credential=credential)
+      cache = _caches[adt_url] = TwinCache(client, max_twins=max_twins, ttl_seconds=ttl_seconds, max_workers=pool_size)
+    return cache
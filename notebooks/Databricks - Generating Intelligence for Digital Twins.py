@@ -69,6 +69,10 @@
 # MAGIC    - Upload the `twins/TwinGraph.json` file
 # MAGIC 5. You should then a twin graph similar to the screenshot below. Finally, click the *Save* icon.
 # MAGIC 
+# MAGIC Alternatively, steps 3 and 4 can be scripted for many plants with `digital_twin.bulk`: `write_import_file` turns `models/` and `twins/TwinGraph.json` into an NDJSON file for the [ADT Import Jobs API](https://learn.microsoft.com/en-us/azure/digital-twins/concepts-apis-sdks#bulk-import-with-the-jobs-api) (`submit_import_job`), and `bulk_upsert` loads the same file through the regular API in parallel.
+# MAGIC 
+# MAGIC If your instance was set up from an earlier version of this repo, its twins are still on the old model versions (ADT models are immutable). The notebook uploads the current `models/` and moves those twins onto them with `digital_twin.bulk.migrate_twin_models` when it starts; alternatively, delete the old twins and re-import `twins/TwinGraph.json`.
+# MAGIC 
 # MAGIC <img src="https://pawaritstorageaccount.blob.core.windows.net/public/digital-twin-gtm/azure-digital-twins-screenshot.png" width=69%>
 
 # COMMAND ----------
@@ -82,7 +86,17 @@
 
 # COMMAND ----------
 
-# MAGIC %pip install azure-identity azure-digitaltwins-core
+# DBTITLE 1,Bootstrap: package path, dependencies and startup timer
+import os, sys
+sys.path.append(os.path.abspath("..")) # make this repo's digital_twin package importable
+from digital_twin.startup import StartupTimer, ensure_packages
+
+# Times each startup phase; time-to-first-batch is reported with the first micro-batch into digital_twins.pipeline_latency (startup.* stages)
+startup = StartupTimer()
+
+with startup.phase("dependencies"):
+  # Only installs what is missing, so restarts skip pip. For jobs, attaching these as cluster / job libraries is faster still
+  ensure_packages({"azure.identity": "azure-identity", "azure.digitaltwins.core": "azure-digitaltwins-core"})
 
 # COMMAND ----------
 
@@ -100,12 +114,20 @@
 # COMMAND ----------
 
 import pandas as pd
+from digital_twin.resources import VIBRATION_REPORTS_PATH, cached_artifact
 
 storage_account = "pawaritstorageaccount" # for original training set
-
-vibration_reports_path = f"https://{storage_account}.blob.core.windows.net/public/digital-twin-gtm/data/model_development/vibration_reports.csv"
-vibration_reports = spark.createDataFrame(pd.read_csv(vibration_reports_path))
-vibration_reports.write.mode("overwrite").saveAsTable("vibration_reports_labelled")
+artifact_cache = "/dbfs/tmp/digital_twin/artifacts" # reference data downloaded once, shared by every cluster and restart
+
+with startup.phase("reference_data"):
+  # this repo's data/vibration_reports.csv, else a cached copy of the original training set
+  vibration_reports_path = cached_artifact(
+    VIBRATION_REPORTS_PATH,
+    url=f"https://{storage_account}.blob.core.windows.net/public/digital-twin-gtm/data/model_development/vibration_reports.csv",
+    cache_dir=artifact_cache,
+  )
+  vibration_reports = spark.createDataFrame(pd.read_csv(vibration_reports_path))
+  vibration_reports.write.mode("overwrite").saveAsTable("vibration_reports_labelled")
 
 display(vibration_reports)
 
@@ -153,11 +175,10 @@ display(vibration_reports)
 
 # COMMAND ----------
 
-import databricks.automl
-
 run_automl = False # change to True if you're not a Databricks employee on the demo workspace!
 
 if run_automl:
+  import databricks.automl # only imported when AutoML actually runs
   
   # Successfully run on ML Runtime 10.4 LTS
   summary = databricks.automl.classify(
@@ -179,12 +200,11 @@ if run_automl:
 
 # COMMAND ----------
 
-import mlflow
-from mlflow.tracking.client import MlflowClient
-
 model_name = "vibration_fault_detection"
 
 if run_automl:
+  import mlflow
+  from mlflow.tracking.client import MlflowClient
 
   # Find path to our best model from AutoML, then add it to our model registry
   model_uri = summary.best_trial.model_path
@@ -200,6 +220,30 @@ if run_automl:
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC 
+# MAGIC #### Keeping the model fresh with incremental training
+# MAGIC 
+# MAGIC Retraining through AutoML means a full run over every labelled report. As new reports get labelled (appended to a Delta table), `digital_twin.training` folds each micro-batch into an incremental classifier instead: the cost of an update depends on the batch size, not on the size of the table (see `benchmarks/online_training.py`). The model state is checkpointed after every batch, and a new version is registered every few minutes.
+
+# COMMAND ----------
+
+from digital_twin.training import OnlineTrainer, train_from_stream
+
+run_incremental_training = False # needs a Delta table that newly labelled reports are appended to
+
+if run_incremental_training:
+  trainer = OnlineTrainer(
+    "/dbfs/tmp/digital_twin/models/incremental_fault_model.npz",
+    registered_model_name=f"{model_name}_incremental",
+    register_every_seconds=300,
+  )
+  training_query = train_from_stream(
+    spark.readStream.table("vibration_reports_labelled"), trainer, "/dbfs/tmp/digital_twin/checkpoints/incremental_training"
+  )
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC 
 # MAGIC ## Integrating with your live environment
@@ -241,7 +285,7 @@ os.environ["AZURE_CLIENT_SECRET"] = spSecret
 
 storage_account = "pawaritstorageaccount" # TODO: please change to your own storage account
 
-spark.conf.set("spark.sql.shuffle.partitions", 1) # just for this demo
+spark.conf.set("spark.sql.shuffle.partitions", 1) # just for this demo; size it (and the trigger below) from the stage latencies in digital_twins.pipeline_latency
 spark.conf.set(f"fs.azure.account.auth.type.{storage_account}.dfs.core.windows.net", "OAuth")
 spark.conf.set(f"fs.azure.account.oauth.provider.type.{storage_account}.dfs.core.windows.net", "org.apache.hadoop.fs.azurebfs.oauth2.ClientCredsTokenProvider")
 spark.conf.set(f"fs.azure.account.oauth2.client.id.{storage_account}.dfs.core.windows.net", spId)
@@ -253,16 +297,26 @@ spark.conf.set(f"fs.azure.account.oauth2.client.endpoint.{storage_account}.dfs.c
 import pyspark.sql.functions as F
 from pyspark.sql.types import *
 
-import requests
-
-from azure.digitaltwins import *
-from azure.digitaltwins.core import DigitalTwinsClient
-from azure.identity import *
+# azure.*, mlflow and the pandas/pyarrow code paths are imported by the digital_twin functions that need them, when they first run
+from digital_twin.bulk import migrate_twin_models
+from digital_twin.debounce import Debouncer, debounce_predictions
+from digital_twin.dtdl import ModelRegistry
+from digital_twin.graph import TwinGraphStore
+from digital_twin.inference import ARROW_BATCH_CONF, stage_model, with_fault_predictions
+from digital_twin.latency import STAGE_COLUMNS, PipelineLatency, latency_listener, observe_latency, stamp_ingestion
+from digital_twin.mirror import DeltaTwinMirror, merge_patches, stream_run_id
+from digital_twin.propagation import FaultPropagator
+from digital_twin.ingestion import read_landing_zone, read_message_stream
+from digital_twin.messages import event_hubs_spark_options
+from digital_twin.publisher import TwinPatchPublisher, component_health_states
+from digital_twin.schema import FAULT_CLASSES, FEATURE_COLUMNS, LANDING_SCHEMA_DDL, NORMAL_CLASS
+from digital_twin.twin_cache import TwinCache
+from digital_twin.writer import ConcurrentTwinWriter, pooled_client
 
 # COMMAND ----------
 
-feature_columns = ['max', 'min', 'mean', 'sd', 'rms', 'skewness', 'kurtosis', 'crest', 'form']
-schema = ", ".join([x + " float" for x in feature_columns])
+feature_columns = FEATURE_COLUMNS # ['max', 'min', 'mean', 'sd', 'rms', 'skewness', 'kurtosis', 'crest', 'form']
+schema = LANDING_SCHEMA_DDL # "max float, min float, ..., station_id string, device_id string"
 
 dbutils.fs.rm("./tmp/digital_twin_upload_schema/", True)
 dbutils.fs.mkdirs("./tmp/digital_twin_upload_schema/")
@@ -284,20 +338,35 @@ landing_zone_storage_account = "pawaritstorageaccount" # TODO: please change to
 landing_zone_storage_container = "demo" # TODO: please change to your own storage container
 landing_zone_path = f"abfss://{landing_zone_storage_container}@{landing_zone_storage_account}.dfs.core.windows.net/digital-twin/data/landing_zone"
 
-input_df = (
-  spark
-    .readStream
-    .format("cloudFiles")
-    .option("cloudFiles.format", "csv")
-    .option("header", "true")
-    .option("cloudFiles.schemaLocation", "/tmp/digital_twin_upload_schema/")
-    .option("cloudFiles.schemaHints", schema)
-    .option("cloudFiles.useIncrementalListing", "true") # for demo purposes, no checkpointing
-    .load(landing_zone_path)
-)
+landing_format = "csv" # one small CSV per reading; use "parquet" or "ndjson" for batched landing files (see the IoT Upload Simulator's flush_rows/flush_interval)
+
+ingestion_mode = "files" # "kafka" reads binary messages from Event Hubs / Kafka instead (see the IoT Upload Simulator's producer mode), with no file listing or CSV parsing
+message_encoding = "struct" # or "avro", matching the simulator's landing_format
+event_hubs_namespace = "<namespace>" # TODO: please change to your own Event Hubs namespace
+event_hubs_topic = "vibration-readings" # TODO: please change to your own event hub
 
-input_df = input_df.select(file_name_expr.alias("fileName"), "*") # Get file name from ADLS path
-input_df = input_df.withColumn("station_id", F.lit("MixingStep-Line1-Munich")) # for this demo, simulate just one station for clarity
+if ingestion_mode == "kafka":
+  input_df = read_message_stream( # fileName is topic/partition@offset; enqueued_time is when Event Hubs accepted the message
+    spark,
+    f"{event_hubs_namespace}.servicebus.windows.net:9093",
+    event_hubs_topic,
+    encoding=message_encoding,
+    options=event_hubs_spark_options(event_hubs_namespace, dbutils.secrets.get(scope = "common-sp", key = "event-hubs-connection-string")), # TODO: please change to your own credentials
+  )
+else:
+  input_df = read_landing_zone( # Auto Loader (cloudFiles) stream; its progress is checkpointed by the queries reading it below
+    spark, 
+    landing_zone_path, 
+    schema_location="/tmp/digital_twin_upload_schema/", 
+    landing_format=landing_format,
+  )
+  input_df = input_df.select(file_name_expr.alias("fileName"), "*") # Get file name from ADLS path
+
+input_df = input_df.withColumn( # uploads from the simulated device fleet name their station, otherwise default to a single station for clarity
+  "station_id", F.coalesce(F.col("station_id"), F.lit("MixingStep-Line1-Munich"))
+)
+# Stamp each reading with its upload, ingestion (file landed / message enqueued) and parse (micro-batch) times
+input_df = stamp_ingestion(input_df, "enqueued_time" if ingestion_mode == "kafka" else "_metadata.file_modification_time")
 display(input_df)
 
 # COMMAND ----------
@@ -310,8 +379,6 @@ display(input_df)
 
 # COMMAND ----------
 
-import mlflow.pyfunc
-
 # Load the current (latest) model from the PROD environment
 model_name = "vibration_fault_detection"
 environment = "production" 
@@ -319,14 +386,38 @@ model_production_uri = f"models:/{model_name}/{environment}"
 
 print("Loading registered model version from URI: '{model_uri}'".format(model_uri=model_production_uri))
 
-# Load the current (latest) model from the PROD environment into a User-Defined Function (UDF)
+# Stage the current (latest) model from the PROD environment once, so each executor loads and caches it from DBFS
 # Make sure the model exists on your workspace: set run_automl to True if you don't have the trained model in your workspace yet! 
-loaded_model = mlflow.pyfunc.spark_udf(spark, model_uri=model_production_uri, result_type='string')
+with startup.phase("model"):
+  local_model_path = stage_model(model_production_uri, "/dbfs/tmp/digital_twin/models/vibration_fault_detection")
+
+# Apply our LightGBM model immediately to our incoming data, one Arrow batch (of up to 10,000 rows) at a time
+# Each row gets an integer fault_class (see digital_twin.schema.FAULT_CLASSES) and its probability
+spark.conf.set(ARROW_BATCH_CONF, "10000")
+prediction_df = with_fault_predictions(input_df, local_model_path, feature_columns, stamp_column=STAGE_COLUMNS["score"])
+
+# Component-level mode: each predicted class (e.g. IR_014_1) is published to the bearing component it names
+# (InnerRing, OuterRing or BallBearings) with its severity and probability, as one patch per station.
+# Set to False for the original NORMAL / BALL_FAULT_PREDICTED health flag on BallBearings only
+publish_components = True
+if publish_components:
+  fault_labels = F.array(*[F.lit(label) for label in FAULT_CLASSES])
+  prediction_df = prediction_df.withColumn("prediction", F.element_at(fault_labels, F.col("fault_class") + 1))
+else:
+  prediction_df = prediction_df.withColumn(
+    "prediction", F.when(F.col("fault_class") == NORMAL_CLASS, "NORMAL").otherwise("BALL_FAULT_PREDICTED")
+  )
 
-# Apply our LightGBM model immediately to our incoming data
-prediction_df = input_df.withColumn("prediction", loaded_model(*feature_columns))
-prediction_df = prediction_df.withColumn(
-  "prediction", F.when(F.col("prediction").startswith("Normal"), "NORMAL").otherwise("BALL_FAULT_PREDICTED")
+# Per-stage latency histograms (upload -> ingest -> parse -> score) are computed inside the query and reported with its progress
+prediction_df = observe_latency(prediction_df)
+
+# Most readings repeat the same state and single noisy readings would flip the twin back and forth:
+# only pass on confirmed transitions (4 of a station's last 5 readings agree) plus a 15-minute heartbeat.
+# Stations silent for an hour (by event time, per-reading CSVs fall back to arrival time) are evicted from the state
+prediction_df = prediction_df.withColumn("event_time", F.coalesce(F.col("event_time"), F.current_timestamp()))
+transitions_df = debounce_predictions(
+  prediction_df, Debouncer(n=4, m=5, heartbeat_seconds=900, ttl_seconds=3600),
+  carry_columns=["fault_class", "fault_probability", "upload_time", "score_time"], # class, probability and timings of the reading behind each emit
 )
 
 # COMMAND ----------
@@ -345,38 +436,139 @@ display(prediction_df.select("station_id", "prediction", "*")) # healthPredictio
 
 # COMMAND ----------
 
-adt_url = "battery-plant-digital-twin.api.eus2.digitaltwins.azure.net" # replace this with your own Azure Digital Twin URL
-twin_graph_path = "https://raw.githubusercontent.com/PawaritL/databricks-azure-digital-twin/main/twins/TwinGraph.json"
+from azure.identity import DefaultAzureCredential
+from digital_twin.resources import TWIN_GRAPH_PATH, cached_artifact, load_twin_graph
 
-credential = DefaultAzureCredential()
-service_client = DigitalTwinsClient(adt_url, credential)
+adt_url = "battery-plant-digital-twin.api.eus2.digitaltwins.azure.net" # replace this with your own Azure Digital Twin URL
 
-twin_graph_json = requests.get(twin_graph_path).json()
-twin_graph = twin_graph_json["digitalTwinsGraph"]
-twins = twin_graph["digitalTwins"]
+with startup.phase("twins"):
+  credential = DefaultAzureCredential()
+  service_client = pooled_client(adt_url, pool_size=16, credential=credential)
+  adt_writer = ConcurrentTwinWriter(service_client, max_workers=16) # concurrent, rate-limited, retries throttled (429) updates
+  # ADT models are immutable: twins imported from an earlier version of models/ stay on their old model ids, and ADT would
+  # reject the roll-up and component properties validated below against the current ones. Upload the current models and
+  # move those twins onto them (a no-op once done)
+  failed_migrations = {twin_id: error for twin_id, error in migrate_twin_models(service_client).items() if error is not None}
+  if failed_migrations:
+    raise RuntimeError(f"Could not move {len(failed_migrations)} twin(s) onto the current models: {failed_migrations}")
+
+  # this repo's twins/TwinGraph.json, else a cached copy of the published one
+  twin_graph = load_twin_graph(cached_artifact(
+    TWIN_GRAPH_PATH,
+    url="https://raw.githubusercontent.com/PawaritL/databricks-azure-digital-twin/main/twins/TwinGraph.json",
+    cache_dir=artifact_cache,
+  ))
+  twins = twin_graph["digitalTwins"]
   
 twin_dict = {twin["$dtId"]: twin for twin in twins}
-twin_dict_b = sc.broadcast(twin_dict)
+
+# Indexed graph (by model, step type, site and line) that keeps the relationships, e.g. twin_store.select(step="mixing", site="MunichSite")
+twin_store = TwinGraphStore.from_graph(twin_graph)
+twin_store_b = sc.broadcast(twin_store.to_bytes()) # compact binary form; on executors use TwinGraphStore.from_bytes(twin_store_b.value)
+
+# Everything sent to ADT is mirrored in Delta: digital_twins.twin_state (current properties, partitioned by site and model)
+# and digital_twins.twin_state_history (append-only change feed). The fault roll-up resumes from the mirror after a restart.
+# Replayed micro-batches are skipped by batch id within a run of the stream (its query id, kept by its checkpoint), so batch
+# ids starting again at 0 after the checkpoint is reset still update the mirror.
+spark.sql("CREATE DATABASE IF NOT EXISTS digital_twins")
+twin_mirror = DeltaTwinMirror(spark, twin_store).create()
+mirrored_state = twin_mirror.published_state()
+
+# Only minimal JSON patches for properties that actually changed are sent, diffed against the live twins in twin_cache:
+# a bounded LRU of twins read from ADT (memory stays flat however large the fleet), revalidated by $etag once older than
+# the TTL (unchanged twins cost a 304), so properties changed in ADT by others are picked up. Hit/miss counts are in twin_cache.stats.
+# Without a cache, pass published=mirrored_state to diff against what was last mirrored, or baseline=twin_dict to trust TwinGraph.json.
+# For very large fleets, patches can instead be written from the executors with digital_twin.writer.publish_from_executors,
+# where digital_twin.twin_cache.executor_twin_cache(adt_url) keeps one cache per process
+twin_cache = TwinCache(adt_writer, max_twins=100_000, ttl_seconds=300)
+twin_cache.warm() # one paged query instead of a GET per twin on the first batches
+# Patches are checked against the DTDL models in ../models before sending, so bad property names or types are caught here
+model_registry = ModelRegistry.from_repo()
+publisher = TwinPatchPublisher( # the latest transition or heartbeat per station wins
+  adt_writer, order_column="event_time",
+  value_columns=("prediction", "fault_class", "fault_probability", "upload_time", "score_time"),
+  states_fn=component_health_states if publish_components else None, # all components of a batch mapped in one pass
+  validator=model_registry.patch_checker(lambda twin_id: twin_store.model_of(twin_id) if twin_id in twin_store.index else None),
+  baseline=twin_cache,
+)
+
+# Predicted faults are rolled up to the station's line and site and flagged on the steps downstream of it (leads_to);
+# only the twins whose rolled-up state changes are updated
+def station_faults(states): # a station is faulty while any of its components is
+  return {
+    twin_id: state["/HealthPrediction"] != "OK" for twin_id, state in states.items()
+    if twin_id in twin_store and "/HealthPrediction" in state
+  }
+
+def sent_states(patches): # {twin_id: patch} -> the properties each patch set
+  return {twin_id: {op["path"]: op["value"] for op in patch if op["op"] != "remove"} for twin_id, patch in patches.items()}
+
+fault_rollup = FaultPropagator(twin_store, faults=station_faults(mirrored_state))
+rollup_publisher = TwinPatchPublisher(adt_writer, state_fn=dict, validator=publisher.validator, baseline=twin_cache)
+
+# Stage latencies from the query progress (StreamingQueryListener) and from each publish, appended to digital_twins.pipeline_latency
+pipeline_latency = PipelineLatency(query="mixer_health")
+spark.streams.addListener(latency_listener(pipeline_latency))
 
 def publish_mixer_health(batch_df, batch_id):
-  batch_pdf = batch_df.toPandas()
-
-  for idx, row in batch_pdf.iterrows():
-    temporary_twin = twin_dict_b.value.get(row["station_id"])
-    patch = {
-      "HealthPrediction": "OK" if (row["prediction"] == "NORMAL") else "FAULT_PREDICTED",
-      "BallBearings": {
-        "faultPredicted": row["prediction"] != "NORMAL",
-        "$metadata": {}
-      },
-    }
-    temporary_twin.update(patch)
-    service_client.upsert_digital_twin(row["station_id"], temporary_twin)
+  stats = publisher.publish_batch(batch_df, batch_id)
+  if startup.first_batch(batch_id): # cold start: from the first cell to the first published micro-batch
+    startup.record(pipeline_latency, query="mixer_health")
+    print(startup)
+  pipeline_latency.record_published(batch_id, publisher.last_records, publisher.last_sent) # publish and end-to-end latency of the twins updated
+  print(f"Batch {batch_id}: {stats}")
+  if stats.patches_rejected:
+    print(f"Rejected by DTDL validation: {publisher.rejected}")
+  fault_rollup.update(station_faults(sent_states(publisher.last_sent))) # only the stations whose health changed this batch
+  print(f"Batch {batch_id} roll-up: {fault_rollup.publish(rollup_publisher)}")
+  twin_mirror.apply(merge_patches(publisher.last_sent, rollup_publisher.last_sent), batch_id, run_id=stream_run_id(spark))
+  pipeline_latency.flush(spark)
   return
 
 # COMMAND ----------
 
-prediction_df.writeStream.foreachBatch(publish_mixer_health).trigger(processingTime="10 seconds").start()
+trigger_interval = "10 seconds" # compare the trigger.* durations with the stage latencies in digital_twins.pipeline_latency before changing this
+checkpoint_root = "/dbfs/tmp/digital_twin/checkpoints" # a restarted query resumes from its checkpoint, keeping its id and batch ids
+(
+  transitions_df.writeStream.queryName("mixer_health")
+    .foreachBatch(publish_mixer_health)
+    .option("checkpointLocation", f"{checkpoint_root}/mixer_health")
+    .trigger(processingTime=trigger_interval)
+    .start()
+)
+
+# Vibration features are also rolled up into 1-second, 1-minute and 1-hour buckets per station (digital_twins.vibration_rollup_*),
+# so dashboards over long histories read aggregates instead of every reading
+from digital_twin.rollups import DeltaRollups
+
+vibration_rollups = DeltaRollups(spark, "digital_twins.vibration_rollup").create()
+(
+  input_df.writeStream.queryName("vibration_rollups")
+    .foreachBatch(lambda batch_df, batch_id: vibration_rollups.update(
+      batch_df, feature_columns, time_column="upload_time", batch_id=batch_id, run_id=stream_run_id(spark),
+    )) # replays are recognised within the query's run, as for the twin mirror
+    .option("checkpointLocation", f"{checkpoint_root}/vibration_rollups")
+    .trigger(processingTime="1 minute")
+    .start()
+)
+
+# COMMAND ----------
+
+# MAGIC %sql
+# MAGIC -- Where the time goes from device upload to twin update, per stage (ms); trigger.* rows are Spark's own phase durations
+# MAGIC SELECT stage, sum(count) AS readings, percentile(p50_ms, 0.5) AS typical_p50_ms, max(p99_ms) AS worst_p99_ms, max(max_ms) AS max_ms
+# MAGIC FROM digital_twins.pipeline_latency
+# MAGIC WHERE recorded_at > current_timestamp() - INTERVAL 1 HOUR
+# MAGIC GROUP BY stage
+# MAGIC ORDER BY stage
+
+# COMMAND ----------
+
+# MAGIC %sql
+# MAGIC -- Current twin state at scan speed, without calling the ADT API
+# MAGIC SELECT site_id, twin_id, get_json_object(properties['/HealthPrediction'], '$') AS health_prediction, updated_at
+# MAGIC FROM digital_twins.twin_state
+# MAGIC WHERE model = 'production_step_mixing'
 
 # COMMAND ----------
 
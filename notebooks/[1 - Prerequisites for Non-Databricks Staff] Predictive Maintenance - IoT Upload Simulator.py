@@ -5,22 +5,24 @@
 
 # COMMAND ----------
 
-# MAGIC %pip install azure-storage-blob
+# DBTITLE 1,Bootstrap: package path and dependencies
+import os, sys
+sys.path.append(os.path.abspath("..")) # make this repo's digital_twin package importable
+from digital_twin.startup import ensure_packages
+
+ensure_packages({"azure.storage.blob": "azure-storage-blob"}) # installs only if missing, instead of %pip on every run
 
 # COMMAND ----------
 
 # DBTITLE 1,Load example data from IoT Device
 import pandas as pd
+from digital_twin.resources import VIBRATION_REPORTS_PATH, cached_artifact
 
 storage_account = "pawaritstorageaccount"
-vibration_reports_path = f"https://{storage_account}.blob.core.windows.net/public/digital-twin-gtm/data/model_development/vibration_reports.csv"
+vibration_reports_url = f"https://{storage_account}.blob.core.windows.net/public/digital-twin-gtm/data/model_development/vibration_reports.csv"
 
-full_df = pd.read_csv(vibration_reports_path)
-
-# COMMAND ----------
-
-no_fault_df = full_df[full_df["fault"].str.contains("Normal")].drop("fault", axis=1)
-fault_df = full_df[full_df["fault"].str.contains("Ball_007_1")].drop("fault", axis=1)
+# this repo's data/vibration_reports.csv, else a cached copy of the published one
+full_df = pd.read_csv(cached_artifact(VIBRATION_REPORTS_PATH, url=vibration_reports_url))
 
 # COMMAND ----------
 
@@ -40,39 +42,50 @@ if sas_token == Ellipsis:
 # COMMAND ----------
 
 # DBTITLE 1,Use the Azure SDK to interact with the storage container
-from azure.storage.blob import ContainerClient
+from digital_twin.simulator import ContainerSink, ReportSampler, UploadSimulator, device_fleet, pooled_container_client
 
 blob_storage_account = "pawaritstorageaccount" # TODO: please change to your own storage account
 blob_storage_container = "demo" # TODO: please change to your own storage container
 url = f"https://{storage_account}.blob.core.windows.net/" + blob_storage_container
 
-container_client = ContainerClient.from_container_url(
-    container_url=url,
-    credential=sas_token
-)
+container_client = pooled_container_client(url, credential=sas_token, pool_size=16) # reuses connections across concurrent uploads
 
 # COMMAND ----------
 
 # DBTITLE 1,Now, let's upload our arbitrary files to this container
-import time
-
 max_uploads = 50
 upload_interval = 1 # in seconds
 t_failure = 30 # seconds until "Mixing Station failure"
-i_failure = int(t_failure / upload_interval) # iteration for failure to occur at
 
-for i in range(1, max_uploads+1):
-  
-  chosen_df = no_fault_df if (i < i_failure) else fault_df
-  feature_df = chosen_df.sample(n=1, random_state=i).reset_index(drop=True)
-  
-  container_client.upload_blob(
-    name=f"/digital-twin/data/landing_zone/device_upload_{str(i).zfill(4)}.csv", 
-    data=feature_df.to_csv(index=False), 
-    overwrite=True
-  )
-  
-  time.sleep(upload_interval)
+# One device on the Munich mixer that develops a ball bearing fault after t_failure seconds
+fleet = device_fleet(["MixingStep-Line1-Munich"], fault_fraction=1.0, onset_range=(t_failure, t_failure), fault_labels=["Ball_007_1"])
+
+# For load tests, simulate many devices across all mixing stations in TwinGraph.json instead, e.g.:
+# from digital_twin.graph import TwinGraphStore
+# from digital_twin.resources import load_twin_graph
+# fleet = device_fleet(TwinGraphStore.from_graph(load_twin_graph()).select(step="mixing"), devices_per_station=100, fault_fraction=0.1)
+# ...and raise files_per_second / max_uploads below
+#
+# To avoid one tiny CSV per reading, devices can buffer readings and write batched Parquet (or NDJSON) files instead:
+# UploadSimulator(fleet, ContainerSink(container_client), rows_per_second=1000, landing_format="parquet", flush_rows=500, flush_interval=10)
+# (then set landing_format = "parquet" in the main notebook)
+#
+# To skip the landing zone altogether, produce one binary message per reading to Event Hubs (Kafka endpoint) instead:
+# %pip install confluent-kafka
+# from digital_twin.messages import KafkaProducerSink, event_hubs_producer_config
+# eh_sink = KafkaProducerSink.from_config(event_hubs_producer_config("<namespace>", "<connection string>"), "vibration-readings")
+# UploadSimulator(fleet, eh_sink, rows_per_second=1000, landing_format="struct") # or "avro"
+# (then set ingestion_mode = "kafka" and message_encoding = "struct" in the main notebook)
+
+simulator = UploadSimulator(
+  fleet, 
+  ContainerSink(container_client), 
+  files_per_second=len(fleet) / upload_interval, 
+  max_workers=16,
+  sampler=ReportSampler(full_df), # healthy readings are sampled from "Normal_1" reports, faulty ones from the device's fault class
+)
+stats = simulator.run(max_files=max_uploads)
+print(stats, f"{stats.files_per_second:.1f} files/s")
 
 # COMMAND ----------
 
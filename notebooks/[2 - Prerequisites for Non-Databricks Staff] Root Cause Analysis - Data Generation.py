@@ -5,17 +5,18 @@
 
 # COMMAND ----------
 
+import os, sys
+sys.path.append(os.path.abspath("..")) # make this repo's digital_twin package importable
+
 import pyspark.sql.functions as F
 from pyspark.sql.types import *
 
 # COMMAND ----------
 
+# DBTITLE 1,Preview: one healthy and one faulty fan-speed trace
 import numpy as np
-from scipy import signal
 import pandas as pd
-import plotly.express as px
-
-# COMMAND ----------
+from digital_twin.generation import _square # numpy equivalent of scipy.signal.square, so scipy isn't needed
 
 rng = np.random.default_rng()
 
@@ -35,18 +36,22 @@ def generate_healthy():
   return healthy_fan_speeds
 
 def generate_faulty():
-  faulty_square_component = 0.01*AVERAGE_RPM*signal.square(sin_input + rng.random())
+  faulty_square_component = 0.01*AVERAGE_RPM*_square(sin_input + rng.random())
   faulty_fan_speeds = rng.normal(AVERAGE_RPM, FAULTY_STDDEV_RPM, N_SAMPLES) + faulty_square_component
   return faulty_fan_speeds
 
-# COMMAND ----------
-
 healthy_df = pd.DataFrame({"DryerFanSpeed": generate_healthy()})
 healthy_df["status"] = "OK"
 faulty_df = pd.DataFrame({"DryerFanSpeed": generate_faulty()})
 faulty_df["status"] = "FAULTY_CONTROLLER"
 
 complete_df = pd.concat([healthy_df, faulty_df], axis=0)
+
+# COMMAND ----------
+
+# DBTITLE 1,Plot the preview
+import plotly.express as px # only this exploratory plot needs plotly
+
 px.scatter(complete_df, y="DryerFanSpeed", color="status", title="Fan Speeds (rpm) for Coating & Drying Station")
 
 # COMMAND ----------
@@ -63,34 +68,60 @@ faulty_stations = [
 ]
 all_stations = healthy_stations + faulty_stations
 
-N_REPEATS = 1
-coating_df = pd.DataFrame()
-
-for r in range(N_REPEATS):
-  for station in all_stations:
-    healthy_df = pd.DataFrame({"dryerFanSpeed": generate_healthy()})
-    healthy_df["dryerTemperature"] = (healthy_df["dryerFanSpeed"] / AVERAGE_RPM) * AVERAGE_TEMPERATURE
-    healthy_df["station_id"] = station
-    healthy_df["_index"] = healthy_df.index + healthy_df.index.max()*r
-    coating_df = pd.concat([coating_df, healthy_df], axis=0)
-
-for station in healthy_stations:
-  healthy_df = pd.DataFrame({"dryerFanSpeed": generate_healthy()})
-  healthy_df["dryerTemperature"] = (healthy_df["dryerFanSpeed"] / AVERAGE_RPM) * AVERAGE_TEMPERATURE
-  healthy_df["station_id"] = station
-  healthy_df["_index"] = healthy_df.index + healthy_df.index.max()*(r+1)
-  coating_df = pd.concat([coating_df, healthy_df], axis=0)
-
-for station in faulty_stations:
-  faulty_df = pd.DataFrame({"dryerFanSpeed": generate_faulty()})
-  faulty_df["dryerTemperature"] = (faulty_df["dryerFanSpeed"] / AVERAGE_RPM) * AVERAGE_TEMPERATURE
-  faulty_df["station_id"] = station
-  faulty_df["_index"] = faulty_df.index + healthy_df.index.max()*(r+1)
-  coating_df = pd.concat([coating_df, faulty_df], axis=0)
+from digital_twin.generation import COATING_SIGNALS, TelemetryGenerator
+
+N_REPEATS = 1 # healthy periods before the faulty station's controller starts failing
+
+# Generates every station and period at once, one chunk at a time (memory stays bounded however many periods you ask for)
+# Covers dryerFanSpeed, dryerTemperature and coatingSurfaceTemperature from ProductionStepCoating.json
+generator = TelemetryGenerator(
+  all_stations,
+  faulty_stations=faulty_stations,
+  n_periods=N_REPEATS + 1,
+  signals=COATING_SIGNALS,
+  seed=42, # same seed, same dataset
+)
   
 schema_name = "digital_twins"
 table_name = "battery_coating_analysis"
-spark.createDataFrame(coating_df).write.mode("overwrite").saveAsTable(f"{schema_name}.{table_name}")
+generator.write_table(spark, f"{schema_name}.{table_name}")
+
+# For cluster-scale datasets covering every production step model, generate on the executors instead:
+# from digital_twin.generation import FaultProfile, spark_step_telemetry
+# from digital_twin.resources import load_models, load_twin_graph
+# step_dfs = spark_step_telemetry(spark, load_twin_graph(), load_models(), n_periods=10_000,
+#                                 fault_profiles={"CoatingStep-Line2-Dallas": FaultProfile(onset_period=5_000, signals=("DryerFanSpeed", "DryerTemperature"))})
+# for model_id, df in step_dfs.items():
+#   df.write.mode("overwrite").saveAsTable(f"{schema_name}.telemetry_{model_id.split(':')[-1].split(';')[0]}")
+
+# COMMAND ----------
+
+# DBTITLE 1,Precompute 1-second, 1-minute and 1-hour rollups for the dashboard
+from digital_twin.generation import SAMPLES_PER_PERIOD
+from digital_twin.rollups import DeltaRollups
+
+# count/mean/sd/min/max and a t-digest (p50/p95/p99 within rollups.rank_error_bound) per station, signal and bucket, in digital_twins.telemetry_rollup_{1s,1m,1h};
+# new data is merged into the buckets it touches, so the same call can run on every (micro-)batch
+telemetry_rollups = DeltaRollups(spark, f"{schema_name}.telemetry_rollup").create()
+telemetry_rollups.update(
+  spark.table(f"{schema_name}.{table_name}"), [signal.name for signal in COATING_SIGNALS],
+  time_column=F.col("_index") / SAMPLES_PER_PERIOD, # _index counts 1 kHz samples: seconds since the start of the run
+)
+# Dashboards read the coarsest table that still resolves their range, e.g. the whole run in at most 500 buckets per station:
+display(telemetry_rollups.query(0, N_REPEATS + 1, signals=["dryerFanSpeed"], max_points=500))
+
+# COMMAND ----------
+
+# DBTITLE 1,Rank suspect stations and signals automatically
+from digital_twin.anomaly import FleetAnomalyDetector, spark_anomaly_scores, spark_suspects
+
+# Every station is scored per one-second window: spectral peaks (Welch), variance against the fleet and cross-station z-scores.
+# CoatingStep-Line2-Dallas's dryer signals should come out on top, from the period its controller starts failing
+detector = FleetAnomalyDetector(threshold=6.0)
+coating_df = spark.table(f"{schema_name}.{table_name}")
+anomaly_scores_df = spark_anomaly_scores(coating_df, [signal.name for signal in COATING_SIGNALS], detector)
+anomaly_scores_df.write.mode("overwrite").saveAsTable(f"{schema_name}.coating_anomaly_scores")
+display(spark_suspects(spark.table(f"{schema_name}.coating_anomaly_scores"), detector.threshold))
 
 # COMMAND ----------
 
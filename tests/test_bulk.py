@@ -0,0 +1,171 @@
+import copy
+import io
+import json
+import re
+
+import pytest
+
+from digital_twin.bulk import (MODELS, RELATIONSHIPS, TWINS, bulk_upsert, iter_json_array, migrate_twin_models,
+                               read_import_file, twin_graph_sections, write_import_file)
+from digital_twin.dtdl import ModelRegistry
+from digital_twin.emulator import DigitalTwinsEmulator, EmulatorHttpError, FakeDigitalTwinsClient
+from digital_twin.resources import TWIN_GRAPH_PATH, load_models, load_twin_graph
+
+
+def previous_version(document):
+  """`document` with every versioned repo id one version older, as uploaded before the last bump."""
+  def older(match):
+    version = int(match.group(2))
+    return f"{match.group(1)};{version - 1 if version > 1 else version}"
+
+  return json.loads(re.sub(r"(dtmi:com:[\w:]+);(\d+)", older, json.dumps(document)))
+
+
+@pytest.fixture
+def legacy():
+  """An instance loaded from the previous version of `models/`: old model ids, twins created on them."""
+  emulator = DigitalTwinsEmulator.from_repo()
+  emulator.models = {}
+  emulator.load_models([previous_version(model) for model in load_models()])
+  for twin in emulator.twins.values():
+    twin["$metadata"]["$model"] = previous_version(twin["$metadata"]["$model"])
+  return emulator
+
+
+def test_twins_are_moved_onto_the_current_model_versions(legacy):
+  client = FakeDigitalTwinsClient(legacy)
+  current = {model["@id"] for model in load_models()}
+
+  results = migrate_twin_models(client)
+
+  assert set(results) == set(legacy.twins) and not any(results.values())
+  assert {twin["$metadata"]["$model"] for twin in legacy.twins.values()} <= current
+  assert current <= set(legacy.models)  # uploaded next to the old versions
+  assert migrate_twin_models(client) == {}
+
+
+def test_twins_of_other_models_and_newer_versions_are_left_alone(legacy):
+  client = FakeDigitalTwinsClient(legacy)
+  site = legacy.twins["MunichSite"]
+  site_model = copy.deepcopy(next(model for model in load_models() if ":production_site;" in model["@id"]))
+  site_model["@id"] = site_model["@id"].replace(";2", ";9")
+  legacy.load_models([site_model])
+  site["$metadata"]["$model"] = site_model["@id"]
+
+  results = migrate_twin_models(client)
+
+  assert "MunichSite" not in results
+  assert site["$metadata"]["$model"].endswith(";9")
+
+
+def test_a_twin_cannot_be_moved_onto_a_model_the_instance_lacks(legacy):
+  client = FakeDigitalTwinsClient(legacy)
+
+  with pytest.raises(EmulatorHttpError):
+    client.update_digital_twin("MunichSite", [{"op": "replace", "path": "/$metadata/$model", "value": "dtmi:unknown;1"}])
+
+
+def test_migrated_twins_validate_against_the_registry(legacy):
+  registry = ModelRegistry.from_repo()
+
+  migrate_twin_models(FakeDigitalTwinsClient(legacy))
+
+  site_model = legacy.twins["MunichSite"]["$metadata"]["$model"]
+  assert site_model in registry.interfaces
+  assert registry.validator(site_model).validate([{"op": "add", "path": "/FaultPredicted", "value": True}]) == []
+
+
+def test_mixing_twins_take_the_bearing_component_fault_details(legacy):
+  registry = ModelRegistry.from_repo()
+  mixing = [twin_id for twin_id, twin in legacy.twins.items() if ":production_step_mixing;" in twin["$metadata"]["$model"]]
+  assert mixing and not any(legacy.twins[twin_id]["$metadata"]["$model"] in registry.interfaces for twin_id in mixing)
+
+  migrate_twin_models(FakeDigitalTwinsClient(legacy))
+
+  patch = [
+    {"op": "add", "path": "/InnerRing/faultPredicted", "value": True},
+    {"op": "add", "path": "/InnerRing/faultSeverity", "value": 14},
+    {"op": "add", "path": "/InnerRing/faultProbability", "value": 0.9},
+    {"op": "add", "path": "/BallBearings/faultSeverity", "value": 0},
+  ]
+  for twin_id in mixing:
+    model_id = legacy.twins[twin_id]["$metadata"]["$model"]
+    assert registry.validator(model_id).validate(patch) == []
+  components = {model["@id"] for model in legacy.models.values() if ":inner_ring;" in model["@id"]}
+  assert "dtmi:com:adt:dtsample:inner_ring;2" in components
+
+
+# --- streaming the export ---------------------------------------------------------------------
+
+
+def write_json(tmp_path, document, **kwargs):
+  path = tmp_path / "graph.json"
+  path.write_text(json.dumps(document, **kwargs), encoding="utf-8")
+  return path
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 16])
+def test_elements_and_keys_split_across_chunks(tmp_path, chunk_size):
+  document = {
+    "padding": "x" * 97,
+    "digitalTwins": [{"$dtId": f"twin-{i}", "nested": {"values": [i, [i, "]"]], "text": "a, b ] c"}} for i in range(20)],
+    "relationships": [{"$relationshipId": "r", "$sourceId": "twin-0", "$targetId": "twin-1"}],
+  }
+  path = write_json(tmp_path, document, indent=2)
+
+  assert list(iter_json_array(path, "digitalTwins", chunk_size=chunk_size)) == document["digitalTwins"]
+  assert list(iter_json_array(path, "relationships", chunk_size=chunk_size)) == document["relationships"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5])
+def test_numbers_split_across_chunks_are_not_truncated(tmp_path, chunk_size):
+  path = write_json(tmp_path, {"values": [12345, -7.5e3, 0.125, 1000000]})
+
+  assert list(iter_json_array(path, "values", chunk_size=chunk_size)) == [12345, -7.5e3, 0.125, 1000000]
+
+
+@pytest.mark.parametrize("text", ['{"digitalTwins": []}', '{"digitalTwins" :\n[ \n ] }', '{"relationships": [1]}', "{}"])
+def test_empty_and_missing_arrays_yield_nothing(tmp_path, text):
+  path = tmp_path / "graph.json"
+  path.write_text(text, encoding="utf-8")
+
+  assert list(iter_json_array(path, "digitalTwins", chunk_size=4)) == []
+
+
+def test_the_repo_export_streams_like_it_loads():
+  graph = load_twin_graph()
+
+  for key in ("digitalTwins", "relationships"):
+    assert list(iter_json_array(TWIN_GRAPH_PATH, key, chunk_size=257)) == graph[key]
+
+
+def test_import_file_round_trip():
+  sections = list(twin_graph_sections())
+  out = io.StringIO()
+
+  counts = write_import_file(out, sections, author="tests")
+  lines = out.getvalue().splitlines()
+
+  assert json.loads(lines[0]) == {"Section": "Header"} and json.loads(lines[1])["author"] == "tests"
+  assert list(read_import_file(lines)) == sections
+  assert counts == {section: sum(1 for s, _ in sections if s == section) for section in (MODELS, TWINS, RELATIONSHIPS)}
+  assert all("$etag" not in document for section, document in sections if section != MODELS)
+
+
+def test_listing_models_is_retried_when_a_later_page_is_throttled():
+  class PagedClient(FakeDigitalTwinsClient):
+    throttle = True
+
+    def list_models(self, **kwargs):
+      models = super().list_models(**kwargs)
+      for i, model in enumerate(models):
+        if i == 2 and self.throttle:
+          self.throttle = False
+          raise EmulatorHttpError(429, "Too many requests", {"retry-after-ms": "0"})
+        yield model
+
+  client = PagedClient(DigitalTwinsEmulator.from_repo())
+
+  stats = bulk_upsert(client, [(MODELS, model) for model in load_models()])
+
+  assert stats.models == 0 and not stats.failures and not client.throttle
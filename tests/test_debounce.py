@@ -0,0 +1,153 @@
+import pandas as pd
+import pytest
+
+from digital_twin.debounce import HEARTBEAT, TRANSITION, Debouncer, _group_state_function
+
+START = pd.Timestamp("2022-05-14 12:00:00", tz="UTC")
+
+
+def readings(labels, station="MixingStep-Line1-Munich", every_seconds=60, start=START, **columns):
+  times = [start + pd.Timedelta(seconds=every_seconds * i) for i in range(len(labels))]
+  return pd.DataFrame({"station_id": station, "prediction": labels, "event_time": times, **columns})
+
+
+class GroupState:
+  """The parts of Spark's `GroupState` that `debounce_predictions` uses."""
+
+  def __init__(self, watermark_ms=0):
+    self.value, self.timeout_ms, self.watermark_ms, self.hasTimedOut = None, None, watermark_ms, False
+
+  @property
+  def exists(self):
+    return self.value is not None
+
+  @property
+  def get(self):
+    return self.value
+
+  def update(self, value):
+    self.value = value
+
+  def remove(self):
+    self.value = None
+
+  def setTimeoutTimestamp(self, timestamp_ms):
+    self.timeout_ms = timestamp_ms
+
+  def getCurrentWatermarkMs(self):
+    return self.watermark_ms
+
+
+def ms(timestamp):
+  return int(timestamp.value // 1_000_000)
+
+
+# --- hysteresis ---
+
+def test_a_label_is_confirmed_once_it_makes_up_n_of_the_last_m_readings():
+  labels = ["OK"] * 3 + ["FAULT", "OK", "FAULT", "OK", "FAULT"]
+
+  emitted = Debouncer(n=3, m=5, heartbeat_seconds=1e9).run(readings(labels))
+
+  assert emitted["prediction"].tolist() == ["OK", "FAULT"]
+  assert (emitted["reason"] == TRANSITION).all()
+  assert emitted["event_time"].tolist() == [START + pd.Timedelta(minutes=2), START + pd.Timedelta(minutes=7)]
+
+
+def test_a_single_noisy_reading_does_not_flip_the_confirmed_label():
+  labels = ["OK"] * 5 + ["FAULT"] + ["OK"] * 5
+
+  emitted = Debouncer(n=4, m=5, heartbeat_seconds=1e9).run(readings(labels))
+
+  assert emitted["prediction"].tolist() == ["OK"]
+
+
+def test_hysteresis_needs_n_within_m():
+  with pytest.raises(ValueError):
+    Debouncer(n=6, m=5)
+
+
+def test_state_carries_across_runs():
+  debouncer, states = Debouncer(n=3, m=3, heartbeat_seconds=1e9), {}
+  labels = ["OK"] * 3 + ["FAULT"] * 3
+
+  first = debouncer.run(readings(labels)[:4], states=states)
+  second = debouncer.run(readings(labels)[4:], states=states)
+
+  assert first["prediction"].tolist() == ["OK"]
+  assert second["prediction"].tolist() == ["FAULT"]
+  assert second["event_time"].tolist() == [START + pd.Timedelta(minutes=5)]
+
+
+# --- heartbeats ---
+
+def test_heartbeats_repeat_the_confirmed_label_when_nothing_was_emitted():
+  emitted = Debouncer(n=1, m=1, heartbeat_seconds=300).run(readings(["OK"] * 11))
+
+  assert emitted["reason"].tolist() == [TRANSITION, HEARTBEAT, HEARTBEAT]
+  assert emitted["event_time"].tolist() == [START + pd.Timedelta(minutes=minutes) for minutes in (0, 5, 10)]
+
+
+def test_a_transition_restarts_the_heartbeat_interval():
+  labels = ["OK"] * 4 + ["FAULT"] * 6
+
+  emitted = Debouncer(n=1, m=1, heartbeat_seconds=300).run(readings(labels))
+
+  assert list(zip(emitted["prediction"], emitted["reason"])) == [
+    ("OK", TRANSITION), ("FAULT", TRANSITION), ("FAULT", HEARTBEAT),
+  ]
+  assert emitted["event_time"].iloc[-1] == START + pd.Timedelta(minutes=9)
+
+
+def test_a_heartbeat_caused_by_another_label_carries_nothing():
+  frame = readings(["OK", "OK", "FAULT"], every_seconds=300, fault_probability=[0.1, 0.2, 0.9])
+
+  emitted = Debouncer(n=2, m=3, heartbeat_seconds=300).run(frame, carry_columns=["fault_probability"])
+
+  assert emitted["reason"].tolist() == [TRANSITION, HEARTBEAT]
+  assert emitted["fault_probability"].iloc[0] == 0.2
+  assert pd.isna(emitted["fault_probability"].iloc[1])
+
+
+# --- time zones ---
+
+@pytest.mark.parametrize("start", [START, START.tz_convert("Europe/Berlin"), START.tz_localize(None)])
+def test_emit_times_are_utc_instants_whatever_the_input_zone(start):
+  emitted = Debouncer(n=1, m=1, heartbeat_seconds=60).run(readings(["OK", "OK"], start=start))
+
+  assert str(emitted["event_time"].dt.tz) == "UTC"
+  assert emitted["event_time"].tolist() == [START, START + pd.Timedelta(minutes=1)]
+
+
+# --- streaming state ---
+
+def test_group_state_is_kept_between_batches_and_times_out_after_ttl():
+  debouncer = Debouncer(n=2, m=3, heartbeat_seconds=1e9, ttl_seconds=3600)
+  debounce = _group_state_function(debouncer, "station_id", "prediction", "event_time", [])
+  state = GroupState()
+  batch = readings(["OK", "OK", "FAULT"])
+
+  first = list(debounce(("MixingStep-Line1-Munich",), [batch[:2]], state))
+  second = list(debounce(("MixingStep-Line1-Munich",), [batch[2:]], state))
+
+  assert first[0]["prediction"].tolist() == ["OK"] and not second
+  assert str(first[0]["event_time"].dt.tz) == "UTC"
+  assert first[0]["event_time"].tolist() == [START + pd.Timedelta(minutes=1)]
+  confirmed, recent, last_emitted, last_seen = state.get
+  assert (confirmed, recent) == ("OK", ["OK", "OK", "FAULT"])
+  assert last_seen == ms(START + pd.Timedelta(minutes=2))
+  assert state.timeout_ms == last_seen + 3600 * 1000
+
+  state.hasTimedOut = True
+  assert list(debounce(("MixingStep-Line1-Munich",), [], state)) == []
+  assert not state.exists
+
+
+def test_group_state_timeout_stays_ahead_of_the_watermark():
+  debounce = _group_state_function(Debouncer(ttl_seconds=60), "station_id", "prediction", "event_time", [])
+  watermark_ms = ms(START + pd.Timedelta(hours=2))
+  state = GroupState(watermark_ms=watermark_ms)
+
+  list(debounce(("MixingStep-Line1-Munich",), [readings(["OK"])], state))
+
+  assert state.timeout_ms == watermark_ms + 1
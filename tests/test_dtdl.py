@@ -0,0 +1,184 @@
+import math
+
+import pytest
+
+from digital_twin.dtdl import ModelRegistry, dependency_order, model_dependencies
+from digital_twin.emulator import DigitalTwinsEmulator, FakeDigitalTwinsClient
+from digital_twin.graph import TwinGraphStore
+from digital_twin.publisher import TwinPatchPublisher
+from digital_twin.resources import load_models, load_twin_graph
+
+MIXING = "dtmi:com:microsoft:iot:e2e:digital_factory:production_step_mixing;3"
+STEP = "dtmi:com:microsoft:iot:e2e:digital_factory:production_step;3"
+SITE = "dtmi:com:microsoft:iot:e2e:digital_factory:production_site;2"
+INNER_RING = "dtmi:com:adt:dtsample:inner_ring;2"
+MIXER = "MixingStep-Line1-Munich"
+
+
+@pytest.fixture(scope="module")
+def registry():
+  return ModelRegistry.from_repo()
+
+
+def add(path, value):
+  return {"op": "add", "path": path, "value": value}
+
+
+def interface(model_id, extends=None, components=()):
+  model = {"@id": model_id, "@type": "Interface", "contents": [
+    {"@type": "Component", "name": f"c{i}", "schema": schema} for i, schema in enumerate(components)
+  ]}
+  if extends:
+    model["extends"] = extends
+  return model
+
+
+# --- property specs ---------------------------------------------------------------------------
+
+
+def test_enum_accepts_only_its_values(registry):
+  spec = registry.validator(MIXING).paths["/OperationStatus"]
+
+  assert spec.schema == "Enum" and spec.enum_values == {1, 2}
+  assert spec.accepts(1) and spec.accepts(2)
+  assert not any(spec.accepts(value) for value in (3, "online", True, 1.5, None))
+  assert registry.validate(MIXING, [add("/OperationStatus", 3)]) == ["3 is not a valid [1, 2] for '/OperationStatus'"]
+
+
+def test_primitive_schemas_check_json_types(registry):
+  paths = registry.validator(MIXING).paths
+
+  assert paths["/FinalStep"].accepts(False) and not paths["/FinalStep"].accepts(0)
+  assert paths["/SlurryTemperature"].accepts(60) and paths["/SlurryTemperature"].accepts(60.5)
+  assert not paths["/SlurryTemperature"].accepts(True) and not paths["/SlurryTemperature"].accepts(math.nan)
+  assert paths["/InnerRing/faultSeverity"].accepts(14) and not paths["/InnerRing/faultSeverity"].accepts(14.0)
+  assert paths["/StartTime"].accepts("2022-04-20T12:34:56") and paths["/StartTime"].accepts("2022-04-20T12:34:56.5Z")
+  assert not paths["/StartTime"].accepts("2022-04-20") and not paths["/StartTime"].accepts(0)
+
+
+def test_inherited_properties_are_part_of_the_model(registry):
+  assert "/StepId" in registry.validator(MIXING).paths
+  assert registry.ancestors(MIXING) == [MIXING, STEP]
+  assert registry.is_of_model(MIXING, STEP) and not registry.is_of_model(STEP, MIXING)
+
+
+def test_object_fields_are_paths_of_their_own(registry):
+  paths = registry.validator(SITE).paths
+
+  assert paths["/GeoLocation/Latitude"].accepts(48.1) and not paths["/GeoLocation/Latitude"].accepts("48.1")
+  assert paths["/GeoLocation"].accepts({"Latitude": 48.1, "Longitude": 11.6})
+  assert not paths["/GeoLocation"].accepts({"Latitude": 48.1, "Altitude": 520.0})
+
+
+def test_writable_is_only_enforced_when_required(registry):
+  read_only = [add("/StepId", "MIX")]
+
+  assert registry.validate(MIXING, read_only) == []
+  assert registry.validate(MIXING, read_only, require_writable=True) == ["'/StepId' is not writable"]
+  assert registry.validate(MIXING, [{"op": "test", "path": "/StepId", "value": "MIX"}], require_writable=True) == []
+  assert registry.validate(MIXING, [add("/HealthPrediction", "OK")], require_writable=True) == []
+
+
+# --- components -------------------------------------------------------------------------------
+
+
+def test_component_properties_are_addressed_under_the_component(registry):
+  paths = registry.validator(MIXING).paths
+
+  assert paths["/InnerRing"].component == INNER_RING and paths["/InnerRing"].writable
+  assert not paths["/InnerRing/faultPredicted"].writable and paths["/InnerRing/faultSeverity"].writable
+  assert registry.validate(MIXING, [
+    add("/InnerRing/faultPredicted", True), add("/InnerRing/faultSeverity", 21), add("/BallBearings/faultProbability", 0.0),
+  ]) == []
+
+
+def test_a_whole_component_is_checked_field_by_field(registry):
+  spec = registry.validator(MIXING).paths["/InnerRing"]
+
+  assert spec.accepts({"faultPredicted": True, "faultSeverity": 7, "$metadata": {}})
+  assert not spec.accepts({"faultPredicted": "yes"})
+  assert not spec.accepts({"faultPredicted": True, "noSuchProperty": 1})
+  assert not spec.accepts(True)
+
+
+# --- rejected patches -------------------------------------------------------------------------
+
+
+def test_unknown_paths_and_malformed_operations_are_rejected(registry):
+  errors = registry.validate(MIXING, [
+    add("/NoSuchProperty", 1),
+    add("/InnerRing/noSuchProperty", 1),
+    add("/InnerRing/faultPredicted/extra", True),
+    add("/GeoLocation", {}),  # a site property, not a step's
+    {"op": "move", "from": "/StepId", "path": "/StepName"},
+    {"op": "replace", "path": "/HealthPrediction"},
+  ])
+
+  assert errors == [
+    f"'/NoSuchProperty' is not a property of {MIXING}",
+    f"'/InnerRing/noSuchProperty' is not a property of {MIXING}",
+    f"'/InnerRing/faultPredicted/extra' is not a property of {MIXING}",
+    f"'/GeoLocation' is not a property of {MIXING}",
+    "unsupported operation 'move'",
+    "'replace' of '/HealthPrediction' has no value",
+  ]
+  assert registry.validate(MIXING, [{"op": "remove", "path": "/HealthPrediction"}]) == []
+
+
+def test_unknown_models_and_twins(registry):
+  with pytest.raises(KeyError):
+    registry.validator("dtmi:unknown;1")
+  assert registry.validate_twin({"$dtId": "x", "$metadata": {"$model": "dtmi:unknown;1"}}) == ["unknown model 'dtmi:unknown;1'"]
+  assert registry.validate_many([("nobody", [])], {}.get) == {"nobody": ["unknown twin 'nobody'"]}
+
+
+def test_the_repo_twin_graph_matches_the_repo_models(registry):
+  for twin in load_twin_graph()["digitalTwins"]:
+    assert registry.validate_twin(twin) == [], twin["$dtId"]
+
+
+def test_validator_rejects_patches_before_sending():
+  client = FakeDigitalTwinsClient(DigitalTwinsEmulator.from_repo())
+  graph = load_twin_graph()
+  store = TwinGraphStore.from_graph(graph)
+  validator = ModelRegistry.from_repo().patch_checker(store.model_of)
+  publisher = TwinPatchPublisher(client, baseline={twin["$dtId"]: twin for twin in graph["digitalTwins"]},
+                                 validator=validator,
+                                 state_fn=lambda r: {"/HealthPrediction": r["prediction"], "/NoSuchProperty": 1})
+
+  stats = publisher.publish([{"station_id": MIXER, "prediction": "FAULT_PREDICTED", "fileName": "0"}])
+
+  assert stats.patches_rejected == 1 and stats.patches_sent == 0
+  assert list(publisher.rejected) == [MIXER]
+  assert client.emulator.request_count == 0
+
+
+# --- dependency order -------------------------------------------------------------------------
+
+
+def test_repo_models_are_created_after_their_bases_and_components():
+  models = load_models()
+  level_of = {model["@id"]: i for i, level in enumerate(dependency_order(models)) for model in level}
+
+  assert set(level_of) == {model["@id"] for model in models}
+  for model in models:
+    assert all(level_of[dependency] < level_of[model["@id"]] for dependency in model_dependencies(model))
+  assert level_of[STEP] < level_of[MIXING] and level_of[INNER_RING] < level_of[MIXING]
+
+
+def test_dependencies_outside_the_set_are_assumed_to_exist():
+  levels = dependency_order([interface("dtmi:a;1", extends="dtmi:existing;1", components=["dtmi:b;1"]), interface("dtmi:b;1")])
+
+  assert [[model["@id"] for model in level] for level in levels] == [["dtmi:b;1"], ["dtmi:a;1"]]
+
+
+def test_cyclic_dependencies_are_rejected():
+  models = [
+    interface("dtmi:a;1", extends="dtmi:b;1"),
+    interface("dtmi:b;1", components=["dtmi:c;1"]),
+    interface("dtmi:c;1", extends="dtmi:a;1"),
+    interface("dtmi:d;1"),
+  ]
+
+  with pytest.raises(ValueError, match=r"dtmi:a;1', 'dtmi:b;1', 'dtmi:c;1'"):
+    dependency_order(models)
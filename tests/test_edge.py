@@ -0,0 +1,129 @@
+import os
+
+import numpy as np
+import pytest
+
+from digital_twin.edge import EdgePipeline, LandingWatcher
+from digital_twin.emulator import DigitalTwinsEmulator, FakeDigitalTwinsClient
+from digital_twin.publisher import TwinPatchPublisher, component_health_states
+from digital_twin.schema import FAULT_CLASS_INDEX, FAULT_CLASSES, FEATURE_COLUMNS
+
+MIXER = "MixingStep-Line1-Munich"
+OTHER_MIXER = "MixingStep-Line1-Shanghai"
+MTIME = 1_652_529_600.0  # 2022-05-14 12:00:00 UTC
+
+
+class ClassFromFeature:
+  """Stand-in classifier: the `max` feature of a reading is its fault class code."""
+  classes_ = np.array(FAULT_CLASSES)
+
+  def predict_proba(self, features):
+    probabilities = np.full((len(features), len(FAULT_CLASSES)), 0.1 / (len(FAULT_CLASSES) - 1))
+    probabilities[np.arange(len(features)), features[:, 0].astype(int)] = 0.9
+    return probabilities
+
+
+def touch(path, mtime):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  if not os.path.exists(path):
+    open(path, "w").close()
+  os.utime(path, (mtime, mtime))
+  return str(path)
+
+
+def land(directory, name, readings, mtime):
+  """A landing CSV of `(station_id, event_time, fault_label)` readings."""
+  path = os.path.join(directory, name)
+  lines = [",".join([*FEATURE_COLUMNS, "station_id", "device_id", "event_time"])]
+  for station_id, event_time, label in readings:
+    features = [FAULT_CLASS_INDEX[label]] + [0.5] * (len(FEATURE_COLUMNS) - 1)
+    lines.append(",".join([*map(str, features), station_id, f"{station_id}-device", event_time]))
+  with open(path, "w") as f:
+    f.write("\n".join(lines) + "\n")
+  return touch(path, mtime)
+
+
+# --- landing watcher --------------------------------------------------------------------------
+
+
+def test_poll_returns_each_new_file_once_oldest_first(tmp_path):
+  watcher = LandingWatcher(str(tmp_path), "csv")
+  second = touch(tmp_path / "b.csv", MTIME + 2)
+  first = touch(tmp_path / "nested" / "a.csv", MTIME + 1)
+  touch(tmp_path / "c.json", MTIME + 3)
+  touch(tmp_path / ".d.csv", MTIME + 3)  # a sink's temporary file
+
+  assert watcher.poll() == [first, second]
+  assert watcher.poll() == []
+  third = touch(tmp_path / "e.csv", MTIME + 3)
+  assert watcher.poll() == [third]
+
+
+def test_poll_takes_at_most_max_files(tmp_path):
+  watcher = LandingWatcher(str(tmp_path), "csv")
+  paths = [touch(tmp_path / f"{i}.csv", MTIME + i) for i in range(5)]
+
+  assert watcher.poll(max_files=2) == paths[:2]
+  assert watcher.poll(max_files=2) == paths[2:4]
+  assert watcher.poll() == paths[4:]
+
+
+def test_files_older_than_the_grace_window_are_skipped(tmp_path):
+  watcher = LandingWatcher(str(tmp_path), "csv", grace_seconds=60)
+  touch(tmp_path / "old.csv", MTIME)
+  watcher.poll()
+  touch(tmp_path / "new.csv", MTIME + 300)
+  assert len(watcher.poll()) == 1
+
+  late = touch(tmp_path / "late.csv", MTIME + 250)
+  touch(tmp_path / "too-late.csv", MTIME + 200)
+
+  assert watcher.poll() == [late]
+  assert set(watcher.seen) == {str(tmp_path / "new.csv"), late}  # bookkeeping stays within the window
+
+
+def test_a_missing_directory_has_no_files(tmp_path):
+  assert LandingWatcher(str(tmp_path / "not-yet"), "csv").poll() == []
+
+
+# --- pipeline ---------------------------------------------------------------------------------
+
+
+@pytest.fixture
+def client():
+  return FakeDigitalTwinsClient(DigitalTwinsEmulator.from_repo())
+
+
+@pytest.fixture
+def pipeline(tmp_path, client):
+  publisher = TwinPatchPublisher(client, states_fn=component_health_states)
+  return EdgePipeline(str(tmp_path), publisher, ClassFromFeature(), workers=0)
+
+
+def test_run_batch_publishes_the_latest_reading_per_station(tmp_path, client, pipeline):
+  # the file that landed last holds the older readings: the event time decides, not the landing order
+  land(tmp_path, "a.csv", [(MIXER, "2022-05-14T12:00:10Z", "Normal_1"), (MIXER, "2022-05-14T12:00:20Z", "IR_014_1")], MTIME)
+  land(tmp_path, "b.csv", [(MIXER, "2022-05-14T12:00:05Z", "Ball_007_1"), (OTHER_MIXER, "2022-05-14T12:00:05Z", "OR_021_6_1")], MTIME + 1)
+
+  stats = pipeline.run_batch()
+
+  assert stats.stations == 2 and stats.rows_seen == 4
+  assert (pipeline.stats.batches, pipeline.stats.files, pipeline.stats.records) == (1, 2, 4)
+  mixer, other = client.emulator.twins[MIXER], client.emulator.twins[OTHER_MIXER]
+  assert mixer["HealthPrediction"] == "FAULT_PREDICTED"
+  assert mixer["InnerRing"]["faultSeverity"] == 14 and mixer["InnerRing"]["faultProbability"] == 0.9
+  assert mixer["BallBearings"]["faultPredicted"] is False
+  assert other["OuterRing"]["faultPredicted"] is True and other["OuterRing"]["faultSeverity"] == 21
+
+
+def test_run_batch_only_processes_new_files(tmp_path, client, pipeline):
+  land(tmp_path, "a.csv", [(MIXER, "2022-05-14T12:00:00Z", "IR_007_1")], MTIME)
+  pipeline.run_batch()
+
+  assert pipeline.run_batch() is None
+  land(tmp_path, "b.csv", [(MIXER, "2022-05-14T12:01:00Z", "Normal_1")], MTIME + 60)
+  stats = pipeline.run_batch()
+
+  assert stats.rows_seen == 1 and pipeline.stats.files == 2
+  assert client.emulator.twins[MIXER]["HealthPrediction"] == "OK"
+  assert client.emulator.twins[MIXER]["InnerRing"]["faultPredicted"] is False
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from digital_twin.features import RunningMoments, StreamingFeatureExtractor, window_features
+from digital_twin.schema import FEATURE_COLUMNS
+
+SKEWNESS, KURTOSIS = FEATURE_COLUMNS.index("skewness"), FEATURE_COLUMNS.index("kurtosis")
+
+
+def exact_features(x, window, step):
+  features = []
+  for start in range(0, len(x) - window + 1, step):
+    w = x[start:start + window]
+    d = w - w.mean()
+    m2, m3, m4 = (d ** 2).mean(), (d ** 3).mean(), (d ** 4).mean()
+    rms = np.sqrt((w * w).mean())
+    features.append([w.max(), w.min(), w.mean(), w.std(ddof=1), rms, m3 / m2 ** 1.5, m4 / m2 ** 2 - 3, w.max() / rms, rms / w.mean()])
+  return np.array(features)
+
+
+@pytest.mark.parametrize("step", [None, 512])
+def test_matches_per_window_definitions(step):
+  x = np.random.default_rng(0).gamma(2.0, 1.0, 20_000) + 1.0
+
+  features = window_features(x, 2048, step)
+
+  np.testing.assert_allclose(features, exact_features(x, 2048, step or 2048), rtol=2e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("level", [10.0, 50.0, 1e4])
+def test_moments_are_exact_after_a_level_shift(level):
+  rng = np.random.default_rng(1)
+  x = rng.normal(0.0, 1.0, 1_000_000)
+  x[900_000:] += level  # a DC step far from the signal's overall mean
+
+  features = window_features(x)
+
+  expected = exact_features(x, 2048, 2048)
+  np.testing.assert_allclose(features[:, SKEWNESS], expected[:, 5], atol=1e-5)
+  np.testing.assert_allclose(features[:, KURTOSIS], expected[:, 6], atol=1e-5)
+
+
+def test_two_dimensional_input_matches_each_signal():
+  x = np.random.default_rng(2).normal(3.0, 1.0, (3, 5_000))
+
+  features = window_features(x, 1024, 256)
+
+  assert features.shape == (3, 16, len(FEATURE_COLUMNS))
+  for row, signal in zip(features, x):
+    np.testing.assert_array_equal(row, window_features(signal, 1024, 256))
+
+
+def test_short_signals_have_no_windows():
+  assert window_features(np.ones(10), 2048).shape == (0, len(FEATURE_COLUMNS))
+
+
+def test_streaming_extractor_matches_the_whole_signal():
+  x = np.random.default_rng(3).normal(1.0, 0.5, 10_000)
+  extractor = StreamingFeatureExtractor(window=1024, step=512)
+
+  starts, features = zip(*(extractor.update("s", block) for block in np.array_split(x, 7)))
+
+  np.testing.assert_array_equal(np.concatenate(starts), np.arange(0, 10_000 - 1024 + 1, 512))
+  np.testing.assert_allclose(np.concatenate(features), window_features(x, 1024, 512), rtol=1e-5)
+
+
+def test_running_moments_merge_blocks():
+  x = np.random.default_rng(4).normal(100.0, 2.0, 10_000)
+  moments = RunningMoments()
+  for block in np.array_split(x, 9):
+    moments.update(block)
+
+  np.testing.assert_allclose(moments.features(), exact_features(x, len(x), len(x))[0], rtol=1e-5)
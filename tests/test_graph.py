@@ -0,0 +1,150 @@
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from digital_twin.graph import CONTAINMENT, LEADS_TO, TwinGraphStore, step_type
+from digital_twin.resources import load_twin_graph
+from digital_twin.topology import PlantTopology
+
+RELATIONSHIP_FILTERS = [None, LEADS_TO, CONTAINMENT, ("rel_runs_lines",), ("no_such_relationship",)]
+
+
+class NaiveGraph:
+  """Adjacency lists straight from the export, traversed breadth first in plain Python."""
+
+  def __init__(self, graph):
+    self.twins = {twin["$dtId"]: twin for twin in graph["digitalTwins"]}
+    self.edges = {"out": defaultdict(list), "in": defaultdict(list)}
+    for relationship in graph["relationships"]:
+      name = relationship["$relationshipName"]
+      self.edges["out"][relationship["$sourceId"]].append((relationship["$targetId"], name))
+      self.edges["in"][relationship["$targetId"]].append((relationship["$sourceId"], name))
+
+  def neighbors(self, twin_id, relationships, direction):
+    return [other for other, name in self.edges[direction][twin_id] if relationships is None or name in relationships]
+
+  def levels(self, start, relationships, direction):
+    """Newly reached twins per breadth-first level."""
+    visited, frontier, levels = set(start), set(start), []
+    while frontier:
+      reached = {other for twin_id in frontier for other in self.neighbors(twin_id, relationships, direction)} - visited
+      visited |= reached
+      if reached:
+        levels.append(reached)
+      frontier = reached
+    return levels
+
+  def reachable(self, start, relationships, direction):
+    return set().union(*self.levels(start, relationships, direction))
+
+  def owner(self, twin_id, relationship):
+    owners = self.neighbors(twin_id, (relationship,), "in")
+    return owners[0] if owners else None
+
+
+def as_tuple(relationships):
+  return (relationships,) if isinstance(relationships, str) else relationships
+
+
+def same_levels(found, levels):
+  """`found` lists the twins of each level before those of the next one."""
+  assert len(found) == sum(len(level) for level in levels)
+  start = 0
+  for level in levels:
+    assert set(found[start:start + len(level)]) == level
+    start += len(level)
+
+
+@pytest.fixture(params=["repo", "topology"])
+def graph(request):
+  if request.param == "repo":
+    return load_twin_graph()
+  return PlantTopology(sites=3, lines_per_site=2, stations_per_step=2).twin_graph()
+
+
+@pytest.fixture
+def naive(graph):
+  return NaiveGraph(graph)
+
+
+def check_against(store, naive):
+  assert store.ids == list(naive.twins)
+  for twin_id in naive.twins:
+    for relationships in RELATIONSHIP_FILTERS:
+      wanted = as_tuple(relationships)
+      for direction in ("out", "in"):
+        assert sorted(store.neighbors(twin_id, relationships, direction)) == sorted(naive.neighbors(twin_id, wanted, direction))
+      same_levels(store.descendants(twin_id, relationships), naive.levels([twin_id], wanted, "out"))
+      same_levels(store.ancestors(twin_id, relationships), naive.levels([twin_id], wanted, "in"))
+    assert set(store.downstream(twin_id)) == naive.reachable([twin_id], (LEADS_TO,), "out")
+    assert set(store.upstream(twin_id)) == naive.reachable([twin_id], (LEADS_TO,), "in")
+
+
+# --- traversal --------------------------------------------------------------------------------
+
+
+def test_csr_traversals_match_a_naive_adjacency_walk(graph, naive):
+  check_against(TwinGraphStore.from_graph(graph), naive)
+
+
+def test_traversal_from_several_twins_is_the_union(graph, naive):
+  store = TwinGraphStore.from_graph(graph)
+  steps = [twin_id for twin_id, twin in naive.twins.items() if step_type(twin["$metadata"]["$model"]) in ("mixing", "coating")]
+
+  assert set(store.downstream(steps)) == naive.reachable(steps, (LEADS_TO,), "out")
+  assert set(store.upstream(steps)) == naive.reachable(steps, (LEADS_TO,), "in")
+  indexes = np.array([store.index[twin_id] for twin_id in steps])
+  assert {store.ids[i] for i in store.reachable(indexes)} == naive.reachable(steps, (LEADS_TO,), "out")
+
+
+def test_membership_follows_containment(graph, naive):
+  store = TwinGraphStore.from_graph(graph)
+
+  for twin_id, twin in naive.twins.items():
+    line = twin_id if "production_line;" in twin["$metadata"]["$model"] else naive.owner(twin_id, "rel_runs_steps")
+    site = twin_id if "production_site;" in twin["$metadata"]["$model"] else naive.owner(line, "rel_runs_lines") if line else None
+    assert (store.site_of(twin_id), store.line_of(twin_id)) == (site, line), twin_id
+
+
+def test_select_combines_the_indexes(graph, naive):
+  store = TwinGraphStore.from_graph(graph)
+  site = next(twin_id for twin_id in naive.twins if store.site_of(twin_id) == twin_id)
+
+  expected = [
+    twin_id for twin_id, twin in naive.twins.items()
+    if step_type(twin["$metadata"]["$model"]) == "mixing" and store.site_of(twin_id) == site
+  ]
+  assert expected and store.select(step="mixing", site=site) == expected
+  assert store.select(step="no_such_step") == [] and store.select(site="NoSuchSite") == []
+  model = store.model_of(expected[0])
+  assert store.select(model=model) == [t for t, twin in naive.twins.items() if twin["$metadata"]["$model"] == model]
+
+
+# --- serialization ----------------------------------------------------------------------------
+
+
+def test_bytes_round_trip_keeps_everything(graph, naive):
+  store = TwinGraphStore.from_graph(graph)
+
+  copy = TwinGraphStore.from_bytes(store.to_bytes())
+
+  check_against(copy, naive)
+  for name in ("twin_model", "twin_site", "twin_line", "out_offsets", "out_targets", "out_kinds",
+               "in_offsets", "in_sources", "in_kinds"):
+    assert np.array_equal(getattr(copy, name), getattr(store, name)) and getattr(copy, name).dtype == getattr(store, name).dtype
+  assert (copy.models, copy.relationship_names) == (store.models, store.relationship_names)
+  assert all(copy.document(twin_id) == store.document(twin_id) for twin_id in store.ids)
+  assert list(copy.relationships()) == list(store.relationships())
+  assert {r["$relationshipId"] for r in copy.relationships()} == {r["$relationshipId"] for r in graph["relationships"]}
+
+
+def test_bytes_without_documents_still_traverse(graph, naive):
+  store = TwinGraphStore.from_graph(graph)
+
+  copy = TwinGraphStore.from_bytes(store.to_bytes(include_documents=False))
+
+  check_against(copy, naive)
+  with pytest.raises(ValueError):
+    copy.document(store.ids[0])
+  assert len(store.to_bytes(include_documents=False)) < len(store.to_bytes())
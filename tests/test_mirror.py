@@ -0,0 +1,81 @@
+import pytest
+
+from digital_twin.graph import TwinGraphStore
+from digital_twin.mirror import ParquetTwinMirror, merge_patches
+from digital_twin.resources import load_twin_graph
+
+MIXER = "MixingStep-Line1-Munich"
+
+
+@pytest.fixture
+def mirror(tmp_path):
+  return ParquetTwinMirror(str(tmp_path), TwinGraphStore.from_graph(load_twin_graph()))
+
+
+def test_merge_patches_keeps_operation_order_per_twin():
+  first = {"a": [{"op": "add", "path": "/x", "value": 1}]}
+  second = {"a": [{"op": "remove", "path": "/x"}], "b": [{"op": "add", "path": "/y", "value": 2}]}
+
+  assert merge_patches(first, second) == {
+    "a": [{"op": "add", "path": "/x", "value": 1}, {"op": "remove", "path": "/x"}],
+    "b": [{"op": "add", "path": "/y", "value": 2}],
+  }
+
+
+def test_apply_merges_properties_and_removals(mirror):
+  mirror.apply({MIXER: [{"op": "add", "path": "/HealthPrediction", "value": "OK"},
+                        {"op": "add", "path": "/InnerRing/faultSeverity", "value": 7}]}, batch_id=1)
+  mirror.apply({MIXER: [{"op": "replace", "path": "/HealthPrediction", "value": "FAULT_PREDICTED"},
+                        {"op": "remove", "path": "/InnerRing/faultSeverity"}],
+                "MunichSite": [{"op": "add", "path": "/FaultPredicted", "value": True}]}, batch_id=2)
+
+  assert mirror.published_state() == {
+    MIXER: {"/HealthPrediction": "FAULT_PREDICTED"},
+    "MunichSite": {"/FaultPredicted": True},
+  }
+  state = mirror.state().set_index("twin_id")
+  assert state.loc[MIXER, "version"] == 2 and state.loc[MIXER, "site_id"] == "MunichSite"
+  assert state.loc[MIXER, "line_id"] == "ProductionLine1-Munich"
+  assert list(mirror.history()["op"]) == ["add", "add", "replace", "remove", "add"]
+
+
+def test_replayed_batch_changes_nothing(mirror):
+  batch = {MIXER: [{"op": "add", "path": "/HealthPrediction", "value": "FAULT_PREDICTED"}]}
+  mirror.apply(batch, batch_id=1)
+  mirror.apply({MIXER: [{"op": "replace", "path": "/HealthPrediction", "value": "OK"}]}, batch_id=2)
+
+  mirror.apply(batch, batch_id=1)
+
+  assert mirror.published_state() == {MIXER: {"/HealthPrediction": "OK"}}
+  assert mirror.state()["version"].tolist() == [2]
+  assert mirror.history()["batch_id"].tolist() == [1, 2]
+
+
+def test_twins_outside_the_graph_are_mirrored_without_site(mirror):
+  mirror.apply({"Unknown": [{"op": "add", "path": "/x", "value": 1}]}, batch_id=1)
+
+  (row,) = mirror.state().to_dict("records")
+  assert row["twin_id"] == "Unknown" and row["site_id"] is None and row["properties"] == {"/x": "1"}
+
+
+def test_a_new_run_applies_batches_whose_ids_start_again(mirror):
+  mirror.apply({MIXER: [{"op": "add", "path": "/HealthPrediction", "value": "OK"}]}, batch_id=0, run_id="first")
+  mirror.apply({MIXER: [{"op": "replace", "path": "/HealthPrediction", "value": "FAULT_PREDICTED"}]}, batch_id=7, run_id="first")
+
+  # restarted without its checkpoint: the stream's batch ids start again at 0
+  mirror.apply({MIXER: [{"op": "replace", "path": "/HealthPrediction", "value": "OK"}]}, batch_id=0, run_id="second")
+  mirror.apply({MIXER: [{"op": "replace", "path": "/HealthPrediction", "value": "OK"}]}, batch_id=0, run_id="second")
+
+  assert mirror.published_state() == {MIXER: {"/HealthPrediction": "OK"}}
+  (row,) = mirror.state().to_dict("records")
+  assert (row["version"], row["run_id"], row["batch_id"]) == (3, "second", 0)
+  history = mirror.history()
+  assert list(zip(history["run_id"], history["batch_id"])) == [("first", 0), ("first", 7), ("second", 0)]
+
+
+def test_runs_without_an_id_share_one_history(mirror):
+  mirror.apply({MIXER: [{"op": "add", "path": "/HealthPrediction", "value": "OK"}]}, batch_id=0)
+  mirror.apply({MIXER: [{"op": "replace", "path": "/HealthPrediction", "value": "FAULT_PREDICTED"}]}, batch_id=0, run_id="a")
+
+  assert mirror.history()["run_id"].tolist()[1] == "a"
+  assert mirror.published_state() == {MIXER: {"/HealthPrediction": "FAULT_PREDICTED"}}
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from digital_twin.emulator import DigitalTwinsEmulator, EmulatorHttpError, FakeDigitalTwinsClient
+from digital_twin.graph import TwinGraphStore
+from digital_twin.propagation import FAULT_PREDICTED, FAULTY_LINE_COUNT, FAULTY_STEP_COUNT, UPSTREAM_FAULT, FaultPropagator
+from digital_twin.publisher import TwinPatchPublisher
+from digital_twin.resources import load_twin_graph
+from digital_twin.topology import PlantTopology
+
+
+@pytest.fixture
+def store():
+  return TwinGraphStore.from_graph(load_twin_graph())
+
+
+def test_fault_rolls_up_to_line_and_site_and_flags_downstream_steps(store):
+  propagator = FaultPropagator(store)
+
+  changed = propagator.update({"MixingStep-Line1-Munich": True})
+
+  assert changed == {
+    "ProductionLine1-Munich": {FAULT_PREDICTED: True, FAULTY_STEP_COUNT: 1},
+    "MunichSite": {FAULT_PREDICTED: True, FAULTY_STEP_COUNT: 1, FAULTY_LINE_COUNT: 1},
+    "CoatingStep-Line1-Munich": {UPSTREAM_FAULT: True},
+    "CalenderingStep-Line1-Munich": {UPSTREAM_FAULT: True},
+  }
+
+
+def test_only_changed_twins_are_emitted(store):
+  propagator = FaultPropagator(store, faults={"MixingStep-Line1-Munich": True})
+
+  assert propagator.update({"MixingStep-Line1-Munich": True}) == {}
+  # a second faulty step on the same line changes the counts but no downstream flag
+  assert propagator.update({"CoatingStep-Line1-Munich": True}) == {
+    "ProductionLine1-Munich": {FAULT_PREDICTED: True, FAULTY_STEP_COUNT: 2},
+    "MunichSite": {FAULT_PREDICTED: True, FAULTY_STEP_COUNT: 2, FAULTY_LINE_COUNT: 1},
+  }
+  # flipping a step back and forth restores every derived state
+  assert propagator.update({"CoatingStep-Line1-Munich": False}) != {}
+  before = propagator.states()
+  propagator.update({"CoatingStep-Line1-Munich": True})
+  propagator.update({"CoatingStep-Line1-Munich": False})
+  assert propagator.states() == before
+
+
+def test_site_counts_faulty_lines_once(store):
+  propagator = FaultPropagator(store)
+
+  propagator.update({"MixingStep-Line1-Shanghai": True, "CalenderingStep-Line1-Shanghai": True})
+  changed = propagator.update({"CoatingStep-Line2-Shanghai": True})
+
+  assert changed["ShanghaiSite"] == {FAULT_PREDICTED: True, FAULTY_STEP_COUNT: 3, FAULTY_LINE_COUNT: 2}
+  assert propagator.update({"MixingStep-Line1-Shanghai": False, "CalenderingStep-Line1-Shanghai": False})["ShanghaiSite"] == {
+    FAULT_PREDICTED: True, FAULTY_STEP_COUNT: 1, FAULTY_LINE_COUNT: 1,
+  }
+
+
+def test_incremental_updates_match_a_full_recompute():
+  topology = PlantTopology(sites=3, lines_per_site=3, stations_per_step=2)
+  store = TwinGraphStore.from_iterables(topology.twins(), topology.relationships(), keep_documents=False)
+  steps = list(topology.stations())
+  rng = np.random.default_rng(0)
+  propagator = FaultPropagator(store)
+  states = propagator.states()
+
+  for _ in range(50):
+    batch = {twin_id: bool(rng.random() < 0.3) for twin_id in rng.choice(steps, 10)}
+    changed = propagator.update(batch)
+
+    expected = FaultPropagator(store, faults={twin_id: bool(propagator.faulty[store.index[twin_id]]) for twin_id in steps})
+    for counter in ("faulty_steps", "faulty_lines", "upstream_faults"):
+      np.testing.assert_array_equal(getattr(propagator, counter), getattr(expected, counter))
+    current = expected.states()
+    assert changed == {twin_id: state for twin_id, state in current.items() if state != states[twin_id]}
+    states = current
+
+
+def test_publish_sends_pending_states_and_keeps_them_on_failure(store):
+  class Unavailable(FakeDigitalTwinsClient):
+    down = True
+
+    def update_digital_twin(self, digital_twin_id, json_patch, **kwargs):
+      if self.down:
+        raise EmulatorHttpError(503, "Service unavailable")
+      super().update_digital_twin(digital_twin_id, json_patch, **kwargs)
+
+  client = Unavailable(DigitalTwinsEmulator.from_repo())
+  publisher = TwinPatchPublisher(client, state_fn=dict)
+  propagator = FaultPropagator(store)
+  propagator.update({"MixingStep-Line1-Dallas": True})
+
+  with pytest.raises(RuntimeError):
+    propagator.publish(publisher)
+  assert set(propagator.pending) == {"ProductionLine1-Dallas", "DallasSite", "CoatingStep-Line1-Dallas", "CalenderingStep-Line1-Dallas"}
+
+  propagator.update({"MixingStep-Line2-Dallas": True})
+  client.down = False
+  stats = propagator.publish(publisher)
+
+  assert propagator.pending == {}
+  assert stats.patches_sent == 7  # line 1 (kept), plus line 2 and its two downstream steps
+  twins = client.emulator.twins
+  assert twins["DallasSite"]["FaultyLineCount"] == 2 and twins["DallasSite"]["FaultyStepCount"] == 2
+  assert twins["CalenderingStep-Line2-Dallas"]["UpstreamFaultPredicted"] is True
@@ -0,0 +1,155 @@
+import math
+
+import pytest
+
+from digital_twin.emulator import DigitalTwinsEmulator, EmulatorHttpError, FakeDigitalTwinsClient
+from digital_twin.publisher import (_MISSING, TwinPatchPublisher, component_fault_states, component_health_states,
+                                    json_patch, latest_by_key, resolve_pointer)
+from digital_twin.resources import load_twin_graph
+
+MIXER = "MixingStep-Line1-Munich"
+OTHER_MIXER = "MixingStep-Line1-Shanghai"
+
+
+@pytest.fixture
+def graph():
+  return load_twin_graph()
+
+
+@pytest.fixture
+def baseline(graph):
+  return {twin["$dtId"]: twin for twin in graph["digitalTwins"]}
+
+
+@pytest.fixture
+def client():
+  return FakeDigitalTwinsClient(DigitalTwinsEmulator.from_repo())
+
+
+def record(station_id, prediction, file_name="0"):
+  return {"station_id": station_id, "prediction": prediction, "fileName": file_name}
+
+
+# --- patch diffing ----------------------------------------------------------------------------
+
+
+def test_json_patch_sends_only_changes():
+  previous = {"/a": 1, "/b": "x", "/c": True}
+  current = {"/a": 1, "/b": "y", "/c": 1, "/d": 0.5}
+
+  assert json_patch(previous, current) == [
+    {"op": "replace", "path": "/b", "value": "y"},
+    {"op": "replace", "path": "/c", "value": 1},  # equal in Python, but a different JSON type
+    {"op": "add", "path": "/d", "value": 0.5},
+  ]
+  assert json_patch(current, current) == []
+
+
+def test_resolve_pointer_follows_components_and_escapes():
+  document = {"BallBearings": {"faultPredicted": True}, "a/b": {"m~n": 1}}
+
+  assert resolve_pointer(document, "/BallBearings/faultPredicted") is True
+  assert resolve_pointer(document, "/a~1b/m~0n") == 1
+  assert resolve_pointer(document, "/Missing") is _MISSING
+  assert resolve_pointer(document, "/BallBearings/faultPredicted/deeper") is _MISSING
+
+
+def test_latest_by_key_keeps_last_record():
+  records = [record("a", "NORMAL", "1"), record("b", "FAULT", "2"), record("a", "FAULT", "3")]
+
+  assert latest_by_key(records) == {"a": records[2], "b": records[1]}
+
+
+def test_component_fault_states_flag_only_the_named_component():
+  states = component_fault_states([0, 4, 9], [0.9, float("nan"), 0.51234])
+
+  assert states[0]["/HealthPrediction"] == "OK"
+  assert not any(states[0][f"/{c}/faultPredicted"] for c in ("InnerRing", "OuterRing", "BallBearings"))
+  assert states[0]["/InnerRing/faultProbability"] == 0.0
+  assert states[1]["/HealthPrediction"] == "FAULT_PREDICTED"
+  assert states[1]["/InnerRing/faultPredicted"] and states[1]["/InnerRing/faultSeverity"] == 7
+  assert "/InnerRing/faultProbability" not in states[1]  # unknown probabilities are left out
+  assert states[2]["/OuterRing/faultPredicted"] and states[2]["/OuterRing/faultSeverity"] == 21
+  assert states[2]["/OuterRing/faultProbability"] == 0.5123 and states[2]["/BallBearings/faultSeverity"] == 0
+
+
+def test_component_health_states_accepts_labels_and_missing_probabilities():
+  states = component_health_states({
+    "a": {"fault_class": "Ball_014_1", "fault_probability": None},
+    "b": {"fault_class": 0, "fault_probability": 0.8},
+  })
+
+  assert states["a"]["/BallBearings/faultPredicted"] and states["a"]["/BallBearings/faultSeverity"] == 14
+  assert "/BallBearings/faultProbability" not in states["a"]
+  assert not math.isnan(states["b"]["/InnerRing/faultProbability"])
+
+
+# --- TwinPatchPublisher -----------------------------------------------------------------------
+
+
+def test_publish_skips_states_already_in_the_baseline(client, baseline):
+  publisher = TwinPatchPublisher(client, baseline=baseline)
+
+  stats = publisher.publish([record(MIXER, "NORMAL"), record(OTHER_MIXER, "FAULT")])
+
+  assert (stats.rows_seen, stats.stations, stats.noops_skipped, stats.patches_sent) == (2, 2, 1, 1)
+  assert publisher.last_sent == {OTHER_MIXER: [
+    {"op": "replace", "path": "/HealthPrediction", "value": "FAULT_PREDICTED"},
+    {"op": "replace", "path": "/BallBearings/faultPredicted", "value": True},
+  ]}
+  twin = client.emulator.twins[OTHER_MIXER]
+  assert twin["HealthPrediction"] == "FAULT_PREDICTED" and twin["BallBearings"]["faultPredicted"] is True
+
+
+def test_publish_collapses_a_batch_to_the_latest_record(client, baseline):
+  publisher = TwinPatchPublisher(client, baseline=baseline)
+
+  publisher.publish([record(MIXER, "FAULT", "1"), record(MIXER, "NORMAL", "2")])
+
+  assert client.emulator.request_count == 0
+
+
+def test_replayed_batch_sends_nothing(client, baseline):
+  publisher = TwinPatchPublisher(client, baseline=baseline)
+  batch = [record(MIXER, "FAULT")]
+
+  publisher.publish(batch)
+  requests = client.emulator.request_count
+  stats = publisher.publish(batch)
+
+  assert stats.patches_sent == 0 and stats.noops_skipped == 1
+  assert client.emulator.request_count == requests
+  assert baseline[MIXER]["HealthPrediction"] == "OK"  # the baseline is never mutated
+
+
+def test_restart_seeded_with_published_state_sends_nothing(client, baseline):
+  first = TwinPatchPublisher(client, baseline=baseline)
+  first.publish([record(MIXER, "FAULT")])
+  requests = client.emulator.request_count
+
+  restarted = TwinPatchPublisher(client, baseline=baseline, published=first.published)
+  restarted.publish([record(MIXER, "FAULT")])
+
+  assert client.emulator.request_count == requests
+
+
+def test_failed_patch_is_sent_again_next_batch(baseline):
+  class FailOnce(FakeDigitalTwinsClient):
+    failures = 1
+
+    def update_digital_twin(self, digital_twin_id, json_patch, **kwargs):
+      if self.failures:
+        self.failures -= 1
+        raise EmulatorHttpError(503, "Service unavailable")
+      super().update_digital_twin(digital_twin_id, json_patch, **kwargs)
+
+  client = FailOnce()
+  publisher = TwinPatchPublisher(client, baseline=baseline)
+
+  with pytest.raises(RuntimeError):
+    publisher.publish([record(MIXER, "FAULT")])
+  assert publisher.last_sent == {} and publisher.totals.patches_sent == 0
+
+  stats = publisher.publish([record(MIXER, "FAULT")])
+  assert stats.patches_sent == 1
+  assert client.emulator.twins[MIXER]["HealthPrediction"] == "FAULT_PREDICTED"
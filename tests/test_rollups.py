@@ -0,0 +1,178 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from digital_twin.rollups import (KEY_COLUMNS, QUANTILES, ParquetRollups, choose_resolution, combine_rollups,
+                                  merge_rollups, rank_error_bound, rollup_levels, rollup_samples, summarize)
+
+
+def samples(n, stations=("s1", "s2"), signals=("vibration",), start=0.0, duration=7200.0, seed=0):
+  rng = np.random.default_rng(seed)
+  return pd.DataFrame({
+    "station_id": rng.choice(list(stations), n),
+    "signal": rng.choice(list(signals), n),
+    "time": start + rng.uniform(0, duration, n),
+    "value": rng.lognormal(0.0, 0.75, n),
+  })
+
+
+def exact(frame, resolution_seconds):
+  frame = frame.assign(bucket_start=(frame["time"] // resolution_seconds * resolution_seconds).astype(np.int64))
+  return frame.groupby(["station_id", "signal", "bucket_start"])["value"]
+
+
+def by_key(rollups):
+  return rollups.set_index(KEY_COLUMNS).sort_index()
+
+
+def upsert(stored, merged):
+  """`stored` with the buckets `combine_rollups` returned replaced, as the stores write them back."""
+  if not len(stored):
+    return merged
+  kept = ~pd.MultiIndex.from_frame(stored[KEY_COLUMNS]).isin(pd.MultiIndex.from_frame(merged[KEY_COLUMNS]))
+  return pd.concat([stored[kept], merged], ignore_index=True)
+
+
+def split(frame, bounds):
+  bounds = [0, *bounds, len(frame)]
+  return [frame.iloc[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def test_small_buckets_are_exact():
+  frame = pd.DataFrame({
+    "station_id": ["s1"] * 5, "signal": ["a"] * 5, "time": [0.1, 0.2, 0.3, 1.5, 1.6], "value": [3.0, 1.0, 2.0, 10.0, np.nan],
+  })
+
+  rollups = by_key(rollup_samples(frame, "1s"))
+
+  first = rollups.loc[("s1", "a", 0)]
+  assert (first["count"], first["mean"], first["m2"], first["min"], first["max"]) == (3, 2.0, 2.0, 1.0, 3.0)
+  assert list(first["centroids"]) == [1.0, 2.0, 3.0] and list(first["weights"]) == [1, 1, 1]
+  assert first["quantiles"][int(np.flatnonzero(QUANTILES == 0.5)[0])] == 2.0
+  assert rollups.loc[("s1", "a", 1), "count"] == 1  # the NaN sample is dropped
+
+
+def test_merged_moments_match_a_direct_rollup():
+  frame = samples(20_000)
+  batches = [frame.iloc[i::7] for i in range(7)]
+
+  merged = by_key(merge_rollups(pd.concat([rollup_samples(b, "1m") for b in batches], ignore_index=True), "1h"))
+  direct = by_key(rollup_samples(frame, "1h"))
+
+  assert merged.index.equals(direct.index)
+  np.testing.assert_array_equal(merged["count"].astype(np.int64), direct["count"].astype(np.int64))
+  for column in ("mean", "m2", "min", "max"):
+    np.testing.assert_allclose(merged[column].astype(float), direct[column].astype(float), rtol=1e-9)
+
+
+def test_merged_sketch_quantiles_stay_within_the_rank_error_bound():
+  frame = samples(60_000, stations=("s1",), duration=3600.0, seed=1)
+  stored = pd.DataFrame()
+  for batch_id, batch in enumerate(split(frame.sample(frac=1.0, random_state=2), [10, 500, 4_000, 20_000])):
+    stored = upsert(stored, combine_rollups(stored, merge_rollups(rollup_samples(batch, "1m"), "1h"), "1h", batch_id))
+
+  (row,) = stored.to_dict("records")
+  values = np.sort(frame["value"].to_numpy())
+  assert row["count"] == len(values) and len(row["centroids"]) < 2 * 100
+  assert (row["min"], row["max"]) == (values[0], values[-1])
+  ranks = np.searchsorted(values, row["quantiles"], side="right") / len(values)
+  errors = np.abs(ranks - QUANTILES)
+  assert np.all(errors <= rank_error_bound(QUANTILES, len(values)))
+
+
+def test_replayed_batch_is_not_merged_twice():
+  frame = samples(2_000, seed=3)
+  first, second = frame.iloc[:1_000], frame.iloc[1_000:]
+  stored = combine_rollups(pd.DataFrame(), rollup_samples(first, "1m", batch_id=1), "1m", batch_id=1)
+  stored = upsert(stored, combine_rollups(stored, rollup_samples(second, "1m", batch_id=2), "1m", batch_id=2))
+
+  replayed = combine_rollups(stored, rollup_samples(second, "1m", batch_id=2), "1m", batch_id=2)
+
+  assert replayed.empty
+  assert by_key(stored)["count"].sum() == len(frame)
+
+
+def test_batches_of_a_new_run_are_merged_even_when_their_ids_start_again():
+  frame = samples(2_000, seed=7)
+  first, second = frame.iloc[:1_000], frame.iloc[1_000:]
+  stored = combine_rollups(pd.DataFrame(), rollup_samples(first, "1h", batch_id=5, run_id="a"), "1h", batch_id=5, run_id="a")
+
+  # the stream restarted without its checkpoint: same buckets, batch ids from 0 again
+  merged = combine_rollups(stored, rollup_samples(second, "1h", batch_id=0, run_id="b"), "1h", batch_id=0, run_id="b")
+  stored = upsert(stored, merged)
+
+  assert by_key(stored)["count"].sum() == len(frame)
+  assert set(stored["run_id"]) == {"b"}
+  assert combine_rollups(stored, rollup_samples(second, "1h", batch_id=0, run_id="b"), "1h", batch_id=0, run_id="b").empty
+
+
+def test_rollup_levels_are_consistent_across_resolutions():
+  frame = samples(5_000, seed=4)
+
+  levels = rollup_levels(frame, batch_id=7)
+
+  for resolution, seconds in (("1s", 1), ("1m", 60), ("1h", 3600)):
+    rollups = by_key(levels[resolution])
+    expected = exact(frame, seconds)
+    np.testing.assert_array_equal(rollups["count"].astype(np.int64), expected.count().to_numpy())
+    np.testing.assert_allclose(rollups["mean"].astype(float), expected.mean().to_numpy(), rtol=1e-9)
+    assert set(levels[resolution]["batch_id"]) == {7}
+
+
+def test_parquet_rollups_fold_batches_and_ignore_replays(tmp_path):
+  frame = samples(6_000, duration=3 * 86400.0, seed=5)
+  store = ParquetRollups(str(tmp_path))
+  batches = split(frame, [2_000, 4_000])
+
+  for batch_id, batch in enumerate(batches):
+    store.update(batch, batch_id)
+  assert store.update(batches[-1], batch_id=2) == {"1s": 0, "1m": 0, "1h": 0}
+
+  for resolution, seconds in (("1m", 60), ("1h", 3600)):
+    stored = by_key(store.read(resolution))
+    expected = exact(frame, seconds)
+    np.testing.assert_array_equal(stored["count"].astype(np.int64), expected.count().to_numpy())
+    np.testing.assert_allclose(stored["max"].astype(float), expected.max().to_numpy())
+  assert sorted(set(store.read("1m")["period"])) == ["1970-01"]
+
+  restarted = samples(500, duration=3 * 86400.0, seed=8)
+  store.update(restarted, batch_id=0, run_id="restarted")
+  assert store.read("1h")["count"].sum() == len(frame) + len(restarted)
+  assert sorted(set(store.read("1s")["period"])) == ["1970-01-01", "1970-01-02", "1970-01-03"]
+
+
+def test_parquet_query_picks_the_resolution_and_summarizes(tmp_path):
+  frame = samples(3_000, duration=86400.0, seed=6)
+  store = ParquetRollups(str(tmp_path))
+  store.update(frame, batch_id=0)
+
+  day = store.query(0, 86400, stations=["s1"])
+  minutes = store.query(0, 3600, max_points=60)
+
+  assert set(day["resolution"]) == {"1h"} and set(day["station_id"]) == {"s1"}
+  assert day["count"].sum() == (frame["station_id"] == "s1").sum()
+  assert {"sd", "p50", "p95", "p99"} <= set(day.columns) and "centroids" not in day.columns
+  assert set(minutes["resolution"]) == {"1m"} and minutes["bucket_start"].max() < 3600
+
+
+def test_summarize_reads_percentiles_off_the_quantiles():
+  rollups = rollup_samples(pd.DataFrame({
+    "station_id": ["s"] * 101, "signal": ["a"] * 101, "time": np.zeros(101), "value": np.arange(101.0),
+  }), "1s")
+
+  (row,) = summarize(rollups).to_dict("records")
+
+  assert (row["p50"], row["p95"], row["p99"]) == (50.0, 95.0, 99.0)
+  assert row["sd"] == pytest.approx(np.std(np.arange(101.0), ddof=1))
+
+
+def test_choose_resolution():
+  assert choose_resolution(0, 1000) == "1s"
+  assert choose_resolution(0, 1001) == "1m"
+  assert choose_resolution(0, 60_000) == "1m"
+  assert choose_resolution(0, 86400) == "1h"
+  assert choose_resolution(0, 365 * 86400) == "1h"
+  start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+  assert choose_resolution(start, start + datetime.timedelta(days=2), max_points=48) == "1h"
@@ -0,0 +1,176 @@
+import pytest
+
+from digital_twin.emulator import DigitalTwinsEmulator, FakeDigitalTwinsClient
+from digital_twin.publisher import TwinPatchPublisher
+from digital_twin.twin_cache import TwinCache, apply_cached_patch
+from digital_twin.writer import ConcurrentTwinWriter, TokenBucket
+
+MIXER = "MixingStep-Line1-Munich"
+
+
+class Clock:
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+@pytest.fixture
+def client():
+  return FakeDigitalTwinsClient(DigitalTwinsEmulator.from_repo())
+
+
+@pytest.fixture
+def clock():
+  return Clock()
+
+
+def test_hits_within_ttl_do_not_call_adt(client, clock):
+  cache = TwinCache(client, ttl_seconds=10, clock=clock)
+
+  first = cache.get(MIXER)
+  clock.now = 9.9
+  second = cache.get(MIXER)
+
+  assert first is second and first["$dtId"] == MIXER
+  assert client.emulator.request_count == 1
+  assert (cache.stats.misses, cache.stats.hits) == (1, 1)
+
+
+def test_expired_unchanged_twin_is_revalidated_with_a_304(client, clock):
+  cache = TwinCache(client, ttl_seconds=10, clock=clock)
+  twin = cache.get(MIXER)
+
+  clock.now = 10
+  assert cache.get(MIXER) is twin
+  assert cache.stats.not_modified == 1 and cache.stats.refreshed == 0
+  clock.now = 15
+  assert cache.get(MIXER) is twin  # the 304 restarted the TTL
+  assert client.emulator.request_count == 2
+
+
+def test_expired_changed_twin_is_refreshed(client, clock):
+  cache = TwinCache(client, ttl_seconds=10, clock=clock)
+  cache.get(MIXER)
+  client.update_digital_twin(MIXER, [{"op": "replace", "path": "/HealthPrediction", "value": "FAULT_PREDICTED"}])
+
+  assert cache.get(MIXER)["HealthPrediction"] == "OK"
+  clock.now = 10
+  assert cache.get(MIXER)["HealthPrediction"] == "FAULT_PREDICTED"
+  assert cache.stats.refreshed == 1
+
+
+def test_deleted_and_missing_twins(client, clock):
+  cache = TwinCache(client, ttl_seconds=10, clock=clock)
+
+  assert cache.get("NoSuchTwin") is None
+  assert cache.get("NoSuchTwin", default={}) == {}
+  with pytest.raises(KeyError):
+    cache["NoSuchTwin"]
+
+  cache.get(MIXER)
+  del client.emulator.twins[MIXER]
+  clock.now = 10
+  assert cache.get(MIXER) is None
+  assert MIXER not in cache
+
+
+def test_least_recently_used_twin_is_evicted(client, clock):
+  cache = TwinCache(client, max_twins=2, clock=clock)
+  a, b, c = "MunichSite", "ProductionLine1-Munich", MIXER
+
+  cache.get(a)
+  cache.get(b)
+  cache.get(a)  # b is now the least recently used
+  cache.get(c)
+
+  assert a in cache and c in cache and b not in cache
+  assert len(cache) == 2 and cache.stats.evictions == 1
+
+
+def test_prefetch_fetches_only_missing_or_expired_twins(client, clock):
+  cache = TwinCache(client, ttl_seconds=10, max_workers=4, clock=clock)
+  twin_ids = list(client.emulator.twins)[:6]
+  cache.get(twin_ids[0])
+
+  assert cache.prefetch(twin_ids + twin_ids[:2]) == 5
+  assert all(twin_id in cache for twin_id in twin_ids)
+  assert cache.prefetch(twin_ids) == 0
+  clock.now = 10
+  assert cache.prefetch(twin_ids[:3]) == 3
+  assert cache.stats.not_modified == 3
+
+
+def test_warm_loads_one_query_up_to_max_twins(client, clock):
+  cache = TwinCache(client, max_twins=5, clock=clock)
+
+  assert cache.warm() == 5
+  assert len(cache) == 5 and cache.stats.warmed == 5
+  assert client.emulator.request_count == 1
+
+
+def test_apply_patch_updates_only_cached_twins(client, clock):
+  cache = TwinCache(client, clock=clock)
+  cache.get(MIXER)
+
+  cache.apply_patch(MIXER, [
+    {"op": "replace", "path": "/HealthPrediction", "value": "FAULT_PREDICTED"},
+    {"op": "add", "path": "/InnerRing/faultSeverity", "value": 7},
+    {"op": "remove", "path": "/VibrationFrequencyPeak"},
+  ])
+  cache.apply_patch("MunichSite", [{"op": "add", "path": "/FaultPredicted", "value": True}])
+
+  twin = cache.get(MIXER)
+  assert twin["HealthPrediction"] == "FAULT_PREDICTED" and twin["InnerRing"]["faultSeverity"] == 7
+  assert "VibrationFrequencyPeak" not in twin
+  assert "MunichSite" not in cache
+
+
+def test_apply_cached_patch_creates_missing_components():
+  assert apply_cached_patch({}, [{"op": "add", "path": "/OuterRing/faultPredicted", "value": True}]) == {
+    "OuterRing": {"faultPredicted": True},
+  }
+
+
+def test_invalidate(client, clock):
+  cache = TwinCache(client, clock=clock)
+  cache.warm()
+
+  cache.invalidate(MIXER)
+  assert MIXER not in cache and len(cache) == len(client.emulator.twins) - 1
+  cache.invalidate()
+  assert len(cache) == 0
+
+
+def test_reads_through_a_writer_share_its_retries(clock):
+  def sleep(seconds):
+    clock.now += seconds
+
+  emulator = DigitalTwinsEmulator.from_repo()
+  emulator.bucket = TokenBucket(1, clock=clock)  # one request per second of the fake clock
+  writer = ConcurrentTwinWriter(FakeDigitalTwinsClient(emulator), rate_per_second=1e9, sleep=sleep)
+  cache = TwinCache(writer, ttl_seconds=1e9, max_workers=1, clock=clock)
+
+  assert [cache.get(twin_id)["$dtId"] for twin_id in ("MunichSite", MIXER)] == ["MunichSite", MIXER]
+  assert emulator.throttled_count == writer.retries > 0
+
+
+def test_publisher_diffs_against_the_cache_and_sees_changes_made_by_others(client, clock):
+  cache = TwinCache(client, ttl_seconds=60, max_workers=1, clock=clock)
+  publisher = TwinPatchPublisher(client, baseline=cache)
+  fault = [{"station_id": MIXER, "prediction": "FAULT", "fileName": "0"}]
+
+  assert publisher.publish(fault).patches_sent == 1
+  assert publisher.published == {}
+  assert cache.get(MIXER)["HealthPrediction"] == "FAULT_PREDICTED"  # the sent patch was applied to the cache
+  assert publisher.publish(fault).noops_skipped == 1
+
+  client.update_digital_twin(MIXER, [{"op": "replace", "path": "/HealthPrediction", "value": "OK"}])
+  assert publisher.publish(fault).noops_skipped == 1  # still within the TTL
+  clock.now = 61
+  stats = publisher.publish(fault)
+
+  assert stats.patches_sent == 1
+  assert publisher.last_sent[MIXER] == [{"op": "replace", "path": "/HealthPrediction", "value": "FAULT_PREDICTED"}]
+  assert client.emulator.twins[MIXER]["HealthPrediction"] == "FAULT_PREDICTED"
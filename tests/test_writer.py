@@ -0,0 +1,175 @@
+import threading
+
+import pytest
+
+from digital_twin.emulator import EmulatorHttpError
+from digital_twin.writer import ConcurrentTwinWriter, TokenBucket, retry_after_seconds
+
+
+class FakeClock:
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.now += seconds
+
+
+class FlakyClient:
+  """Fails the first `failures` updates of each twin with `error`, then records the patches it applies."""
+
+  def __init__(self, failures=0, error=None):
+    self.failures = failures
+    self.error = error
+    self.calls = {}
+    self.applied = {}
+    self._lock = threading.Lock()
+
+  def update_digital_twin(self, twin_id, patch):
+    with self._lock:
+      self.calls[twin_id] = self.calls.get(twin_id, 0) + 1
+      if self.calls[twin_id] <= self.failures:
+        raise self.error
+      self.applied.setdefault(twin_id, []).append(patch)
+
+
+def throttled(headers=None, status_code=429):
+  return EmulatorHttpError(status_code, "Too many requests", headers=headers)
+
+
+# --- retry_after_seconds ----------------------------------------------------------------------
+
+
+def test_retry_after_reads_seconds():
+  assert retry_after_seconds(throttled({"Retry-After": "2.5"})) == 2.5
+
+
+def test_retry_after_prefers_milliseconds_headers():
+  assert retry_after_seconds(throttled({"retry-after-ms": "250", "Retry-After": "9"})) == pytest.approx(0.25)
+  assert retry_after_seconds(throttled({"x-ms-retry-after-ms": "40"})) == pytest.approx(0.04)
+
+
+def test_retry_after_accepts_lowercase_and_ignores_dates():
+  assert retry_after_seconds(throttled({"retry-after": "3"})) == 3.0
+  assert retry_after_seconds(throttled({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) is None
+  assert retry_after_seconds(throttled()) is None
+  assert retry_after_seconds(ValueError("no response")) is None
+
+
+# --- ConcurrentTwinWriter ---------------------------------------------------------------------
+
+
+def test_throttled_update_waits_retry_after_then_succeeds():
+  delays = []
+  client = FlakyClient(failures=2, error=throttled({"Retry-After": "1.5"}))
+  writer = ConcurrentTwinWriter(client, max_retries=3, backoff_base=0.2, sleep=delays.append)
+
+  writer.update("MixingStep-Line1-Plant00001", [{"op": "add", "path": "/HealthPrediction", "value": "OK"}])
+
+  assert client.calls["MixingStep-Line1-Plant00001"] == 3
+  assert writer.retries == 2
+  # the server's delay plus at most the jittered exponential backoff of each attempt
+  assert 1.5 <= delays[0] <= 1.5 + 0.2
+  assert 1.5 <= delays[1] <= 1.5 + 0.4
+
+
+def test_backoff_without_retry_after_is_bounded_exponential():
+  delays = []
+  client = FlakyClient(failures=4, error=throttled(status_code=503))
+  writer = ConcurrentTwinWriter(client, max_retries=4, backoff_base=0.1, backoff_max=0.3, sleep=delays.append)
+
+  writer.update("t", [])
+
+  assert writer.retries == 4
+  for attempt, delay in enumerate(delays):
+    step = min(0.3, 0.1 * 2 ** attempt)
+    assert step <= delay <= 2 * step
+
+
+def test_gives_up_after_max_retries():
+  delays = []
+  error = throttled({"Retry-After": "0"})
+  client = FlakyClient(failures=10, error=error)
+  writer = ConcurrentTwinWriter(client, max_retries=2, sleep=delays.append)
+
+  with pytest.raises(EmulatorHttpError) as raised:
+    writer.update("t", [])
+
+  assert raised.value is error
+  assert client.calls["t"] == 3
+  assert len(delays) == 2
+
+
+def test_other_errors_are_not_retried():
+  delays = []
+  client = FlakyClient(failures=1, error=EmulatorHttpError(400, "Bad patch"))
+  writer = ConcurrentTwinWriter(client, sleep=delays.append)
+
+  with pytest.raises(EmulatorHttpError):
+    writer.update("t", [])
+
+  assert client.calls["t"] == 1
+  assert writer.retries == 0 and not delays
+
+
+def test_write_many_keeps_per_twin_order_and_isolates_failures():
+  class Client(FlakyClient):
+    def update_digital_twin(self, twin_id, patch):
+      if twin_id == "broken":
+        raise EmulatorHttpError(404, "Twin 'broken' not found")
+      super().update_digital_twin(twin_id, patch)
+
+  client = Client()
+  writer = ConcurrentTwinWriter(client, max_workers=4, sleep=lambda seconds: None)
+  updates = [(f"twin{i % 5}", [{"op": "add", "path": "/n", "value": i}]) for i in range(50)]
+
+  results = writer.write_many(updates + [("broken", []), ("broken", [])])
+
+  assert isinstance(results.pop("broken"), EmulatorHttpError)
+  assert results == {f"twin{k}": None for k in range(5)}
+  for k in range(5):
+    assert [patch[0]["value"] for patch in client.applied[f"twin{k}"]] == list(range(k, 50, 5))
+
+
+def test_writer_recovers_from_emulator_throttling():
+  from digital_twin.emulator import DigitalTwinsEmulator, FakeDigitalTwinsClient
+
+  clock = FakeClock()
+  emulator = DigitalTwinsEmulator.from_repo(max_requests_per_second=5)
+  emulator.bucket = TokenBucket(5, clock=clock)
+  writer = ConcurrentTwinWriter(FakeDigitalTwinsClient(emulator), max_workers=1, rate_per_second=1e9, sleep=clock.sleep)
+
+  twin_id = next(iter(emulator.twins))
+  for value in range(20):
+    writer.update(twin_id, [{"op": "add", "path": "/HealthPrediction", "value": str(value)}])
+
+  assert emulator.twins[twin_id]["HealthPrediction"] == "19"
+  assert emulator.throttled_count == writer.retries > 0
+  assert clock.now >= (20 - 5) / 5  # the burst, then one write per Retry-After
+
+
+# --- TokenBucket ------------------------------------------------------------------------------
+
+
+def test_token_bucket_bursts_then_refills_at_rate():
+  clock = FakeClock()
+  bucket = TokenBucket(10, capacity=3, clock=clock, sleep=clock.sleep)
+
+  assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+  assert bucket.try_acquire() == pytest.approx(0.1)
+  clock.now += 0.25
+  assert bucket.try_acquire() == 0.0
+  assert bucket.try_acquire() == 0.0
+  assert bucket.try_acquire() == pytest.approx(0.05)
+
+
+def test_token_bucket_acquire_sleeps_until_available():
+  clock = FakeClock()
+  bucket = TokenBucket(4, capacity=1, clock=clock, sleep=clock.sleep)
+
+  for _ in range(5):
+    bucket.acquire()
+
+  assert clock.now == pytest.approx(1.0)